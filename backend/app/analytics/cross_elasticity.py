@@ -0,0 +1,268 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Число ячеек (продукты x продукты или даты x пары), обрабатываемых за раз при
+# отборе кандидатов и расчете сумм по парам; ограничивает пиковую память
+CHUNK_CELLS = 1000000
+
+def calculate_cross_elasticity(df, params=None):
+    """
+    Расчет перекрестной ценовой эластичности между продуктами.
+    
+    Для пары (i, j) оценивается регрессия log(q_i) = a + b_i * log(p_i) + b_ij * log(p_j)
+    по датам, в которые продавались оба продукта. Кандидаты в пары ограничены
+    одной категорией и max_pairs_per_product продуктами с наибольшим числом
+    совместных продаж, и регрессия считается только для них, поэтому память и
+    число оцениваемых пар растут линейно с числом продуктов.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        params (dict): Параметры анализа
+    
+    Returns:
+        dict: Результаты анализа перекрестной эластичности
+    """
+    if params is None:
+        params = {}
+    
+    # Определение колонок из параметров или по умолчанию
+    price_col = params.get('price_column', 'price')
+    quantity_col = params.get('quantity_column', 'quantity')
+    product_col = params.get('product_column', 'product')
+    date_col = params.get('date_column', 'date')
+    category_col = params.get('category_column', 'category')
+    min_observations = int(params.get('min_observations', 10))
+    max_pairs_per_product = int(params.get('max_pairs_per_product', 50))
+    
+    # Проверка наличия необходимых колонок
+    required_cols = [price_col, quantity_col, product_col, date_col]
+    missing_cols = [col for col in required_cols if col not in df.columns]
+    
+    if missing_cols:
+        raise ValueError(f"В данных отсутствуют обязательные колонки: {', '.join(missing_cols)}")
+    
+    panel, products, categories = build_price_panel(df, price_col, quantity_col, product_col, date_col, category_col)
+    
+    # Пары считаются независимо внутри каждой категории
+    blocks = []
+    for category_products in pd.Series(np.arange(len(products))).groupby(categories).groups.values():
+        block = estimate_block_cross_elasticity(
+            panel, np.asarray(category_products), min_observations, max_pairs_per_product
+        )
+        if block is not None:
+            blocks.append(block)
+    
+    if blocks:
+        rows, cols, values, observations = (np.concatenate(parts) for parts in zip(*blocks))
+    else:
+        rows = cols = observations = np.array([], dtype=np.int64)
+        values = np.array([])
+    
+    # Кандидаты уже отобраны по числу совместных продаж; среди оцененных пар
+    # каждого продукта оставляем пары с наибольшим числом наблюдений
+    if max_pairs_per_product > 0 and len(rows):
+        order = np.lexsort((-observations, rows))
+        rows, cols, values, observations = rows[order], cols[order], values[order], observations[order]
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+        keep = rank < max_pairs_per_product
+        rows, cols, values, observations = rows[keep], cols[keep], values[keep], observations[keep]
+    
+    # Положительная перекрестная эластичность - товары-заменители, отрицательная - дополняющие
+    return {
+        'cross_elasticity': {
+            'products': products.tolist(),
+            'shape': [len(products), len(products)],
+            'rows': rows.tolist(),
+            'cols': cols.tolist(),
+            'values': values.tolist(),
+            'observations': observations.tolist()
+        },
+        'pairs_count': int(len(rows)),
+        'substitute_pairs': int((values > 0).sum()),
+        'complement_pairs': int((values < 0).sum())
+    }
+
+def build_price_panel(df, price_col, quantity_col, product_col, date_col, category_col):
+    """
+    Построение разреженной панели даты x продукты с логарифмами цены и количества.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+        product_col (str): Название колонки с продуктом
+        date_col (str): Название колонки с датой
+        category_col (str): Название колонки с категорией (может отсутствовать)
+    
+    Returns:
+        tuple: (словарь разреженных матриц, продукты, категория каждого продукта)
+    """
+    product_codes, products = pd.factorize(df[product_col], sort=True)
+    date_codes, dates = pd.factorize(pd.to_datetime(df[date_col], errors='coerce'), sort=True)
+    
+    # Без колонки категорий все продукты считаются одной категорией
+    if category_col in df.columns:
+        categories = pd.Series(df[category_col].to_numpy()).groupby(product_codes).first()
+        categories = categories.reindex(np.arange(len(products))).fillna('').to_numpy()
+    else:
+        categories = np.zeros(len(products), dtype=np.intp)
+    
+    # Агрегация до уровня (дата, продукт): средняя цена и суммарное количество
+    mask = (product_codes >= 0) & (date_codes >= 0)
+    daily = pd.DataFrame({
+        'date': date_codes[mask],
+        'product': product_codes[mask],
+        'price': df[price_col].to_numpy(dtype=float)[mask],
+        'quantity': df[quantity_col].to_numpy(dtype=float)[mask]
+    }).groupby(['date', 'product'], sort=False).agg(price=('price', 'mean'), quantity=('quantity', 'sum')).reset_index()
+    
+    # Дни с нулевыми продажами не участвуют в логарифмической модели
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_price = np.log(daily['price'].to_numpy())
+        log_quantity = np.log(daily['quantity'].to_numpy())
+    
+    valid = np.isfinite(log_price) & np.isfinite(log_quantity)
+    row, col = daily['date'].to_numpy()[valid], daily['product'].to_numpy()[valid]
+    shape = (len(dates), len(products))
+    
+    def to_matrix(values):
+        return sparse.csc_matrix((values, (row, col)), shape=shape)
+    
+    x, y = log_price[valid], log_quantity[valid]
+    panel = {
+        'indicator': to_matrix(np.ones(len(x))),
+        'x': to_matrix(x),
+        'y': to_matrix(y),
+        'xx': to_matrix(x * x),
+        'xy': to_matrix(x * y)
+    }
+    
+    return panel, products, categories
+
+def estimate_block_cross_elasticity(panel, block_products, min_observations=10, max_pairs_per_product=0):
+    """
+    Оценка перекрестной эластичности для пар-кандидатов одной категории.
+    
+    Сначала для каждого продукта отбираются кандидаты (см. candidate_pairs),
+    затем суммы по совместным датам считаются только для них, частями по
+    CHUNK_CELLS ячеек, и регрессия с двумя регрессорами решается в замкнутом
+    виде сразу для всех пар.
+    
+    Args:
+        panel (dict): Разреженная панель (см. build_price_panel)
+        block_products (numpy.ndarray): Индексы продуктов категории
+        min_observations (int): Минимум совместных дат для оценки пары
+        max_pairs_per_product (int): Число кандидатов на продукт (0 - без ограничения)
+    
+    Returns:
+        tuple: (строки, колонки, эластичности, число наблюдений) или None
+    """
+    if len(block_products) < 2:
+        return None
+    
+    columns = {name: matrix[:, block_products].tocsc() for name, matrix in panel.items()}
+    i, j, n = candidate_pairs(columns['indicator'], min_observations, max_pairs_per_product)
+    
+    if not len(i):
+        return None
+    
+    # Суммы по совместным датам: x1 - своя цена, x2 - цена другого продукта
+    sums = {name: np.empty(len(i)) for name in ('s1', 's2', 'sy', 's11', 's22', 's12', 's1y', 's2y')}
+    chunk = max(CHUNK_CELLS // max(columns['indicator'].shape[0], 1), 1)
+    for start in range(0, len(i), chunk):
+        own, other = i[start:start + chunk], j[start:start + chunk]
+        # Индикатор совместных дат пар части: даты x пары
+        both = columns['indicator'][:, own].multiply(columns['indicator'][:, other]).tocsc()
+        
+        def joint(name, index):
+            return both.multiply(columns[name][:, index])
+        
+        def column_sums(matrix):
+            return np.asarray(matrix.sum(axis=0)).ravel()
+        
+        x1, x2, y = joint('x', own), joint('x', other), joint('y', own)
+        part = slice(start, start + len(own))
+        sums['s1'][part] = column_sums(x1)
+        sums['s2'][part] = column_sums(x2)
+        sums['sy'][part] = column_sums(y)
+        sums['s11'][part] = column_sums(joint('xx', own))
+        sums['s22'][part] = column_sums(joint('xx', other))
+        sums['s12'][part] = column_sums(x1.multiply(x2))
+        sums['s1y'][part] = column_sums(joint('xy', own))
+        sums['s2y'][part] = column_sums(y.multiply(x2))
+    
+    s1, s2, sy, s11, s22, s12, s1y, s2y = (sums[name] for name in
+                                           ('s1', 's2', 'sy', 's11', 's22', 's12', 's1y', 's2y'))
+    
+    # Центрированные суммы
+    c11 = s11 - s1 * s1 / n
+    c22 = s22 - s2 * s2 / n
+    c12 = s12 - s1 * s2 / n
+    c1y = s1y - s1 * sy / n
+    c2y = s2y - s2 * sy / n
+    
+    # Без вариации своей цены остается простая регрессия на цену другого продукта
+    has_own_variation = c11 > 1e-12 * np.abs(s11)
+    determinant = c11 * c22 - c12 * c12
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(has_own_variation, (c11 * c2y - c12 * c1y) / determinant, c2y / c22)
+    
+    is_estimable = np.isfinite(values) & (c22 > 1e-12 * np.abs(s22))
+    is_estimable &= ~has_own_variation | (determinant > 1e-12 * np.abs(s11 * s22))
+    
+    return (
+        block_products[i[is_estimable]], block_products[j[is_estimable]],
+        values[is_estimable], n[is_estimable].astype(np.int64)
+    )
+
+def candidate_pairs(indicator, min_observations=10, max_pairs_per_product=0):
+    """
+    Отбор пар-кандидатов по числу совместных дат продаж.
+    
+    Число совместных дат считается матричным произведением индикаторов частями
+    по продуктам (не более CHUNK_CELLS ячеек за раз), и для каждого продукта
+    сразу остаются max_pairs_per_product других продуктов с наибольшим числом
+    совместных дат (при равенстве - с меньшим индексом), не меньшим
+    min_observations. Полная матрица продукты x продукты не хранится.
+    
+    Args:
+        indicator (scipy.sparse.csc_matrix): Индикатор продаж даты x продукты
+        min_observations (int): Минимум совместных дат для пары
+        max_pairs_per_product (int): Число кандидатов на продукт (0 - без ограничения)
+    
+    Returns:
+        tuple: (свои продукты, другие продукты, число совместных дат)
+    """
+    n_products = indicator.shape[1]
+    # Плотный индикатор даты x продукты: произведение частей считается через BLAS
+    sold = indicator.toarray().astype(np.float32)
+    chunk = max(CHUNK_CELLS // n_products, 1)
+    limit = max_pairs_per_product if 0 < max_pairs_per_product < n_products - 1 else 0
+    
+    rows, cols, counts = [], [], []
+    for start in range(0, n_products, chunk):
+        own = np.arange(start, min(start + chunk, n_products))
+        # Совместные даты продуктов части со всеми продуктами (целые числа, точные во float32)
+        joint = (sold[:, own].T @ sold).astype(np.float64)
+        joint[np.arange(len(own)), own] = 0
+        joint[joint < min_observations] = 0
+        
+        if limit:
+            # Ключ упорядочивает по числу дат, при равенстве - по меньшему индексу продукта
+            key = joint * n_products + (n_products - 1 - np.arange(n_products))
+            top = np.argpartition(-key, limit - 1, axis=1)[:, :limit]
+            local, position = np.nonzero(np.take_along_axis(joint, top, axis=1) > 0)
+            other = top[local, position]
+        else:
+            local, other = np.nonzero(joint > 0)
+        
+        rows.append(own[local])
+        cols.append(other)
+        counts.append(joint[local, other])
+    
+    order = np.lexsort((np.concatenate(cols), np.concatenate(rows)))
+    return (np.concatenate(rows)[order], np.concatenate(cols)[order],
+            np.concatenate(counts)[order].astype(np.float64))
@@ -1,18 +1,183 @@
+import math
+import warnings
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
 
-def calculate_elasticity(df, params=None):
+from app.analytics.regression import (
+    STAT_AGGREGATIONS, STAT_COLUMNS, grouped_sufficient_stats, has_variation, has_sum_variation,
+    ols_from_stats, poisson_irls, rolling_window_stats
+)
+
+# Ключ строки в таблице достаточных статистик эластичности
+STATS_KEY = ['product', 'period_type', 'period']
+
+# Типы периодов и соответствующие частоты pandas
+PERIOD_FREQUENCIES = {'month': 'M', 'week': 'W'}
+
+# Модели спроса: 'ols' - логарифмическая регрессия, 'poisson' - пуассоновская
+# регрессия с логарифмической связью, допускающая дни с нулевыми продажами
+ELASTICITY_MODELS = ('ols', 'poisson')
+
+# Максимум ячеек интервалы x продукты, обрабатываемых скользящими окнами за раз
+MAX_ROLLING_CELLS = 2000000
+
+def calculate_elasticity(df, params=None, stored_stats=None):
     """
     Расчет ценовой эластичности спроса.
     
     Args:
         df (pandas.DataFrame): Датафрейм с данными о продажах
         params (dict): Параметры анализа
+        stored_stats (pandas.DataFrame, optional): Ранее накопленные статистики,
+            с которыми объединяются статистики новых строк df
+    
+    Returns:
+        dict: Результаты анализа эластичности
+    """
+    if params is None:
+        params = {}
+    
+    date_col = params.get('date_column', 'date')
+    model = params.get('model', 'ols')
+    
+    if model not in ELASTICITY_MODELS:
+        raise ValueError(f"Неизвестная модель эластичности: {model}")
+    
+    if stored_stats is not None:
+        if model != 'ols':
+            raise ValueError("Накопленные статистики поддерживаются только для модели ols")
+        stats = merge_elasticity_stats(stored_stats, aggregate_elasticity_stats(df, params))
+        return elasticity_from_stats(stats)
+    
+    # Анализ по времени имеет смысл только при нескольких датах
+    include_periods = date_col in df.columns and df[date_col].nunique() > 1
+    if model == 'poisson':
+        result = calculate_count_elasticity(df, params, include_periods=include_periods)
+    else:
+        result = elasticity_from_stats(aggregate_elasticity_stats(df, params), include_periods=include_periods)
+    
+    # Доверительные интервалы и скользящие окна требуют исходных строк,
+    # поэтому считаются только при полном расчете
+    if params.get('confidence_intervals'):
+        result['elasticity_intervals'] = calculate_elasticity_intervals(df, params)
+    
+    if params.get('rolling_window') and date_col in df.columns:
+        result['rolling_elasticity'] = calculate_rolling_elasticity(df, params)
+    
+    return result
+
+def calculate_elasticity_chunked(chunks, params=None):
+    """
+    Расчет ценовой эластичности по частям данных без загрузки всего файла.
+    
+    Результат (и ошибка для некорректных цен и количеств) совпадает с
+    calculate_elasticity по тем же строкам с точностью до порядка суммирования.
+    
+    Args:
+        chunks (iterable): Части данных (например, pandas.read_csv(..., chunksize=N))
+        params (dict): Параметры анализа
     
     Returns:
         dict: Результаты анализа эластичности
     """
+    stats, _, dates = aggregate_elasticity_stats_chunked(chunks, params)
+    return elasticity_from_stats(stats, include_periods=len(dates) > 1)
+
+def aggregate_elasticity_stats_chunked(chunks, params=None, max_pending_rows=250000):
+    """
+    Накопление статистик эластичности по частям данных.
+    
+    Пиковая память ограничена размером части и таблицей статистик:
+    статистики частей объединяются, как только их набирается max_pending_rows строк.
+    
+    Args:
+        chunks (iterable): Части данных (pandas.DataFrame)
+        params (dict): Параметры анализа
+        max_pending_rows (int): Максимум строк в необъединенных таблицах статистик
+    
+    Returns:
+        tuple: (таблица статистик, число обработанных строк, различные даты - не все,
+            а столько, чтобы понять, больше ли их одной)
+    """
+    if params is None:
+        params = {}
+    
+    date_col = params.get('date_column', 'date')
+    
+    pending = []
+    pending_rows = 0
+    row_count = 0
+    dates_seen = set()
+    
+    for chunk in chunks:
+        table = aggregate_elasticity_stats(chunk, params)
+        row_count += len(chunk)
+        
+        # Для анализа по времени достаточно знать, что дат больше одной
+        if len(dates_seen) < 2 and date_col in chunk.columns:
+            dates_seen.update(chunk[date_col].dropna().unique()[:2].tolist())
+        
+        pending.append(table)
+        pending_rows += len(table)
+        if pending_rows > max_pending_rows and len(pending) > 1:
+            pending = [merge_elasticity_stats(*pending)]
+            pending_rows = len(pending[0])
+    
+    if not pending:
+        stats = pd.DataFrame(columns=STATS_KEY + list(STAT_COLUMNS))
+    else:
+        stats = merge_elasticity_stats(*pending)
+    
+    return stats, row_count, list(dates_seen)
+
+def requires_raw_rows(params):
+    """
+    Проверка, нужны ли анализу исходные строки, а не только накопленные статистики.
+    
+    Args:
+        params (dict): Параметры анализа
+    
+    Returns:
+        bool: True, если инкрементальный расчет по статистикам невозможен
+    """
+    params = params or {}
+    return bool(
+        params.get('confidence_intervals') or params.get('rolling_window')
+        or params.get('model', 'ols') != 'ols'
+    )
+
+def aggregate_elasticity_stats(df, params=None):
+    """
+    Расчет достаточных статистик эластичности по продуктам и периодам.
+    
+    period_type 'all' соответствует всей истории, 'month' и 'week' - разбивке
+    по месяцам и неделям. Внутри каждого периода продукты отсортированы.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        params (dict): Параметры анализа
+    
+    Returns:
+        pandas.DataFrame: Таблица с колонками STATS_KEY и STAT_COLUMNS
+    """
+    tables = []
+    for keys, codes, prices, quantities in iter_elasticity_groups(df, params):
+        stats = log_log_stats(codes, prices, quantities, len(keys))
+        tables.append(pd.concat([keys, pd.DataFrame(stats, columns=STAT_COLUMNS)], axis=1))
+    
+    return pd.concat(tables, ignore_index=True)
+
+def iter_elasticity_groups(df, params=None):
+    """
+    Разбиение строк на группы (продукт, период) для всех типов периодов.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        params (dict): Параметры анализа
+    
+    Yields:
+        tuple: (ключи групп с колонками STATS_KEY, коды групп строк, цены, количества)
+    """
     if params is None:
         params = {}
     
@@ -29,6 +194,148 @@ def calculate_elasticity(df, params=None):
     if missing_cols:
         raise ValueError(f"В данных отсутствуют обязательные колонки: {', '.join(missing_cols)}")
     
+    # Без колонки с продуктами все строки относятся к одной группе
+    if product_col in df.columns:
+        product_codes, product_labels = pd.factorize(df[product_col], sort=True)
+    else:
+        product_codes, product_labels = np.zeros(len(df), dtype=np.intp), pd.Index([None], dtype=object)
+    
+    prices = df[price_col].to_numpy()
+    quantities = df[quantity_col].to_numpy()
+    
+    yield group_period_rows(
+        'all', np.zeros(len(df), dtype=np.intp), ['all'], product_codes, product_labels, prices, quantities
+    )
+    
+    if date_col in df.columns:
+        # Преобразование к datetime, если это строка
+        dates = df[date_col]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, errors='coerce')
+        
+        period_types = ['month', 'week'] if params.get('include_weekly') else ['month']
+        for period_type in period_types:
+            period_codes, period_labels = pd.factorize(dates.dt.to_period(PERIOD_FREQUENCIES[period_type]), sort=True)
+            yield group_period_rows(
+                period_type, period_codes, [str(period) for period in period_labels],
+                product_codes, product_labels, prices, quantities
+            )
+
+def group_period_rows(period_type, period_codes, period_labels, product_codes, product_labels, prices, quantities):
+    """
+    Составной ключ (период, продукт) для строк одного типа периодов.
+    
+    Args:
+        period_type (str): Тип периода (all, month, week)
+        period_codes (numpy.ndarray): Коды периодов для каждой строки
+        period_labels (list): Названия периодов
+        product_codes (numpy.ndarray): Коды продуктов для каждой строки
+        product_labels (pandas.Index): Названия продуктов
+        prices (numpy.ndarray): Цены
+        quantities (numpy.ndarray): Количества
+    
+    Returns:
+        tuple: (ключи групп с колонками STATS_KEY, коды групп строк, цены, количества)
+    """
+    n_products = len(product_labels)
+    
+    # Составной ключ период x продукт; группы - только встречающиеся пары
+    mask = (period_codes >= 0) & (product_codes >= 0)
+    composite = period_codes[mask].astype(np.int64) * n_products + product_codes[mask]
+    codes, cells = pd.factorize(composite, sort=True)
+    
+    keys = pd.DataFrame({
+        'product': np.asarray(product_labels, dtype=object)[cells % n_products],
+        'period_type': period_type,
+        'period': np.asarray(period_labels, dtype=object)[cells // n_products]
+    })
+    
+    return keys, codes, prices[mask], quantities[mask]
+
+def merge_elasticity_stats(*tables):
+    """
+    Объединение таблиц статистик эластичности (например, сохраненной и новой).
+    
+    Args:
+        *tables (pandas.DataFrame): Таблицы с колонками STATS_KEY и STAT_COLUMNS
+    
+    Returns:
+        pandas.DataFrame: Объединенная таблица, отсортированная по STATS_KEY
+    """
+    combined = pd.concat(tables, ignore_index=True)
+    merged = combined.groupby(STATS_KEY, sort=True, dropna=False).agg(STAT_AGGREGATIONS)
+    
+    # Сумма pandas пропускает NaN, а строка с пропущенной ценой или количеством
+    # должна делать статистики группы недействительными, как при полном расчете
+    additive = [column for column, how in STAT_AGGREGATIONS.items() if how == 'sum']
+    missing = combined[STATS_KEY].join(combined[additive].isna()).groupby(STATS_KEY, sort=True, dropna=False).any()
+    merged[additive] = merged[additive].mask(missing)
+    
+    return merged.reset_index()
+
+def elasticity_from_stats(stats, include_periods=True):
+    """
+    Формирование результатов анализа эластичности по таблице статистик.
+    
+    Args:
+        stats (pandas.DataFrame): Таблица статистик (см. aggregate_elasticity_stats)
+        include_periods (bool): Добавлять ли анализ по месяцам и неделям
+    
+    Returns:
+        dict: Результаты анализа эластичности
+    """
+    values = stats[list(STAT_COLUMNS)].to_numpy(dtype=float)
+    return build_elasticity_result(
+        stats, elasticities_from_stats(values), has_variation(values), include_periods=include_periods
+    )
+
+def calculate_count_elasticity(df, params=None, include_periods=True):
+    """
+    Расчет эластичности по пуассоновской модели спроса для всех групп одновременно.
+    
+    В отличие от логарифмической регрессии дни с нулевыми продажами
+    остаются в оценке, что убирает смещение для редко продаваемых товаров.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        params (dict): Параметры анализа
+        include_periods (bool): Добавлять ли анализ по месяцам и неделям
+    
+    Returns:
+        dict: Результаты анализа эластичности
+    """
+    keys, elasticities, valid = [], [], []
+    for group_keys, codes, prices, quantities in iter_elasticity_groups(df, params):
+        group_elasticities, group_valid = count_elasticities(codes, prices, quantities, len(group_keys))
+        keys.append(group_keys)
+        elasticities.append(group_elasticities)
+        valid.append(group_valid)
+    
+    result = build_elasticity_result(
+        pd.concat(keys, ignore_index=True), np.concatenate(elasticities), np.concatenate(valid),
+        include_periods=include_periods
+    )
+    result['model'] = 'poisson'
+    
+    return result
+
+def build_elasticity_result(keys, elasticities, valid, include_periods=True):
+    """
+    Формирование результатов анализа эластичности по рассчитанным группам.
+    
+    Args:
+        keys (pandas.DataFrame): Ключи групп с колонками STATS_KEY
+        elasticities (numpy.ndarray): Эластичность каждой группы
+        valid (numpy.ndarray): Признак групп, для которых эластичность рассчитана
+        include_periods (bool): Добавлять ли анализ по месяцам и неделям
+    
+    Returns:
+        dict: Результаты анализа эластичности
+    """
+    period_types = keys['period_type'].to_numpy()
+    overall = period_types == 'all'
+    has_products = keys['product'].notna().any()
+    
     # Инициализация результатов
     result = {
         'elasticity_by_product': {},
@@ -39,10 +346,9 @@ def calculate_elasticity(df, params=None):
     }
     
     # Если есть колонка с продуктами, группируем по ней
-    if product_col in df.columns:
-        # Расчет эластичности для каждого продукта
-        for product, group in df.groupby(product_col):
-            elasticity = calculate_product_elasticity(group, price_col, quantity_col)
+    if has_products:
+        products = keys['product'].to_numpy()[overall]
+        for product, elasticity in zip(products.tolist(), elasticities[overall].tolist()):
             result['elasticity_by_product'][product] = elasticity
             
             # Классификация по эластичности
@@ -66,40 +372,247 @@ def calculate_elasticity(df, params=None):
                 'medium_elasticity': [p for p, e in result['elasticity_by_product'].items() if low_threshold < e <= high_threshold],
                 'high_elasticity': [p for p, e in result['elasticity_by_product'].items() if e > high_threshold]
             }
-    else:
+    elif overall.any():
         # Если нет колонки с продуктами, рассчитываем общую эластичность
-        elasticity = calculate_product_elasticity(df, price_col, quantity_col)
-        result['average_elasticity'] = elasticity
+        result['average_elasticity'] = float(elasticities[overall][0])
     
     # Если есть временная колонка, добавляем анализ по времени
-    if date_col in df.columns and df[date_col].nunique() > 1:
-        # Преобразование к datetime, если это строка
-        if df[date_col].dtype == 'object':
-            df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
+    if include_periods and (period_types == 'month').any():
+        result['elasticity_grid'] = {}
         
-        # Группировка по месяцам и расчет эластичности
-        df['month'] = df[date_col].dt.to_period('M')
-        result['elasticity_by_month'] = {}
+        for period_type in PERIOD_FREQUENCIES:
+            rows = period_types == period_type
+            if not rows.any():
+                continue
+            
+            by_period, grid = build_period_results(
+                keys['period'].to_numpy()[rows], keys['product'].to_numpy()[rows],
+                elasticities[rows], valid[rows], has_products
+            )
+            result[f'elasticity_by_{period_type}'] = by_period
+            result['elasticity_grid'][period_type] = grid
+    
+    return result
+
+def calculate_rolling_elasticity(df, params=None):
+    """
+    Расчет эластичности в скользящих окнах для всех продуктов одновременно.
+    
+    Статистики считаются по интервалам длиной НОД(окно, шаг) дней, после чего
+    каждое окно получается разностью накопленных сумм за O(1).
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        params (dict): Параметры анализа (rolling_window и rolling_step в днях)
+    
+    Returns:
+        dict: Даты окончания окон, продукты и сетка эластичностей окна x продукты
+    """
+    if params is None:
+        params = {}
+    
+    price_col = params.get('price_column', 'price')
+    quantity_col = params.get('quantity_column', 'quantity')
+    product_col = params.get('product_column', 'product')
+    date_col = params.get('date_column', 'date')
+    window_days = int(params.get('rolling_window', 90))
+    step_days = int(params.get('rolling_step', 30))
+    
+    if window_days <= 0 or step_days <= 0:
+        raise ValueError("Длина окна и шаг должны быть положительными")
+    
+    dates = pd.to_datetime(df[date_col], errors='coerce')
+    if product_col in df.columns:
+        product_codes, products = pd.factorize(df[product_col], sort=True)
+    else:
+        product_codes, products = np.zeros(len(df), dtype=np.intp), pd.Index(['overall'])
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_price = np.log(df[price_col].to_numpy(dtype=float))
+        log_quantity = np.log(df[quantity_col].to_numpy(dtype=float))
+    
+    # Строки без даты или с неположительными значениями в окна не попадают
+    mask = dates.notna().to_numpy() & (product_codes >= 0) & np.isfinite(log_price) & np.isfinite(log_quantity)
+    
+    result = {
+        'window_days': window_days,
+        'step_days': step_days,
+        'window_ends': [],
+        'products': products.tolist(),
+        'values': []
+    }
+    
+    if not mask.any():
+        return result
+    
+    # Интервалы длиной НОД(окно, шаг): окна и шаги состоят из целого числа интервалов
+    interval_days = math.gcd(window_days, step_days)
+    window, step = window_days // interval_days, step_days // interval_days
+    
+    start_date = dates[mask].min()
+    days = (dates[mask] - start_date).dt.days.to_numpy()
+    intervals = days // interval_days
+    n_intervals = int(intervals.max()) + 1
+    
+    if n_intervals < window:
+        return result
+    
+    # Продукты обрабатываются пачками, чтобы ограничить размер массива интервалы x продукты
+    codes = product_codes[mask]
+    order = np.argsort(codes, kind='stable')
+    codes, intervals = codes[order], intervals[order]
+    x, y = log_price[mask][order], log_quantity[mask][order]
+    
+    n_products = len(products)
+    batch_size = max(1, MAX_ROLLING_CELLS // n_intervals)
+    ends = np.arange(window - 1, n_intervals, step)
+    values = np.full((len(ends), n_products), np.nan)
+    
+    for first in range(0, n_products, batch_size):
+        last = min(first + batch_size, n_products)
+        rows = slice(*np.searchsorted(codes, [first, last]))
+        batch = last - first
         
-        for month, group in df.groupby('month'):
-            if product_col in df.columns:
-                month_elasticities = {}
-                for product, product_group in group.groupby(product_col):
-                    if product_group[price_col].nunique() > 1:
-                        month_elasticities[product] = calculate_product_elasticity(product_group, price_col, quantity_col)
-                
-                if month_elasticities:
-                    result['elasticity_by_month'][str(month)] = {
-                        'elasticities': month_elasticities,
-                        'average': sum(month_elasticities.values()) / len(month_elasticities)
-                    }
-            else:
-                if group[price_col].nunique() > 1:
-                    result['elasticity_by_month'][str(month)] = calculate_product_elasticity(group, price_col, quantity_col)
+        stats = grouped_sufficient_stats(
+            intervals[rows] * batch + codes[rows] - first, x[rows], y[rows], n_intervals * batch
+        ).reshape(n_intervals, batch, -1)
+        
+        _, window_stats = rolling_window_stats(stats, window, step)
+        valid = has_sum_variation(window_stats)
+        slope, _ = ols_from_stats(window_stats, valid=valid)
+        values[:, first:last] = np.where(valid, slope, np.nan)
+    
+    window_ends = start_date + pd.to_timedelta((ends + 1) * interval_days - 1, unit='D')
+    result['window_ends'] = [date.strftime('%Y-%m-%d') for date in window_ends]
+    # None - в окне меньше двух различных цен
+    result['values'] = np.where(np.isnan(values), None, values).tolist()
     
     return result
 
-def calculate_product_elasticity(df, price_col, quantity_col):
+def calculate_elasticity_intervals(df, params=None):
+    """
+    Расчет бутстреп-интервалов эластичности для всех продуктов одновременно.
+    
+    Повторы оценивают ту же модель спроса, что и точечная оценка (параметр model).
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        params (dict): Параметры анализа (model, bootstrap_replicates, confidence_level)
+    
+    Returns:
+        dict: Уровень доверия, число повторов и интервалы по продуктам
+    """
+    if params is None:
+        params = {}
+    
+    price_col = params.get('price_column', 'price')
+    quantity_col = params.get('quantity_column', 'quantity')
+    product_col = params.get('product_column', 'product')
+    n_replicates = int(params.get('bootstrap_replicates', 200))
+    confidence_level = float(params.get('confidence_level', 0.95))
+    
+    if product_col in df.columns:
+        codes, products = pd.factorize(df[product_col], sort=True)
+    else:
+        codes, products = np.zeros(len(df), dtype=np.intp), pd.Index(['overall'])
+    
+    mask = codes >= 0
+    replicates = bootstrap_elasticities(
+        codes[mask], df[price_col].to_numpy()[mask], df[quantity_col].to_numpy()[mask],
+        len(products), n_replicates, params.get('random_state', 42), model=params.get('model', 'ols')
+    )
+    
+    # Перцентильные интервалы и стандартные ошибки по повторам
+    alpha = (1 - confidence_level) / 2
+    has_replicates = np.isfinite(replicates).sum(axis=0) > 1
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        lower, upper = np.nanpercentile(replicates, [100 * alpha, 100 * (1 - alpha)], axis=0)
+        standard_error = np.nanstd(replicates, axis=0, ddof=1)
+    
+    by_product = {}
+    for i, product in enumerate(products.tolist()):
+        # Интервал не рассчитывается для продуктов с одной ценой
+        if not has_replicates[i]:
+            continue
+        
+        by_product[product] = {
+            'lower': float(lower[i]),
+            'upper': float(upper[i]),
+            'standard_error': float(standard_error[i])
+        }
+    
+    return {
+        'confidence_level': confidence_level,
+        'replicates': n_replicates,
+        'by_product': by_product
+    }
+
+def bootstrap_elasticities(codes, prices, quantities, n_groups, n_replicates=200, random_state=42,
+                           max_batch_rows=5000000, model='ols'):
+    """
+    Пуассоновский бутстреп эластичности: все группы и пачка повторов за один проход.
+    
+    Каждый повтор - взвешенная регрессия с весами строк Poisson(1), поэтому
+    достаточные статистики всех повторов считаются одной сегментной редукцией.
+    Для пуассоновской модели спроса повторы пачки оцениваются одним вызовом
+    poisson_irls с теми же весами строк.
+    
+    Args:
+        codes (numpy.ndarray): Целочисленные коды групп
+        prices (numpy.ndarray): Цены
+        quantities (numpy.ndarray): Количества
+        n_groups (int): Количество групп
+        n_replicates (int): Количество бутстреп-повторов
+        random_state (int): Начальное значение генератора случайных чисел
+        max_batch_rows (int): Максимум строк (повторы x строки) в одной пачке
+        model (str): Модель спроса (см. ELASTICITY_MODELS)
+    
+    Returns:
+        numpy.ndarray: Эластичности формы (n_replicates, n_groups), NaN - повтор без вариации цены
+    """
+    rng = np.random.default_rng(random_state)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_price = np.log(np.asarray(prices, dtype=float))
+        # Пуассоновская модель описывает сами количества, логарифмическая - их логарифм
+        target = np.asarray(quantities, dtype=float)
+        if model != 'poisson':
+            target = np.log(target)
+    
+    n_rows = len(codes)
+    batch_size = max(1, min(n_replicates, max_batch_rows // max(n_rows, 1)))
+    replicates = np.full((n_replicates, n_groups), np.nan)
+    
+    for start in range(0, n_replicates, batch_size):
+        batch = min(batch_size, n_replicates - start)
+        weights = rng.poisson(1.0, size=(batch, n_rows))
+        
+        # Составной ключ повтор x группа
+        batch_codes = (np.arange(batch)[:, None] * n_groups + codes).ravel()
+        
+        with np.errstate(invalid='ignore'):
+            stats = grouped_sufficient_stats(
+                batch_codes, np.tile(log_price, batch), np.tile(target, batch),
+                batch * n_groups, weights=weights.ravel()
+            ).reshape(batch, n_groups, -1)
+            valid = has_variation(stats)
+            if model == 'poisson':
+                # Как и в count_elasticities, без продаж в повторе наклон не определен
+                valid &= stats[..., 2] > 0
+                slope, _, _ = poisson_irls(
+                    batch_codes, np.tile(log_price, batch), np.tile(target, batch), batch * n_groups,
+                    valid.ravel(), weights=weights.ravel()
+                )
+                slope = slope.reshape(batch, n_groups)
+            else:
+                slope, _ = ols_from_stats(stats)
+        
+        replicates[start:start + batch] = np.where(valid, slope, np.nan)
+    
+    return replicates
+
+def calculate_product_elasticity(df, price_col, quantity_col, model='ols'):
     """
     Расчет эластичности для конкретного продукта с использованием регрессии.
     
@@ -107,28 +620,144 @@ def calculate_product_elasticity(df, price_col, quantity_col):
         df (pandas.DataFrame): Датафрейм с данными о продукте
         price_col (str): Название колонки с ценой
         quantity_col (str): Название колонки с количеством
+        model (str): Модель спроса (см. ELASTICITY_MODELS)
     
     Returns:
         float: Коэффициент эластичности
     """
-    # Проверка наличия достаточного количества уникальных цен
-    if df[price_col].nunique() <= 1:
-        return 0  # Невозможно рассчитать эластичность при одной цене
+    # Все строки относятся к одной группе
+    codes = np.zeros(len(df), dtype=np.intp)
+    
+    if model == 'poisson':
+        elasticities, _ = count_elasticities(codes, df[price_col].values, df[quantity_col].values, 1)
+        return float(elasticities[0])
+    
+    stats = log_log_stats(codes, df[price_col].values, df[quantity_col].values, 1)
+    
+    return float(elasticities_from_stats(stats)[0])
+
+def build_period_results(periods, products, elasticities, valid, has_products=True):
+    """
+    Формирование эластичности по периодам из строк таблицы статистик.
+    
+    Args:
+        periods (numpy.ndarray): Период каждой строки
+        products (numpy.ndarray): Продукт каждой строки
+        elasticities (numpy.ndarray): Эластичность каждой строки
+        valid (numpy.ndarray): Признак наличия нескольких цен в строке
+        has_products (bool): Есть ли разбивка по продуктам
+    
+    Returns:
+        tuple: (словарь эластичностей по периодам, компактная сетка периоды x продукты)
+    """
+    period_codes, period_labels = pd.factorize(periods, sort=True)
+    product_codes, product_labels = pd.factorize(products, sort=True, use_na_sentinel=False)
+    
+    # Плотная сетка периоды x продукты
+    shape = (len(period_labels), len(product_labels))
+    grid_values = np.zeros(shape)
+    grid_valid = np.zeros(shape, dtype=bool)
+    grid_values[period_codes, product_codes] = elasticities
+    grid_valid[period_codes, product_codes] = valid
+    
+    period_names = period_labels.tolist()
+    product_names = product_labels.tolist() if has_products else ['overall']
+    
+    by_period = {}
+    for i, period in enumerate(period_names):
+        # Эластичность считается только для пар с несколькими ценами
+        if not grid_valid[i].any():
+            continue
+        
+        if not has_products:
+            by_period[period] = float(grid_values[i, 0])
+            continue
+        
+        period_elasticities = {
+            product_names[j]: float(grid_values[i, j]) for j in np.flatnonzero(grid_valid[i])
+        }
+        by_period[period] = {
+            'elasticities': period_elasticities,
+            'average': sum(period_elasticities.values()) / len(period_elasticities)
+        }
+    
+    grid = {
+        'periods': period_names,
+        'products': product_names,
+        # None - эластичность для пары не рассчитывается
+        'values': np.where(grid_valid, grid_values, None).tolist()
+    }
     
-    # Логарифмирование для расчета эластичности
-    df = df.copy()
-    df['log_price'] = np.log(df[price_col])
-    df['log_quantity'] = np.log(df[quantity_col])
+    return by_period, grid
+
+def log_log_stats(codes, prices, quantities, n_groups):
+    """
+    Расчет достаточных статистик логарифмической регрессии по группам.
     
-    # Создание модели регрессии
-    model = LinearRegression()
-    X = df['log_price'].values.reshape(-1, 1)
-    y = df['log_quantity'].values
+    Args:
+        codes (numpy.ndarray): Целочисленные коды групп
+        prices (numpy.ndarray): Цены
+        quantities (numpy.ndarray): Количества
+        n_groups (int): Количество групп
     
-    # Обучение модели
-    model.fit(X, y)
+    Returns:
+        numpy.ndarray: Достаточные статистики (см. regression.STAT_COLUMNS)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_price = np.log(np.asarray(prices, dtype=float))
+        log_quantity = np.log(np.asarray(quantities, dtype=float))
+        return grouped_sufficient_stats(codes, log_price, log_quantity, n_groups)
+
+def elasticities_from_stats(stats):
+    """
+    Расчет эластичности по достаточным статистикам логарифмической регрессии.
+    
+    Args:
+        stats (numpy.ndarray): Достаточные статистики (см. regression.STAT_COLUMNS)
+    
+    Returns:
+        numpy.ndarray: Коэффициенты эластичности (0 для групп с одной ценой)
+    """
+    # Нулевые и отрицательные значения делают суммы логарифмов бесконечными,
+    # что исключает регрессию, если в группе больше одной цены
+    is_finite = np.isfinite(stats[..., 1:5]).all(axis=-1)
+    if (has_variation(stats) & ~is_finite).any():
+        raise ValueError("Цена и количество должны быть положительными для расчета эластичности")
     
     # Коэффициент эластичности - это коэффициент наклона в логарифмической модели
-    elasticity = model.coef_[0]
+    with np.errstate(invalid='ignore'):
+        slope, _ = ols_from_stats(stats)
+    return slope
+
+def count_elasticities(codes, prices, quantities, n_groups, max_iter=25):
+    """
+    Расчет эластичности пуассоновской регрессии log E[q] = a + b * log(p) по группам.
+    
+    Args:
+        codes (numpy.ndarray): Целочисленные коды групп
+        prices (numpy.ndarray): Цены
+        quantities (numpy.ndarray): Количества (допускаются нули)
+        n_groups (int): Количество групп
+        max_iter (int): Максимальное число итераций IRLS
+    
+    Returns:
+        tuple: (коэффициенты эластичности, признак групп с рассчитанной эластичностью)
+    """
+    quantities = np.asarray(quantities, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_price = np.log(np.asarray(prices, dtype=float))
+        stats = grouped_sufficient_stats(codes, log_price, quantities, n_groups)
+    
+    # Как и в логарифмической модели, ошибка возникает только для групп с несколькими ценами
+    valid = has_variation(stats)
+    is_finite = np.isfinite(stats[:, 1:5]).all(axis=1)
+    has_negative = np.bincount(codes, weights=quantities < 0, minlength=n_groups) > 0
+    if (valid & (~is_finite | has_negative)).any():
+        raise ValueError("Цена должна быть положительной, а количество - неотрицательным для расчета эластичности")
+    
+    # Без продаж в группе наклон не определен
+    valid &= stats[:, 2] > 0
+    
+    slope, _, _ = poisson_irls(codes, log_price, quantities, n_groups, valid, max_iter=max_iter)
     
-    return elasticity
\ No newline at end of file
+    return slope, valid
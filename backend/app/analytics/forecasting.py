@@ -1,16 +1,116 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_percentage_error
+from threadpoolctl import threadpool_limits
+
+from app.analytics.model_registry import data_fingerprint, model_key, load_model, save_model, evict_models
+from app.analytics.regression import grouped_sufficient_stats, ols_from_stats
+
+# Гиперпараметры моделей на деревьях (входят в ключ модели в реестре)
+FOREST_PARAMS = {'n_estimators': 100, 'random_state': 42}
+BOOSTING_PARAMS = {'max_iter': 100, 'random_state': 42}
+TREE_ENGINE_PARAMS = {
+    'random_forest': FOREST_PARAMS,
+    'hist_gradient_boosting': BOOSTING_PARAMS
+}
+
+# Движки прогнозирования: модели на деревьях обучаются по продуктам, остальные -
+# одним векторным расчетом для всех продуктов; auto выбирает по длине ряда
+FORECAST_ENGINES = ('random_forest', 'hist_gradient_boosting', 'exponential_smoothing', 'ridge', 'auto')
+
+# Границы длины ряда для auto: короткие ряды - сглаживание, длинные - бустинг, остальные - ridge
+SMOOTHING_MAX_ROWS = 60
+BOOSTING_MIN_ROWS = 2000
+
+# Сетка параметров сглаживания, из которой для каждого ряда выбирается лучший
+SMOOTHING_ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9)
+
+# Штраф ridge-регрессии (по стандартизованным признакам)
+RIDGE_ALPHA = 1.0
+
+# Группы признаков ridge-регрессии (колонки ridge_design) для важности признаков
+RIDGE_FEATURE_GROUPS = {'trend': [0], 'price': [1], 'day_of_week': list(range(2, 8)), 'season': [8, 9]}
+
+# Движки, считающие все ряды одним векторным расчетом
+VECTORIZED_ENGINES = ('exponential_smoothing', 'ridge')
+
+# Минимальное число обучающих строк в срезе бэктеста
+BACKTEST_MIN_TRAIN_ROWS = 14
+
+# Инкрементальное обновление: параметр модели, задающий число деревьев. Бустинг
+# не дообучается: при каждом fit он заново строит границы бинов признаков, и
+# деревья, обученные на сдвинутом окне строк, несовместимы с прежними
+TREE_GROWTH_PARAMS = {'random_forest': 'n_estimators'}
+
+# Доля строк, добавленных после полного обучения, сверх которой модель обучается заново
+INCREMENTAL_MAX_SHARE = 0.25
+
+# Минимальное число последних строк, на которых обучаются добавляемые деревья
+INCREMENTAL_WINDOW_ROWS = 30
+
+# Сценарии цены для прогноза: множитель к последней цене продукта
+PRICE_SCENARIOS = {
+    'current_price': 1.0,
+    'increased_price': 1.05,  # +5%
+    'decreased_price': 0.95   # -5%
+}
 
-def forecast_sales(df, params=None):
+# Число точек сетки цен по умолчанию при задании сетки диапазоном
+PRICE_GRID_POINTS = 41
+
+# Уровни квантилей прогноза по умолчанию (P10/P50/P90)
+FORECAST_QUANTILES = (0.1, 0.5, 0.9)
+
+# Число строк будущей матрицы, для которых прогнозы отдельных деревьев хранятся одновременно
+QUANTILE_CHUNK_ROWS = 20000
+
+# Режимы прогнозирования: отдельная модель на продукт или одна модель на весь каталог
+FORECAST_MODES = ('per_product', 'global')
+
+# Календарные признаки модели
+CALENDAR_FEATURES = ['year', 'month', 'day', 'day_of_week', 'week_of_year']
+
+# Число последних наблюдений продукта для признака текущего уровня продаж
+RECENT_WINDOW = 7
+
+# Число пакетов продуктов на процесс: пакеты мельче доли процесса выравнивают нагрузку
+FORECAST_BATCHES_PER_WORKER = 4
+
+# Наибольшее число строк в пакете продуктов (ограничивает копии данных в памяти процессов)
+FORECAST_MAX_BATCH_ROWS = 50000
+
+# Наибольшее число категорий признака бустинга (max_bins по умолчанию); при
+# большем числе продуктов код продукта передается бустингу как число
+BOOSTING_MAX_CATEGORIES = 255
+
+# Признаки продукта в глобальной модели (помимо календаря и цены)
+GLOBAL_FEATURES = [
+    'product_code', 'product_mean_quantity', 'product_std_quantity', 'product_mean_price',
+    'relative_price', 'recent_quantity'
+]
+
+def forecast_sales(df, params=None, model_dir=None, max_model_bytes=None):
     """
     Прогнозирование продаж на основе исторических данных.
     
+    Если задан реестр моделей, обученные модели сохраняются в нем по ключу из
+    хеша данных продукта, продукта и гиперпараметров; при неизменных данных
+    модель загружается вместо обучения. С параметром incremental модели
+    продуктов, к данным которых добавились строки, дообучаются на новых строках.
+    С параметром price_grid для каждого продукта строится кривая спроса по
+    сетке цен тем же вызовом модели, что и сценарии PRICE_SCENARIOS. С параметром
+    quantiles для случайного леса возвращаются квантили прогноза по деревьям.
+    
     Args:
         df (pandas.DataFrame): Датафрейм с данными о продажах
         params (dict): Параметры анализа
+        model_dir (str, optional): Директория реестра обученных моделей
+        max_model_bytes (int, optional): Лимит размера реестра в байтах
     
     Returns:
         dict: Результаты прогнозирования
@@ -23,6 +123,28 @@ def forecast_sales(df, params=None):
     quantity_col = params.get('quantity_column', 'quantity')
     product_col = params.get('product_column', 'product')
     date_col = params.get('date_column', 'date')
+    forecast_periods = params.get('forecast_periods', 30)
+    mode = params.get('forecast_mode', 'per_product')
+    engine = params.get('engine', 'random_forest')
+    n_jobs = resolve_n_jobs(params.get('n_jobs', 1))
+    price_grid = build_price_grid(params.get('price_grid'))
+    quantile_levels = build_quantile_levels(params.get('quantiles'))
+    # Инкрементальное обновление моделей возможно только при наличии реестра
+    max_incremental_share = 0
+    if params.get('incremental') and model_dir:
+        max_incremental_share = float(params.get('max_incremental_share', INCREMENTAL_MAX_SHARE))
+    
+    if mode not in FORECAST_MODES:
+        raise ValueError(f"Неизвестный режим прогнозирования: {mode}")
+    
+    if engine not in FORECAST_ENGINES:
+        raise ValueError(f"Неизвестный движок прогнозирования: {engine}")
+    
+    if mode == 'global' and engine not in TREE_ENGINE_PARAMS and engine != 'auto':
+        raise ValueError("Глобальная модель поддерживает только движки на деревьях")
+    
+    if params.get('backtest') and (mode == 'global' or engine not in TREE_ENGINE_PARAMS):
+        raise ValueError("Бэктест поддерживается только для моделей продуктов на деревьях")
     
     # Проверка наличия необходимых колонок
     required_cols = [price_col, quantity_col, date_col]
@@ -50,19 +172,49 @@ def forecast_sales(df, params=None):
         'feature_importance': {}
     }
     
+    # Глобальная модель: одно обучение и один прогноз на все продукты
+    if mode == 'global' and product_col in df.columns:
+        if engine == 'auto':
+            engine = 'hist_gradient_boosting' if len(df) >= BOOSTING_MIN_ROWS else 'random_forest'
+        
+        forecasts_by_product, accuracy_by_product, importance, curves, quantiles = train_global_forecast_model(
+            df, product_col, price_col, quantity_col, forecast_periods, n_jobs, model_dir, engine, price_grid,
+            quantile_levels
+        )
+        result['forecast_engines'] = {engine: len(forecasts_by_product)}
+        if price_grid is not None:
+            result['demand_curves'] = {'price_multipliers': price_grid.tolist(), 'products': curves}
+        if quantile_levels is not None:
+            result['forecast_quantiles'] = quantile_summary(quantile_levels, products=quantiles)
+        
+        result['forecast'] = forecasts_by_product
+        result['feature_importance'] = importance
+        if accuracy_by_product:
+            result['forecast_accuracy'] = sum(accuracy_by_product.values()) / len(accuracy_by_product)
+        result['forecast_summary'] = create_forecast_summary(forecasts_by_product, accuracy_by_product)
+    
     # Если есть колонка с продуктами, группируем по ней
-    if product_col in df.columns:
+    elif product_col in df.columns:
         forecasts_by_product = {}
         accuracy_by_product = {}
+        curves = {}
+        quantiles = {}
         
-        for product, group in df.groupby(product_col):
-            product_forecast, accuracy, importance = train_forecast_model(
-                group, price_col, quantity_col, params.get('forecast_periods', 30)
-            )
-            
+        product_models, result['forecast_engines'] = forecast_products(
+            df, product_col, price_col, quantity_col, forecast_periods, engine, n_jobs, model_dir, max_incremental_share,
+            price_grid, quantile_levels
+        )
+        for product, product_forecast, accuracy, importance, curve, product_quantiles in product_models:
             forecasts_by_product[product] = product_forecast
             accuracy_by_product[product] = accuracy
             result['feature_importance'][product] = importance
+            curves[product] = curve
+            quantiles[product] = product_quantiles
+        
+        if price_grid is not None:
+            result['demand_curves'] = {'price_multipliers': price_grid.tolist(), 'products': curves}
+        if quantile_levels is not None:
+            result['forecast_quantiles'] = quantile_summary(quantile_levels, products=quantiles)
         
         result['forecast'] = forecasts_by_product
         
@@ -74,106 +226,1229 @@ def forecast_sales(df, params=None):
         result['forecast_summary'] = create_forecast_summary(forecasts_by_product, accuracy_by_product)
     else:
         # Если нет колонки с продуктами, делаем общий прогноз
-        forecast_data, accuracy, importance = train_forecast_model(
-            df, price_col, quantity_col, params.get('forecast_periods', 30)
-        )
+        engine = select_engines(engine, np.array([len(df)]))[0]
+        if engine in VECTORIZED_ENGINES:
+            [(_, forecast_data, accuracy, importance, curve, quantiles)] = vectorized_forecasts(
+                engine, df, None, price_col, quantity_col, forecast_periods, price_grid
+            )
+        else:
+            forecast_data, accuracy, importance, curve, quantiles = train_forecast_model(
+                df, price_col, quantity_col, forecast_periods, n_jobs, model_dir, engine=engine,
+                max_incremental_share=max_incremental_share, price_grid=price_grid, quantile_levels=quantile_levels
+            )
+        result['forecast_engines'] = {engine: 1}
+        if price_grid is not None:
+            result['demand_curves'] = dict(curve, price_multipliers=price_grid.tolist())
+        if quantile_levels is not None:
+            result['forecast_quantiles'] = quantile_summary(quantile_levels, values=quantiles)
         
         result['forecast'] = forecast_data
         result['forecast_accuracy'] = accuracy
         result['feature_importance'] = importance
         result['forecast_summary'] = f"Общий прогноз продаж с точностью {accuracy:.2f}%."
     
+    # Проверка на исторических срезах: обучение до даты среза, прогноз следующих дней
+    if params.get('backtest'):
+        result['backtest'] = backtest_forecasts(
+            df, product_col if product_col in df.columns else None, price_col, quantity_col,
+            int(params.get('backtest_folds', 3)), int(params.get('backtest_horizon', forecast_periods)), engine, n_jobs
+        )
+    
+    # Вытеснение давно не использованных моделей при превышении лимита реестра
+    if model_dir:
+        evict_models(model_dir, max_model_bytes)
+    
     return result
 
-def train_forecast_model(df, price_col, quantity_col, forecast_periods=30):
+def resolve_n_jobs(n_jobs):
+    """
+    Число процессов для обучения: -1 - все ядра, -2 - все кроме одного и т.д.
+    
+    Args:
+        n_jobs (int): Запрошенное число процессов
+    
+    Returns:
+        int: Число процессов от 1 до числа ядер
+    """
+    cpu_count = os.cpu_count() or 1
+    if not n_jobs:
+        return 1
+    if n_jobs < 0:
+        return max(cpu_count + 1 + n_jobs, 1)
+    
+    return min(n_jobs, cpu_count)
+
+def select_engines(engine, lengths):
+    """
+    Движок прогнозирования для каждого ряда.
+    
+    Для auto короткие ряды (меньше SMOOTHING_MAX_ROWS наблюдений) прогнозируются
+    сглаживанием, длинные (от BOOSTING_MIN_ROWS) - градиентным бустингом,
+    остальные - ridge-регрессией.
+    
+    Args:
+        engine (str): Запрошенный движок
+        lengths (numpy.ndarray): Длины рядов
+    
+    Returns:
+        numpy.ndarray: Названия движков по рядам
+    """
+    if engine != 'auto':
+        return np.full(len(lengths), engine, dtype=object)
+    
+    return np.where(
+        lengths < SMOOTHING_MAX_ROWS, 'exponential_smoothing',
+        np.where(lengths < BOOSTING_MIN_ROWS, 'ridge', 'hist_gradient_boosting')
+    ).astype(object)
+
+def forecast_products(df, product_col, price_col, quantity_col, forecast_periods=30, engine='random_forest',
+                      n_jobs=1, model_dir=None, max_incremental_share=0, price_grid=None, quantile_levels=None):
+    """
+    Прогноз всех продуктов выбранными движками.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах и календарными признаками
+        product_col (str): Название колонки с продуктом
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+        forecast_periods (int): Количество периодов для прогноза
+        engine (str): Движок прогнозирования (см. FORECAST_ENGINES)
+        n_jobs (int): Число процессов для моделей на деревьях
+        model_dir (str, optional): Директория реестра обученных моделей
+        max_incremental_share (float): Предел дообучения (см. train_forecast_model)
+        price_grid (numpy.ndarray, optional): Сетка множителей цены для кривых спроса
+        quantile_levels (numpy.ndarray, optional): Уровни квантилей прогноза
+    
+    Returns:
+        tuple: (кортежи (продукт, прогноз, точность, важность признаков, кривая спроса, квантили)
+            в порядке продуктов, число продуктов по движкам)
+    """
+    codes, products = pd.factorize(df[product_col], sort=True)
+    engines = select_engines(engine, np.bincount(codes[codes >= 0], minlength=len(products)))
+    
+    results = {}
+    for name in pd.unique(engines):
+        selected = products[engines == name]
+        rows = df[df[product_col].isin(selected)]
+        if name in VECTORIZED_ENGINES:
+            models = vectorized_forecasts(name, rows, product_col, price_col, quantity_col, forecast_periods, price_grid)
+        else:
+            models = train_product_models(
+                rows, product_col, price_col, quantity_col, forecast_periods, n_jobs, model_dir, name,
+                max_incremental_share, price_grid, quantile_levels
+            )
+        results.update({item[0]: item for item in models})
+    
+    engine_counts = {str(name): int(count) for name, count in zip(*np.unique(engines.astype(str), return_counts=True))}
+    
+    return [results[product] for product in products.tolist()], engine_counts
+
+def train_product_models(df, product_col, price_col, quantity_col, forecast_periods=30, n_jobs=1, model_dir=None,
+                         engine='random_forest', max_incremental_share=0, price_grid=None, quantile_levels=None):
+    """
+    Обучение моделей всех продуктов последовательно или в пуле процессов.
+    
+    Продукты передаются процессам пакетами примерно по 1/FORECAST_BATCHES_PER_WORKER
+    доли строк на процесс (но не больше FORECAST_MAX_BATCH_ROWS строк), поэтому
+    даже небольшой каталог распределяется по всем процессам. В обработке
+    одновременно находится не более двух пакетов на процесс, поэтому копии
+    данных в памяти ограничены. Ядра,
+    оставшиеся сверх числа процессов, отдаются деревьям леса. Случайность
+    модели задается random_state, поэтому результат не зависит от n_jobs.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах и календарными признаками
+        product_col (str): Название колонки с продуктом
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+        forecast_periods (int): Количество периодов для прогноза
+        n_jobs (int): Число процессов
+        model_dir (str, optional): Директория реестра обученных моделей
+        engine (str): Движок на деревьях (см. TREE_ENGINE_PARAMS)
+        max_incremental_share (float): Предел дообучения (см. train_forecast_model)
+        price_grid (numpy.ndarray, optional): Сетка множителей цены для кривых спроса
+        quantile_levels (numpy.ndarray, optional): Уровни квантилей прогноза
+    
+    Returns:
+        list: Кортежи (продукт, прогноз, точность, важность признаков, кривая спроса, квантили)
+            в порядке продуктов
+    """
+    columns = CALENDAR_FEATURES + [price_col, quantity_col]
+    groups = df.groupby(product_col)
+    
+    if n_jobs == 1 or groups.ngroups <= 1:
+        return train_forecast_batch(
+            [(product, group[columns]) for product, group in groups], price_col, quantity_col, forecast_periods,
+            model_dir=model_dir, engine=engine, max_incremental_share=max_incremental_share, price_grid=price_grid,
+            quantile_levels=quantile_levels
+        )
+    
+    workers = min(n_jobs, groups.ngroups)
+    tree_jobs = max(n_jobs // workers, 1)
+    batch_rows = min(max(-(-len(df) // (FORECAST_BATCHES_PER_WORKER * workers)), 1), FORECAST_MAX_BATCH_ROWS)
+    results = {}
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for index, batch in enumerate(product_batches(groups, columns, batch_rows)):
+            # Ожидание освобождения места, чтобы не держать в памяти все пакеты сразу
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+            
+            future = executor.submit(
+                train_forecast_batch, batch, price_col, quantity_col, forecast_periods, tree_jobs, model_dir, engine,
+                max_incremental_share, price_grid, quantile_levels
+            )
+            pending[future] = index
+        
+        for future in wait(pending).done:
+            results[pending[future]] = future.result()
+    
+    return [item for index in sorted(results) for item in results[index]]
+
+def product_batches(groups, columns, batch_rows=FORECAST_MAX_BATCH_ROWS):
+    """
+    Объединение продуктов в пакеты примерно по batch_rows строк.
+    
+    Пакет закрывается, как только набирает batch_rows строк, поэтому продукт
+    длиннее batch_rows образует отдельный пакет.
+    
+    Args:
+        groups (pandas.core.groupby.DataFrameGroupBy): Данные, сгруппированные по продуктам
+        columns (list): Колонки, необходимые для обучения
+        batch_rows (int): Целевое число строк в пакете
+    
+    Yields:
+        list: Пары (продукт, данные продукта)
+    """
+    batch, rows = [], 0
+    for product, group in groups:
+        batch.append((product, group[columns]))
+        rows += len(group)
+        if rows >= batch_rows:
+            yield batch
+            batch, rows = [], 0
+    
+    if batch:
+        yield batch
+
+def train_forecast_batch(batch, price_col, quantity_col, forecast_periods=30, n_jobs=1, model_dir=None,
+                         engine='random_forest', max_incremental_share=0, price_grid=None, quantile_levels=None):
+    """
+    Обучение моделей для пакета продуктов (выполняется в отдельном процессе).
+    
+    Градиентный бустинг не принимает n_jobs и по умолчанию занимает потоками
+    OpenMP все ядра, поэтому число потоков ограничивается на время пакета.
+    
+    Args:
+        batch (list): Пары (продукт, данные продукта)
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+        forecast_periods (int): Количество периодов для прогноза
+        n_jobs (int): Число потоков для деревьев
+        model_dir (str, optional): Директория реестра обученных моделей
+        engine (str): Движок на деревьях (см. TREE_ENGINE_PARAMS)
+        max_incremental_share (float): Предел дообучения (см. train_forecast_model)
+        price_grid (numpy.ndarray, optional): Сетка множителей цены для кривых спроса
+        quantile_levels (numpy.ndarray, optional): Уровни квантилей прогноза
+    
+    Returns:
+        list: Кортежи (продукт, прогноз, точность, важность признаков, кривая спроса, квантили)
+    """
+    with threadpool_limits(limits=n_jobs):
+        return [
+            (product, *train_forecast_model(
+                group, price_col, quantity_col, forecast_periods, n_jobs, model_dir, product, engine,
+                max_incremental_share, price_grid, quantile_levels
+            ))
+            for product, group in batch
+        ]
+
+def make_tree_model(engine='random_forest', n_jobs=1, categorical_features=None):
+    """
+    Создание модели на деревьях для движка прогнозирования.
+    
+    Число потоков бустинга задается не здесь, а ограничением threadpool_limits
+    вокруг обучения (см. train_forecast_batch).
+    
+    Args:
+        engine (str): Движок на деревьях (см. TREE_ENGINE_PARAMS)
+        n_jobs (int): Число потоков для деревьев леса
+        categorical_features (list, optional): Категориальные признаки бустинга
+    
+    Returns:
+        object: Необученная модель sklearn
+    """
+    if engine == 'hist_gradient_boosting':
+        return HistGradientBoostingRegressor(**BOOSTING_PARAMS, categorical_features=categorical_features)
+    
+    return RandomForestRegressor(**FOREST_PARAMS, n_jobs=n_jobs)
+
+def tree_feature_importance(model, features):
+    """Важность признаков модели (у градиентного бустинга sklearn ее нет - пустой словарь)."""
+    importances = getattr(model, 'feature_importances_', None)
+    
+    return {} if importances is None else dict(zip(features, importances))
+
+def train_forecast_model(df, price_col, quantity_col, forecast_periods=30, n_jobs=1, model_dir=None, product=None,
+                         engine='random_forest', max_incremental_share=0, price_grid=None, quantile_levels=None):
     """
     Обучение модели прогнозирования для конкретного продукта.
     
+    При инкрементальном обновлении (max_incremental_share > 0) модель, обученная
+    на начальной части текущих данных, не обучается заново: к ней добавляются
+    деревья, обученные на последних строках, в числе, пропорциональном доле
+    новых строк. Когда строк, добавленных после полного обучения, становится
+    больше max_incremental_share от его объема, модель обучается заново. Движки
+    вне TREE_GROWTH_PARAMS всегда обучаются заново.
+    
     Args:
         df (pandas.DataFrame): Датафрейм с данными о продукте
         price_col (str): Название колонки с ценой
         quantity_col (str): Название колонки с количеством
         forecast_periods (int): Количество периодов для прогноза
+        n_jobs (int): Число потоков для деревьев леса
+        model_dir (str, optional): Директория реестра обученных моделей
+        product (optional): Продукт (входит в ключ модели в реестре)
+        engine (str): Движок на деревьях (см. TREE_ENGINE_PARAMS)
+        max_incremental_share (float): Предельная доля дообучения (0 - без дообучения)
+        price_grid (numpy.ndarray, optional): Сетка множителей цены для кривых спроса
+        quantile_levels (numpy.ndarray, optional): Уровни квантилей прогноза
     
     Returns:
-        tuple: (прогноз, точность, важность признаков)
+        tuple: (прогноз, точность, важность признаков, кривая спроса или None, квантили или None)
     """
     # Подготовка данных для обучения
-    features = ['year', 'month', 'day', 'day_of_week', 'week_of_year', price_col]
+    features = CALENDAR_FEATURES + [price_col]
     X = df[features]
     y = df[quantity_col]
     
-    # Разделение на обучающую и тестовую выборки
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    # Обучение модели RandomForest
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
-    
-    # Оценка точности модели
-    y_pred = model.predict(X_test)
-    accuracy = 100 - (mean_absolute_percentage_error(y_test, y_pred) * 100)
+    # Модель, обученная на тех же данных, берется из реестра
+    key, cached, previous = None, None, None
+    if model_dir:
+        hyperparams = dict(TREE_ENGINE_PARAMS[engine], engine=engine, mode='per_product', features=features,
+                           target=quantity_col)
+        content_hash = data_fingerprint(df[features + [quantity_col]])
+        key = model_key(content_hash, product, hyperparams)
+        lineage_key = model_key('lineage', product, hyperparams)
+        cached = load_model(model_dir, key)
+        
+        # Последняя модель продукта дообучается, если текущие данные продолжают ее данные
+        if cached is None and max_incremental_share > 0 and engine in TREE_GROWTH_PARAMS:
+            lineage = load_model(model_dir, lineage_key)
+            if lineage is not None and can_update_model(df[features + [quantity_col]], lineage, max_incremental_share):
+                # Дообучаемая модель изменяется, поэтому загружается в память, а не отображается с диска
+                previous = load_model(model_dir, lineage['key'], mmap_mode=None)
     
-    # Важность признаков
-    feature_importance = dict(zip(features, model.feature_importances_))
+    if cached is not None:
+        model, accuracy, feature_importance = cached
+    elif previous is not None:
+        # Точность остается оценкой последнего полного обучения
+        model, accuracy, _ = previous
+        new_rows = len(df) - lineage['rows']
+        update_tree_model(model, engine, X, y, new_rows, lineage['base_rows'], n_jobs)
+        feature_importance = tree_feature_importance(model, features)
+        
+        save_model(model_dir, key, (model, accuracy, feature_importance))
+        save_model(model_dir, lineage_key, dict(
+            lineage, key=key, content_hash=content_hash, rows=len(df), added_rows=lineage['added_rows'] + new_rows
+        ))
+    else:
+        # Разделение на обучающую и тестовую выборки
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        
+        # Обучение модели (по умолчанию RandomForest)
+        model = make_tree_model(engine, n_jobs)
+        model.fit(X_train, y_train)
+        
+        # Оценка точности модели
+        y_pred = model.predict(X_test)
+        accuracy = 100 - (mean_absolute_percentage_error(y_test, y_pred) * 100)
+        
+        # Важность признаков
+        feature_importance = tree_feature_importance(model, features)
+        
+        if key is not None:
+            save_model(model_dir, key, (model, accuracy, feature_importance))
+            save_model(model_dir, lineage_key, {
+                'key': key, 'content_hash': content_hash, 'rows': len(df), 'base_rows': len(df), 'added_rows': 0
+            })
     
-    # Создание прогноза на будущие периоды
-    last_date = df['year'].max() * 10000 + df['month'].max() * 100 + df['day'].max()
-    forecast_data = []
+    # Создание прогноза на будущие периоды: признаки всех периодов и сценариев
+    # строятся одной матрицей и прогнозируются одним вызовом модели
+    last_date = pd.Series(calendar_dates(df)).max()
+    dates, calendar = future_calendar(last_date, forecast_periods)
     
     # Определяем базовые значения для прогноза
     last_price = df[price_col].iloc[-1]
-    avg_price_change = df[price_col].diff().mean()
-    
-    # Создаем данные для прогноза
-    for i in range(1, forecast_periods + 1):
-        # Простая логика для генерации дат (можно доработать)
-        date_num = last_date + i
-        year = date_num // 10000
-        month = (date_num // 100) % 100
-        day = date_num % 100
-        
-        # Корректировка месяца и дня
-        if day > 28:
-            day = 1
-            month += 1
-        if month > 12:
-            month = 1
-            year += 1
-        
-        # Прогнозируем для разных цен
-        price_scenarios = {
-            'current_price': last_price,
-            'increased_price': last_price * 1.05,  # +5%
-            'decreased_price': last_price * 0.95   # -5%
+    scenario_prices = last_price * scenario_multipliers(price_grid)
+    
+    # Строки упорядочены по периодам, внутри периода - по сценариям
+    features_for_prediction = calendar.loc[calendar.index.repeat(len(scenario_prices))].reset_index(drop=True)
+    features_for_prediction[price_col] = np.tile(scenario_prices, forecast_periods)
+    
+    predictions, quantiles = predict_with_quantiles(model, features_for_prediction[features], quantile_levels)
+    predictions = predictions.reshape(forecast_periods, len(scenario_prices))
+    if quantiles is not None:
+        quantiles = scenario_quantiles(quantiles.reshape(len(quantile_levels), forecast_periods, len(scenario_prices)))
+    
+    return (format_forecast(dates, predictions), accuracy, feature_importance,
+            demand_curve(predictions, last_price, price_grid), quantiles)
+
+def can_update_model(data, lineage, max_incremental_share):
+    """
+    Проверка, что модель из реестра можно дообучить на текущих данных.
+    
+    Данные должны начинаться ровно с тех строк, на которых обучена модель
+    (новые строки только добавлены в конец), а строк, добавленных после полного
+    обучения, должно остаться не больше max_incremental_share от его объема.
+    
+    Args:
+        data (pandas.DataFrame): Текущие признаки и целевая переменная продукта
+        lineage (dict): Сведения о последней модели продукта
+        max_incremental_share (float): Предельная доля дообучения
+    
+    Returns:
+        bool: Можно ли дообучить модель
+    """
+    new_rows = len(data) - lineage['rows']
+    if new_rows <= 0 or lineage['added_rows'] + new_rows > max_incremental_share * lineage['base_rows']:
+        return False
+    
+    return data_fingerprint(data.iloc[:lineage['rows']]) == lineage['content_hash']
+
+def update_tree_model(model, engine, X, y, new_rows, base_rows, n_jobs=1):
+    """
+    Дообучение случайного леса добавлением деревьев через warm_start.
+    
+    Число добавляемых деревьев пропорционально доле новых строк относительно
+    объема полного обучения, а обучаются они на последних строках (не меньше
+    INCREMENTAL_WINDOW_ROWS), поэтому стоимость обновления зависит от объема
+    новых данных, а не от длины истории.
+    
+    Args:
+        model (object): Обученная модель, загруженная без отображения в память (изменяется на месте)
+        engine (str): Дообучаемый движок (см. TREE_GROWTH_PARAMS)
+        X (pandas.DataFrame): Признаки всех строк продукта
+        y (pandas.Series): Целевая переменная всех строк продукта
+        new_rows (int): Число новых строк в конце данных
+        base_rows (int): Число строк при полном обучении
+        n_jobs (int): Число потоков для деревьев леса
+    """
+    growth_param = TREE_GROWTH_PARAMS[engine]
+    base_size = TREE_ENGINE_PARAMS[engine][growth_param]
+    extra = max(int(np.ceil(base_size * new_rows / base_rows)), 1)
+    window = max(new_rows, INCREMENTAL_WINDOW_ROWS)
+    
+    model.set_params(warm_start=True, n_jobs=n_jobs, **{growth_param: model.get_params()[growth_param] + extra})
+    model.fit(X.iloc[-window:], y.iloc[-window:])
+    model.set_params(warm_start=False)
+
+def backtest_forecasts(df, product_col, price_col, quantity_col, folds=3, horizon=30, engine='random_forest',
+                       n_jobs=1):
+    """
+    Бэктест со скользящей точкой отсчета (rolling origin) для моделей продуктов.
+    
+    Для каждого продукта берутся folds срезов: последний - за horizon дней до
+    конца истории, предыдущие - каждый еще на horizon дней раньше. Модель
+    обучается только на строках до среза и прогнозирует фактические строки
+    следующих horizon дней, поэтому будущие данные в обучение не попадают.
+    Матрица признаков строится один раз для всех продуктов и срезов, срезы
+    обучаются параллельно в потоках (обучение деревьев sklearn отпускает GIL).
+    Потоки OpenMP бустинга ограничены одним на срез, поэтому всего занято не
+    больше n_jobs ядер.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах и календарными признаками
+        product_col (str): Название колонки с продуктом (None - один общий ряд)
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+        folds (int): Число срезов на продукт
+        horizon (int): Горизонт проверки в днях
+        engine (str): Движок на деревьях (см. TREE_ENGINE_PARAMS)
+        n_jobs (int): Число потоков
+    
+    Returns:
+        dict: MAPE по горизонтам (1..horizon дней) для каталога и продуктов
+    """
+    if folds <= 0 or horizon <= 0:
+        raise ValueError("Число срезов и горизонт бэктеста должны быть положительными")
+    
+    if product_col is None:
+        codes, products = np.zeros(len(df), dtype=np.intp), [None]
+    else:
+        codes, products = pd.factorize(df[product_col], sort=True)
+        products = products.tolist()
+    
+    # Общая матрица признаков, упорядоченная по продукту и дате
+    keep = codes >= 0
+    codes, dates = codes[keep], calendar_dates(df.loc[keep])
+    X = df.loc[keep, CALENDAR_FEATURES + [price_col]].to_numpy(dtype=float)
+    y = df.loc[keep, quantity_col].to_numpy(dtype=float)
+    order = np.lexsort((dates, codes))
+    codes, dates, X, y = codes[order], dates[order], X[order], y[order]
+    bounds = np.searchsorted(codes, np.arange(len(products) + 1))
+    day = np.timedelta64(1, 'D')
+    
+    def run_fold(code, cutoff):
+        start, end = bounds[code], bounds[code + 1]
+        fold_dates = dates[start:end]
+        train = fold_dates <= cutoff
+        test = (fold_dates > cutoff) & (fold_dates <= cutoff + horizon * day)
+        if train.sum() < BACKTEST_MIN_TRAIN_ROWS or not test.any():
+            return code, None, None
+        
+        model = make_tree_model(engine).fit(X[start:end][train], y[start:end][train])
+        actual = y[start:end][test]
+        errors = np.abs(actual - model.predict(X[start:end][test])) / np.maximum(np.abs(actual), np.finfo(float).eps)
+        steps = ((fold_dates[test] - cutoff) // day).astype(np.intp) - 1
+        
+        return code, np.bincount(steps, weights=errors, minlength=horizon), np.bincount(steps, minlength=horizon)
+    
+    tasks = []
+    for code in range(len(products)):
+        last_date = dates[bounds[code + 1] - 1] if bounds[code + 1] > bounds[code] else np.datetime64('NaT')
+        if not np.isnat(last_date):
+            tasks.extend((code, last_date - k * horizon * day) for k in range(folds, 0, -1))
+    
+    error_sums = np.zeros((len(products), horizon))
+    error_counts = np.zeros((len(products), horizon))
+    # Ограничение действует на весь процесс, поэтому задается один раз для всех потоков срезов
+    with threadpool_limits(limits=1), ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        for code, sums, counts in executor.map(lambda task: run_fold(*task), tasks):
+            if sums is not None:
+                error_sums[code] += sums
+                error_counts[code] += counts
+    
+    def mape(sums, counts):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = sums / counts * 100
+        return [None if np.isnan(value) else float(value) for value in np.atleast_1d(values)]
+    
+    result = {
+        'folds': folds,
+        'horizon': horizon,
+        'mape': mape(error_sums.sum(axis=0), error_counts.sum(axis=0)),
+        'overall_mape': mape(error_sums.sum(), error_counts.sum())[0]
+    }
+    if product_col is not None:
+        result['mape_by_product'] = {
+            product: mape(error_sums[code], error_counts[code]) for code, product in enumerate(products)
         }
+    
+    return result
+
+def train_global_forecast_model(df, product_col, price_col, quantity_col, forecast_periods=30, n_jobs=1,
+                                model_dir=None, engine='random_forest', price_grid=None, quantile_levels=None):
+    """
+    Обучение одной модели прогнозирования для всех продуктов каталога.
+    
+    Продукт передается модели как категориальный признак (код продукта) вместе
+    со статистиками продукта (средний спрос, его разброс, относительная цена) и
+    уровнем продаж за последние RECENT_WINDOW наблюдений. Продукты с короткой
+    историей используют закономерности, общие для каталога, а время обучения
+    растет с числом строк, а не продуктов. Горизонт всех продуктов
+    прогнозируется одним вызовом модели; уровень продаж в прогнозе равен
+    последнему известному.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах и календарными признаками
+        product_col (str): Название колонки с продуктом
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+        forecast_periods (int): Количество периодов для прогноза
+        n_jobs (int): Число потоков для деревьев леса
+        model_dir (str, optional): Директория реестра обученных моделей
+        engine (str): Движок на деревьях (см. TREE_ENGINE_PARAMS)
+        price_grid (numpy.ndarray, optional): Сетка множителей цены для кривых спроса
+        quantile_levels (numpy.ndarray, optional): Уровни квантилей прогноза
+    
+    Returns:
+        tuple: (прогнозы по продуктам, точность по продуктам, важность признаков, кривые спроса по продуктам,
+            квантили по продуктам)
+    """
+    data, products, last_rows, train_idx, test_idx = build_global_features(df, product_col, price_col, quantity_col)
+    features = CALENDAR_FEATURES + [price_col] + GLOBAL_FEATURES
+    X, y = data[features], data[quantity_col].to_numpy(dtype=float)
+    
+    # Бустинг разбивает продукты по категориям, а не по порядку кодов, если их не больше числа бинов
+    categorical_features = None
+    if engine == 'hist_gradient_boosting' and len(products) <= BOOSTING_MAX_CATEGORIES:
+        categorical_features = ['product_code']
+    
+    # Модель, обученная на тех же данных, берется из реестра
+    key, cached = None, None
+    if model_dir:
+        hyperparams = dict(TREE_ENGINE_PARAMS[engine], engine=engine, mode='global', features=features,
+                           target=quantity_col, categorical_features=categorical_features)
+        key = model_key(data_fingerprint(data[features + [quantity_col]]), None, hyperparams)
+        cached = load_model(model_dir, key)
+    
+    if cached is not None:
+        model, accuracy_by_product, feature_importance = cached
+    else:
+        model = make_tree_model(engine, n_jobs, categorical_features)
+        model.fit(X.iloc[train_idx], y[train_idx])
         
-        scenario_predictions = {}
-        for scenario, price in price_scenarios.items():
-            # Создаем признаки для прогноза
-            features_dict = {
-                'year': year,
-                'month': month,
-                'day': day,
-                'day_of_week': pd.Timestamp(year=year, month=month, day=day).dayofweek,
-                'week_of_year': pd.Timestamp(year=year, month=month, day=day).isocalendar()[1],
-                price_col: price
-            }
-            
-            # Преобразуем в формат для модели
-            features_for_prediction = pd.DataFrame([features_dict])
-            
-            # Делаем прогноз
-            prediction = model.predict(features_for_prediction)[0]
-            scenario_predictions[scenario] = prediction
+        # Точность по продуктам: MAPE тестовых строк каждого продукта
+        errors = np.abs(y[test_idx] - model.predict(X.iloc[test_idx])) / np.maximum(np.abs(y[test_idx]), np.finfo(float).eps)
+        test_codes = data['product_code'].to_numpy()[test_idx]
+        counts = np.bincount(test_codes, minlength=len(products))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mape = np.bincount(test_codes, weights=errors, minlength=len(products)) / counts
+        accuracy_by_product = {
+            products[code]: float(100 - mape[code] * 100) for code in np.flatnonzero(counts > 0)
+        }
+        
+        feature_importance = tree_feature_importance(model, features)
+        
+        if key is not None:
+            save_model(model_dir, key, (model, accuracy_by_product, feature_importance))
+    
+    # Будущие строки: продукты x периоды x сценарии, один вызов модели
+    multipliers = scenario_multipliers(price_grid)
+    n_products, n_scenarios = len(products), len(multipliers)
+    dates = future_dates(last_rows['date'].to_numpy(), forecast_periods)
+    
+    future = calendar_features(dates)
+    for column in GLOBAL_FEATURES:
+        future[column] = np.repeat(last_rows[column].to_numpy(), forecast_periods)
+    future = future.loc[future.index.repeat(n_scenarios)].reset_index(drop=True)
+    
+    last_price = last_rows[price_col].to_numpy()
+    future[price_col] = (np.repeat(last_price, forecast_periods * n_scenarios)
+                         * np.tile(multipliers, n_products * forecast_periods))
+    future['relative_price'] = future[price_col] / np.repeat(
+        last_rows['product_mean_price'].to_numpy(), forecast_periods * n_scenarios
+    )
+    
+    predictions, quantiles = predict_with_quantiles(model, future[features], quantile_levels)
+    predictions = predictions.reshape(n_products, forecast_periods, n_scenarios)
+    if quantiles is not None:
+        quantiles = quantiles.reshape(len(quantile_levels), n_products, forecast_periods, n_scenarios)
+    product_dates = dates.values.reshape(n_products, forecast_periods)
+    
+    forecasts_by_product = {
+        product: format_forecast(product_dates[code], predictions[code])
+        for code, product in enumerate(products)
+    }
+    curves_by_product = {
+        product: demand_curve(predictions[code], last_price[code], price_grid)
+        for code, product in enumerate(products)
+    }
+    quantiles_by_product = {
+        product: None if quantiles is None else scenario_quantiles(quantiles[:, code])
+        for code, product in enumerate(products)
+    }
+    
+    return forecasts_by_product, accuracy_by_product, feature_importance, curves_by_product, quantiles_by_product
+
+def build_global_features(df, product_col, price_col, quantity_col):
+    """
+    Признаки глобальной модели: код продукта, статистики продукта и уровень продаж.
+    
+    Строки делятся на обучающие и тестовые до расчета статистик продукта, и
+    статистики считаются только по обучающим строкам, чтобы фактические
+    продажи тестовых строк не попадали в их признаки. Продукт без обучающих
+    строк получает средний спрос каталога. Уровень продаж строки - среднее
+    количество за RECENT_WINDOW предыдущих наблюдений продукта (по
+    накопленным суммам, без цикла по продуктам).
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах и календарными признаками
+        product_col (str): Название колонки с продуктом
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+    
+    Returns:
+        tuple: (строки с признаками, список продуктов, последняя строка каждого продукта,
+            индексы обучающих строк, индексы тестовых строк)
+    """
+    codes, products = pd.factorize(df[product_col], sort=True)
+    data = df.loc[codes >= 0, CALENDAR_FEATURES + [price_col, quantity_col]].astype(float)
+    data['product_code'] = codes[codes >= 0]
+    data['date'] = calendar_dates(df.loc[codes >= 0])
+    data['row'] = np.arange(len(data))
+    
+    # Разделение на обучающую и тестовую выборки
+    train_idx, test_idx = train_test_split(np.arange(len(data)), test_size=0.2, random_state=42)
+    
+    train_rows = data.iloc[train_idx]
+    by_product = train_rows.groupby('product_code')
+    stats = pd.DataFrame({
+        'product_mean_quantity': by_product[quantity_col].mean(),
+        'product_std_quantity': by_product[quantity_col].std(),
+        'product_mean_price': by_product[price_col].mean()
+    }).reindex(np.arange(len(products)))
+    stats = stats.fillna({
+        'product_mean_quantity': train_rows[quantity_col].mean(),
+        'product_std_quantity': 0,
+        'product_mean_price': data.groupby('product_code')[price_col].mean()
+    })
+    for column in stats.columns:
+        data[column] = stats[column].to_numpy()[data['product_code'].to_numpy()]
+    data['relative_price'] = data[price_col] / data['product_mean_price']
+    
+    # Среднее за предыдущие RECENT_WINDOW наблюдений продукта (в порядке дат)
+    data = data.sort_values(['product_code', 'date', 'row'], kind='stable')
+    by_product = data.groupby('product_code', sort=False)
+    cumulative = by_product[quantity_col].cumsum()
+    position = by_product.cumcount().to_numpy()
+    window_start = cumulative.groupby(data['product_code'], sort=False).shift(RECENT_WINDOW).fillna(0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        recent = ((cumulative - data[quantity_col] - window_start) / np.minimum(position, RECENT_WINDOW)).to_numpy()
+    data['recent_quantity'] = np.where(position > 0, recent, data['product_mean_quantity'])
+    
+    # Состояние на конец истории: уровень по последним наблюдениям, последняя цена по порядку строк
+    tail = data.groupby('product_code', sort=False).tail(RECENT_WINDOW)
+    last_rows = data.groupby('product_code').last()
+    last_rows['product_code'] = last_rows.index.to_numpy()
+    last_rows['date'] = data.groupby('product_code')['date'].max()
+    last_rows['recent_quantity'] = tail.groupby('product_code')[quantity_col].mean()
+    last_rows[price_col] = data.sort_values('row').groupby('product_code')[price_col].last()
+    
+    return data.sort_values('row'), products.tolist(), last_rows, train_idx, test_idx
+
+def vectorized_forecasts(engine, df, product_col, price_col, quantity_col, forecast_periods=30, price_grid=None):
+    """
+    Прогноз всех рядов векторным движком (см. VECTORIZED_ENGINES).
+    
+    Args:
+        engine (str): Движок прогнозирования
+        df (pandas.DataFrame): Датафрейм с данными о продажах и календарными признаками
+        product_col (str): Название колонки с продуктом (None - один общий ряд)
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+        forecast_periods (int): Количество периодов для прогноза
+        price_grid (numpy.ndarray, optional): Сетка множителей цены для кривых спроса
+    
+    Квантили прогноза векторными движками не оцениваются (вместо них None).
+    
+    Returns:
+        list: Кортежи (продукт, прогноз, точность, важность признаков, кривая спроса, квантили)
+    """
+    if engine == 'exponential_smoothing':
+        return smoothing_forecasts(df, product_col, price_col, quantity_col, forecast_periods, price_grid)
+    
+    return ridge_forecasts(df, product_col, price_col, quantity_col, forecast_periods, price_grid)
+
+def series_arrays(df, product_col, price_col, quantity_col):
+    """
+    Массивы рядов для векторных движков: коды продуктов, даты, цены и количества.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах и календарными признаками
+        product_col (str): Название колонки с продуктом (None - один общий ряд)
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+    
+    Returns:
+        dict: codes, products, dates, prices, quantities и по продуктам last_date, last_price
+    """
+    if product_col is None:
+        codes, products = np.zeros(len(df), dtype=np.intp), [None]
+    else:
+        codes, products = pd.factorize(df[product_col], sort=True)
+        products = products.tolist()
+    
+    keep = codes >= 0
+    codes = codes[keep]
+    dates = calendar_dates(df.loc[keep])
+    prices = df.loc[keep, price_col].to_numpy(dtype=float)
+    
+    # Последняя дата ряда и последняя цена в порядке строк (как в train_forecast_model)
+    last_row = np.zeros(len(products), dtype=np.intp)
+    np.maximum.at(last_row, codes, np.arange(len(codes)))
+    last_date = pd.Series(dates).groupby(codes).max().to_numpy()
+    
+    return {
+        'codes': codes,
+        'products': products,
+        'dates': dates,
+        'prices': prices,
+        'quantities': df.loc[keep, quantity_col].to_numpy(dtype=float),
+        'last_date': last_date,
+        'last_price': prices[last_row]
+    }
+
+def smoothing_forecasts(df, product_col, price_col, quantity_col, forecast_periods=30, price_grid=None):
+    """
+    Простое экспоненциальное сглаживание всех рядов одновременно.
+    
+    Шаг рекурсии обрабатывает сразу все ряды (i-е наблюдение каждого ряда) и
+    все значения параметра из SMOOTHING_ALPHAS; для ряда выбирается параметр с
+    наименьшей ошибкой прогноза на шаг вперед по первым 80% наблюдений, точность
+    считается по последним 20%. Реакция на сценарии цены задается эластичностью
+    ряда по логарифмической регрессии.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах и календарными признаками
+        product_col (str): Название колонки с продуктом (None - один общий ряд)
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+        forecast_periods (int): Количество периодов для прогноза
+        price_grid (numpy.ndarray, optional): Сетка множителей цены для кривых спроса
+    
+    Returns:
+        list: Кортежи (продукт, прогноз, точность, важность признаков, кривая спроса, квантили)
+    """
+    series = series_arrays(df, product_col, price_col, quantity_col)
+    codes, quantities = series['codes'], series['quantities']
+    n_products = len(series['products'])
+    alphas = np.array(SMOOTHING_ALPHAS)[None, :]
+    
+    # Порядковый номер наблюдения внутри ряда (по дате)
+    order = np.lexsort((series['dates'], codes))
+    codes, quantities = codes[order], quantities[order]
+    lengths = np.bincount(codes, minlength=n_products)
+    position = np.arange(len(codes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    holdout_start = np.ceil(lengths * 0.8).astype(np.intp)
+    
+    by_position = np.argsort(position, kind='stable')
+    bounds = np.searchsorted(position[by_position], np.arange(lengths.max() + 1))
+    
+    level = np.zeros((n_products, len(SMOOTHING_ALPHAS)))
+    train_error = np.zeros_like(level)
+    holdout_error = np.zeros_like(level)
+    
+    for t in range(lengths.max()):
+        rows = by_position[bounds[t]:bounds[t + 1]]
+        rows_codes, y = codes[rows], quantities[rows][:, None]
+        if t == 0:
+            level[rows_codes] = y
+            continue
         
-        forecast_data.append({
-            'period': i,
-            'date': f"{year}-{month:02d}-{day:02d}",
-            'predictions': scenario_predictions
-        })
+        error = y - level[rows_codes]
+        is_holdout = t >= holdout_start[rows_codes]
+        train_error[rows_codes[~is_holdout]] += error[~is_holdout] ** 2
+        holdout_error[rows_codes[is_holdout]] += (
+            np.abs(error[is_holdout]) / np.maximum(np.abs(y[is_holdout]), np.finfo(float).eps)
+        )
+        level[rows_codes] = alphas * y + (1 - alphas) * level[rows_codes]
+    
+    best = np.argmin(train_error, axis=1)
+    products_idx = np.arange(n_products)
+    holdout_count = lengths - holdout_start
+    with np.errstate(invalid='ignore', divide='ignore'):
+        accuracy = np.where(holdout_count > 0, 100 - holdout_error[products_idx, best] / holdout_count * 100, 0.0)
+    
+    # Сценарии цены: уровень ряда, скорректированный по эластичности
+    elasticity = log_elasticities(series, n_products)
+    multipliers = scenario_multipliers(price_grid)
+    scenario_level = level[products_idx, best][:, None] * multipliers[None, :] ** elasticity[:, None]
+    predictions = np.repeat(scenario_level[:, None, :], forecast_periods, axis=1)
+    
+    dates = future_dates(series['last_date'], forecast_periods).values.reshape(n_products, forecast_periods)
+    
+    return [
+        (product, format_forecast(dates[code], predictions[code]), float(accuracy[code]), {},
+         demand_curve(predictions[code], series['last_price'][code], price_grid), None)
+        for code, product in enumerate(series['products'])
+    ]
+
+def log_elasticities(series, n_products):
+    """
+    Эластичность спроса по цене каждого ряда (наклон регрессии log(q) на log(p)).
+    
+    Args:
+        series (dict): Массивы рядов (см. series_arrays)
+        n_products (int): Количество рядов
+    
+    Returns:
+        numpy.ndarray: Эластичности (0 для рядов без вариации цены)
+    """
+    positive = (series['prices'] > 0) & (series['quantities'] > 0)
+    stats = grouped_sufficient_stats(
+        series['codes'][positive], np.log(series['prices'][positive]), np.log(series['quantities'][positive]),
+        n_products
+    )
+    elasticity, _ = ols_from_stats(stats)
+    
+    return elasticity
+
+def ridge_design(dates, first_date, relative_price):
+    """
+    Признаки ridge-регрессии: тренд, относительная цена, день недели и сезон.
+    
+    Args:
+        dates (numpy.ndarray): Даты наблюдений
+        first_date (numpy.ndarray): Первая дата ряда для каждого наблюдения
+        relative_price (numpy.ndarray): Цена относительно средней цены ряда
+    
+    Returns:
+        numpy.ndarray: Матрица признаков (наблюдения x признаки RIDGE_FEATURE_GROUPS)
+    """
+    dates = pd.DatetimeIndex(dates)
+    day_of_week = dates.dayofweek.to_numpy()
+    season = 2 * np.pi * (dates.dayofyear.to_numpy() - 1) / 365.25
+    
+    return np.column_stack([
+        (dates.to_numpy() - first_date) / np.timedelta64(365, 'D'),
+        relative_price,
+        *[(day_of_week == day).astype(float) for day in range(1, 7)],
+        np.sin(season),
+        np.cos(season)
+    ])
+
+def ridge_forecasts(df, product_col, price_col, quantity_col, forecast_periods=30, price_grid=None):
+    """
+    Ridge-регрессия по календарю и цене для всех рядов одновременно.
+    
+    Признаки стандартизуются внутри ряда, нормальные уравнения всех рядов
+    собираются групповыми суммами и решаются одним пакетным вызовом. Как и для
+    случайного леса, 20% наблюдений откладываются для оценки точности.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах и календарными признаками
+        product_col (str): Название колонки с продуктом (None - один общий ряд)
+        price_col (str): Название колонки с ценой
+        quantity_col (str): Название колонки с количеством
+        forecast_periods (int): Количество периодов для прогноза
+        price_grid (numpy.ndarray, optional): Сетка множителей цены для кривых спроса
+    
+    Returns:
+        list: Кортежи (продукт, прогноз, точность, важность признаков, кривая спроса, квантили)
+    """
+    series = series_arrays(df, product_col, price_col, quantity_col)
+    codes, y = series['codes'], series['quantities']
+    n_products = len(series['products'])
+    
+    counts = np.bincount(codes, minlength=n_products)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_price = np.bincount(codes, weights=series['prices'], minlength=n_products) / counts
+    first_date = pd.Series(series['dates']).groupby(codes).min().to_numpy()
+    
+    X = ridge_design(series['dates'], first_date[codes], series['prices'] / mean_price[codes])
+    # Отложенные строки зависят только от номера строки внутри ряда, а не от состава данных
+    row_in_series = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    is_test = np.random.default_rng(42).random(counts.max())[row_in_series] < 0.2
+    train = ~is_test
+    
+    # Стандартизация признаков по обучающим строкам ряда
+    train_counts = np.maximum(np.bincount(codes[train], minlength=n_products), 1)
+    mean = np.column_stack([
+        np.bincount(codes[train], weights=X[train, j], minlength=n_products) for j in range(X.shape[1])
+    ]) / train_counts[:, None]
+    square = np.column_stack([
+        np.bincount(codes[train], weights=X[train, j] ** 2, minlength=n_products) for j in range(X.shape[1])
+    ]) / train_counts[:, None]
+    scale = np.sqrt(np.maximum(square - mean ** 2, 0))
+    scale = np.where(scale > 1e-12, scale, 1.0)
+    
+    Z = np.column_stack([np.ones(len(codes)), (X - mean[codes]) / scale[codes]])
+    coef = solve_grouped_ridge(codes[train], Z[train], y[train], n_products)
+    
+    # Точность по отложенным строкам каждого ряда
+    errors = np.abs(y[is_test] - np.maximum((Z[is_test] * coef[codes[is_test]]).sum(axis=1), 0))
+    errors /= np.maximum(np.abs(y[is_test]), np.finfo(float).eps)
+    test_counts = np.bincount(codes[is_test], minlength=n_products)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        accuracy = np.where(
+            test_counts > 0,
+            100 - np.bincount(codes[is_test], weights=errors, minlength=n_products) / test_counts * 100,
+            0.0
+        )
+    
+    # Будущие строки: продукты x периоды x сценарии
+    multipliers = scenario_multipliers(price_grid)
+    dates = future_dates(series['last_date'], forecast_periods)
+    product_codes = np.repeat(np.arange(n_products), forecast_periods)
+    future = ridge_design(dates, first_date[product_codes], np.zeros(len(dates)))
+    future = np.repeat(future[:, None, :], len(multipliers), axis=1)
+    future[:, :, 1] = (series['last_price'] / mean_price)[product_codes][:, None] * multipliers[None, :]
+    future_z = (future - mean[product_codes][:, None, :]) / scale[product_codes][:, None, :]
+    
+    predictions = coef[product_codes][:, None, 0] + np.einsum('rsk,rk->rs', future_z, coef[product_codes][:, 1:])
+    predictions = np.maximum(predictions, 0).reshape(n_products, forecast_periods, len(multipliers))
     
-    return forecast_data, accuracy, feature_importance
+    # Важность признаков - доля модулей стандартизованных коэффициентов групп
+    weights = np.abs(coef[:, 1:])
+    importance = np.column_stack([weights[:, columns].sum(axis=1) for columns in RIDGE_FEATURE_GROUPS.values()])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        importance = np.nan_to_num(importance / importance.sum(axis=1, keepdims=True))
+    
+    product_dates = dates.values.reshape(n_products, forecast_periods)
+    
+    return [
+        (product, format_forecast(product_dates[code], predictions[code]), float(accuracy[code]),
+         dict(zip(RIDGE_FEATURE_GROUPS, importance[code].tolist())),
+         demand_curve(predictions[code], series['last_price'][code], price_grid), None)
+        for code, product in enumerate(series['products'])
+    ]
+
+def solve_grouped_ridge(codes, Z, y, n_groups, alpha=RIDGE_ALPHA):
+    """
+    Решение ridge-регрессии для всех групп по групповым суммам Z'Z и Z'y.
+    
+    Первая колонка Z - свободный член, он не штрафуется.
+    
+    Args:
+        codes (numpy.ndarray): Коды групп строк
+        Z (numpy.ndarray): Матрица признаков
+        y (numpy.ndarray): Зависимая переменная
+        n_groups (int): Количество групп
+        alpha (float): Штраф
+    
+    Returns:
+        numpy.ndarray: Коэффициенты групп (группы x признаки)
+    """
+    n_features = Z.shape[1]
+    gram = np.empty((n_groups, n_features, n_features))
+    for i in range(n_features):
+        for j in range(i, n_features):
+            gram[:, i, j] = gram[:, j, i] = np.bincount(codes, weights=Z[:, i] * Z[:, j], minlength=n_groups)
+    moments = np.column_stack([
+        np.bincount(codes, weights=Z[:, j] * y, minlength=n_groups) for j in range(n_features)
+    ])
+    
+    # Небольшой штраф свободного члена сохраняет систему разрешимой для пустых групп
+    penalty = np.full(n_features, alpha)
+    penalty[0] = 1e-8
+    
+    return np.linalg.solve(gram + np.diag(penalty), moments[:, :, None])[:, :, 0]
+
+def future_dates(last_dates, forecast_periods):
+    """
+    Даты прогноза для нескольких рядов: forecast_periods дней после последней даты.
+    
+    Args:
+        last_dates (numpy.ndarray): Последние даты рядов
+        forecast_periods (int): Количество периодов для прогноза
+    
+    Returns:
+        pandas.DatetimeIndex: Даты (ряды x периоды, построчно)
+    """
+    offsets = np.tile(np.arange(1, forecast_periods + 1), len(last_dates)).astype('timedelta64[D]')
+    
+    return pd.DatetimeIndex(np.repeat(np.asarray(last_dates, dtype='datetime64[ns]'), forecast_periods) + offsets)
+
+def build_price_grid(price_grid):
+    """
+    Сетка множителей текущей цены для кривых спроса.
+    
+    Args:
+        price_grid: Список множителей или словарь {'min', 'max', 'points'}
+            (равномерная сетка); None - без кривых спроса
+    
+    Returns:
+        numpy.ndarray: Множители цены по возрастанию или None
+    """
+    if price_grid is None:
+        return None
+    
+    if isinstance(price_grid, dict):
+        points = int(price_grid.get('points', PRICE_GRID_POINTS))
+        if points < 2:
+            raise ValueError("Сетка цен должна содержать не менее двух точек")
+        grid = np.linspace(float(price_grid.get('min', 0.8)), float(price_grid.get('max', 1.2)), points)
+    else:
+        grid = np.unique(np.asarray(price_grid, dtype=float))
+    
+    if grid.size == 0 or not np.all(np.isfinite(grid)) or np.any(grid <= 0):
+        raise ValueError("Множители сетки цен должны быть положительными числами")
+    
+    return grid
+
+def scenario_multipliers(price_grid=None):
+    """
+    Множители цены, прогнозируемые одним вызовом модели: сначала сценарии
+    PRICE_SCENARIOS, затем точки сетки цен.
+    
+    Args:
+        price_grid (numpy.ndarray, optional): Сетка множителей цены
+    
+    Returns:
+        numpy.ndarray: Множители цены
+    """
+    multipliers = np.array(list(PRICE_SCENARIOS.values()))
+    if price_grid is None:
+        return multipliers
+    
+    return np.concatenate([multipliers, price_grid])
+
+def demand_curve(predictions, last_price, price_grid=None):
+    """
+    Кривая спроса продукта из столбцов прогноза, относящихся к сетке цен.
+    
+    Args:
+        predictions (numpy.ndarray): Прогнозы периоды x множители (см. scenario_multipliers)
+        last_price (float): Последняя цена продукта
+        price_grid (numpy.ndarray, optional): Сетка множителей цены
+    
+    Returns:
+        dict: Цены сетки и прогноз продаж периоды x точки сетки или None без сетки
+    """
+    if price_grid is None:
+        return None
+    
+    return {
+        'prices': (float(last_price) * price_grid).tolist(),
+        'quantity': predictions[:, len(PRICE_SCENARIOS):].tolist()
+    }
+
+def build_quantile_levels(quantiles):
+    """
+    Уровни квантилей прогноза.
+    
+    Args:
+        quantiles: True (уровни FORECAST_QUANTILES) или список уровней из (0, 1);
+            None или False - без квантилей
+    
+    Returns:
+        numpy.ndarray: Уровни по возрастанию или None
+    """
+    if quantiles is None or quantiles is False:
+        return None
+    
+    levels = np.unique(np.asarray(FORECAST_QUANTILES if quantiles is True else quantiles, dtype=float))
+    
+    if levels.size == 0 or np.any(levels <= 0) or np.any(levels >= 1):
+        raise ValueError("Уровни квантилей должны лежать в интервале (0, 1)")
+    
+    return levels
+
+def predict_with_quantiles(model, X, quantile_levels=None, chunk_rows=QUANTILE_CHUNK_ROWS):
+    """
+    Прогноз модели и квантили прогнозов отдельных деревьев случайного леса.
+    
+    Каждое дерево прогнозирует всю будущую матрицу частями по chunk_rows строк;
+    точечный прогноз - среднее деревьев (как в RandomForestRegressor.predict),
+    квантили считаются по тем же прогнозам, поэтому деревья обходятся один раз.
+    Для бустинга квантили не оцениваются: его деревья прогнозируют поправки,
+    а не продажи.
+    
+    Args:
+        model: Обученная модель на деревьях
+        X (pandas.DataFrame): Признаки будущих строк
+        quantile_levels (numpy.ndarray, optional): Уровни квантилей
+        chunk_rows (int): Число строк в части матрицы
+    
+    Returns:
+        tuple: (прогнозы строк, квантили уровни x строки или None)
+    """
+    if quantile_levels is None or not isinstance(model, RandomForestRegressor):
+        return model.predict(X), None
+    
+    # Деревья без проверки входа ожидают непрерывный массив float32, как после проверки в predict
+    values = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+    predictions = np.empty(len(values))
+    quantiles = np.empty((len(quantile_levels), len(values)))
+    
+    for start in range(0, len(values), chunk_rows):
+        chunk = values[start:start + chunk_rows]
+        tree_predictions = np.stack([tree.predict(chunk, check_input=False) for tree in model.estimators_])
+        predictions[start:start + chunk_rows] = tree_predictions.sum(axis=0) / len(model.estimators_)
+        quantiles[:, start:start + chunk_rows] = np.quantile(tree_predictions, quantile_levels, axis=0)
+    
+    return predictions, quantiles
+
+def scenario_quantiles(quantiles):
+    """
+    Квантили прогноза по сценариям PRICE_SCENARIOS (без точек сетки цен).
+    
+    Args:
+        quantiles (numpy.ndarray): Квантили уровни x периоды x множители (см. scenario_multipliers)
+    
+    Returns:
+        list: Квантили уровни x периоды x сценарии
+    """
+    return quantiles[:, :, :len(PRICE_SCENARIOS)].tolist()
+
+def quantile_summary(quantile_levels, products=None, values=None):
+    """
+    Квантили прогноза в результате forecast_sales.
+    
+    Args:
+        quantile_levels (numpy.ndarray): Уровни квантилей
+        products (dict, optional): Квантили по продуктам (None для продуктов без оценки)
+        values (list, optional): Квантили общего прогноза без разбивки по продуктам
+    
+    Returns:
+        dict: Уровни, сценарии и квантили уровни x периоды x сценарии
+    """
+    summary = {'levels': quantile_levels.tolist(), 'scenarios': list(PRICE_SCENARIOS)}
+    if products is not None:
+        summary['products'] = products
+    else:
+        summary['values'] = values
+    
+    return summary
+
+def format_forecast(dates, predictions):
+    """
+    Преобразование матрицы прогнозов (периоды x сценарии) в список периодов.
+    
+    Args:
+        dates (numpy.ndarray): Даты периодов
+        predictions (numpy.ndarray): Прогнозы периоды x сценарии PRICE_SCENARIOS (лишние столбцы
+            сетки цен не выводятся)
+    
+    Returns:
+        list: Прогноз по периодам
+    """
+    labels = np.datetime_as_string(np.asarray(dates, dtype='datetime64[D]'), unit='D')
+    
+    return [
+        {
+            'period': i + 1,
+            'date': str(labels[i]),
+            'predictions': dict(zip(PRICE_SCENARIOS, predictions[i].tolist()))
+        }
+        for i in range(len(labels))
+    ]
+
+def future_calendar(last_date, forecast_periods):
+    """
+    Календарные признаки будущих периодов (по одному дню после last_date).
+    
+    Args:
+        last_date (pandas.Timestamp): Последняя дата в данных
+        forecast_periods (int): Количество периодов для прогноза
+    
+    Returns:
+        tuple: (даты периодов, датафрейм календарных признаков)
+    """
+    dates = pd.date_range(last_date + pd.Timedelta(days=1), periods=forecast_periods, freq='D')
+    
+    return dates, calendar_features(dates)
+
+def calendar_dates(df):
+    """
+    Даты строк по календарным признакам year, month и day без разбора строк.
+    
+    Args:
+        df (pandas.DataFrame): Данные с календарными признаками
+    
+    Returns:
+        numpy.ndarray: Даты (NaT для строк без даты)
+    """
+    year, month, day = (df[col].to_numpy(dtype=float) for col in ('year', 'month', 'day'))
+    valid = ~(np.isnan(year) | np.isnan(month) | np.isnan(day))
+    
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype(np.int64).astype('datetime64[M]')
+    dates = months.astype('datetime64[D]') + np.where(valid, day - 1, 0).astype(np.int64).astype('timedelta64[D]')
+    
+    return np.where(valid, dates.astype('datetime64[ns]'), np.datetime64('NaT', 'ns'))
+
+def calendar_features(dates):
+    """
+    Календарные признаки CALENDAR_FEATURES для набора дат.
+    
+    Args:
+        dates (pandas.DatetimeIndex): Даты
+    
+    Returns:
+        pandas.DataFrame: Календарные признаки
+    """
+    return pd.DataFrame({
+        'year': dates.year,
+        'month': dates.month,
+        'day': dates.day,
+        'day_of_week': dates.dayofweek,
+        'week_of_year': dates.isocalendar().week.to_numpy()
+    })
 
 def create_forecast_summary(forecasts_by_product, accuracy_by_product):
     """
@@ -186,11 +1461,12 @@ def create_forecast_summary(forecasts_by_product, accuracy_by_product):
     Returns:
         str: Текстовое резюме
     """
-    summary = "Результаты прогнозирования продаж:\n\n"
+    # Части резюме собираются в список: конкатенация строк в цикле квадратична по числу продуктов
+    summary = ["Результаты прогнозирования продаж:\n\n"]
     
     for product, forecast in forecasts_by_product.items():
-        summary += f"Продукт: {product}\n"
-        summary += f"Точность прогноза: {accuracy_by_product.get(product, 0):.2f}%\n"
+        summary.append(f"Продукт: {product}\n")
+        summary.append(f"Точность прогноза: {accuracy_by_product.get(product, 0):.2f}%\n")
         
         # Анализируем тренд для текущей цены
         first_period = forecast[0]['predictions']['current_price']
@@ -204,21 +1480,21 @@ def create_forecast_summary(forecasts_by_product, accuracy_by_product):
         else:
             trend = "стабильность"
         
-        summary += f"Прогноз на {len(forecast)} периодов показывает {trend} продаж "
-        summary += f"на {abs(change_pct):.1f}% при сохранении текущих цен.\n"
+        summary.append(f"Прогноз на {len(forecast)} периодов показывает {trend} продаж ")
+        summary.append(f"на {abs(change_pct):.1f}% при сохранении текущих цен.\n")
         
         # Оценка влияния изменения цены
         last_current = forecast[-1]['predictions']['current_price']
         last_increased = forecast[-1]['predictions']['increased_price']
         last_decreased = forecast[-1]['predictions']['decreased_price']
         
-        price_elasticity = ((last_decreased - last_increased) / last_current) / 0.1
+        price_elasticity = ((last_decreased - last_increased) / last_current) / 0.1 if last_current else 0
         
         if abs(price_elasticity) > 1:
-            summary += "Продукт проявляет высокую чувствительность к изменению цены.\n"
+            summary.append("Продукт проявляет высокую чувствительность к изменению цены.\n")
         else:
-            summary += "Продукт демонстрирует низкую чувствительность к изменению цены.\n"
+            summary.append("Продукт демонстрирует низкую чувствительность к изменению цены.\n")
         
-        summary += "\n"
+        summary.append("\n")
     
-    return summary
\ No newline at end of file
+    return ''.join(summary)
\ No newline at end of file
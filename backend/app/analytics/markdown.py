@@ -0,0 +1,235 @@
+import numpy as np
+import pandas as pd
+
+from app.analytics.optimization import fit_linear_demand
+
+# Уровни цены по умолчанию (доля текущей цены), от текущей к самой глубокой уценке
+DEFAULT_PRICE_LEVELS = (1.0, 0.9, 0.8, 0.7, 0.6, 0.5)
+
+# Число узлов сетки остатка на продукт
+DEFAULT_STOCK_GRID = 51
+
+def optimize_markdown(df, params=None):
+    """
+    Оптимизация траектории уценки на несколько периодов с учетом остатков.
+    
+    Для каждого продукта выбирается последовательность уровней цены на горизонте
+    (цена не повышается от периода к периоду), максимизирующая выручку от
+    распродажи остатка плюс стоимость нераспроданного остатка по цене salvage.
+    Задача решается динамическим программированием по сетке остатка и
+    уровня цены одновременно для всех продуктов.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        params (dict): Параметры анализа
+    
+    Returns:
+        dict: Траектории цен, ожидаемые продажи и выручка по продуктам
+    """
+    if params is None:
+        params = {}
+    
+    # Определение колонок из параметров или по умолчанию
+    price_col = params.get('price_column', 'price')
+    quantity_col = params.get('quantity_column', 'quantity')
+    product_col = params.get('product_column', 'product')
+    date_col = params.get('date_column', 'date')
+    horizon = int(params.get('horizon', 8))
+    period_days = int(params.get('period_days', 7))
+    # Уровни упорядочиваются от текущей цены к самой глубокой уценке
+    price_levels = np.sort(np.asarray(params.get('price_levels', DEFAULT_PRICE_LEVELS), dtype=float))[::-1]
+    salvage_share = float(params.get('salvage_share', 0))
+    stock_grid_size = int(params.get('stock_grid_size', DEFAULT_STOCK_GRID))
+    
+    # Проверка наличия необходимых колонок
+    required_cols = [price_col, quantity_col]
+    missing_cols = [col for col in required_cols if col not in df.columns]
+    
+    if missing_cols:
+        raise ValueError(f"В данных отсутствуют обязательные колонки: {', '.join(missing_cols)}")
+    
+    if horizon <= 0 or stock_grid_size < 2:
+        raise ValueError("Горизонт и размер сетки остатка должны быть положительными")
+    
+    if product_col in df.columns:
+        codes, products = pd.factorize(df[product_col], sort=True)
+    else:
+        codes, products = np.zeros(len(df), dtype=np.intp), pd.Index(['overall'])
+    
+    demand = fit_linear_demand(codes, df[price_col].to_numpy(dtype=float), df[quantity_col].to_numpy(dtype=float),
+                               len(products))
+    stock = get_stock_on_hand(df, codes, products, params)
+    
+    # Модель описывает продажи за одно наблюдение; пересчет в продажи за период
+    period_scale = np.ones(len(products))
+    if date_col in df.columns:
+        period_scale = observations_per_period(df[date_col], codes, len(products), period_days)
+    
+    # Продажи при каждом уровне цены: продукты x уровни
+    prices = demand['current_price'][:, None] * price_levels[None, :]
+    linear_demand = np.maximum(demand['a'][:, None] + demand['b'][:, None] * prices, 0)
+    period_demand = np.where(demand['valid'][:, None], linear_demand, demand['current_quantity'][:, None])
+    period_demand = np.nan_to_num(period_demand * period_scale[:, None])
+    
+    salvage_value = salvage_share * np.nan_to_num(demand['current_price'])
+    path = solve_markdown_dp(np.nan_to_num(prices), period_demand, stock, salvage_value, horizon, stock_grid_size)
+    
+    level_path, sales, remaining, revenue = path
+    price_path = np.take_along_axis(np.nan_to_num(prices), level_path, axis=1)
+    
+    total_stock = stock.sum()
+    return {
+        'horizon': horizon,
+        'period_days': period_days,
+        'price_levels': price_levels.tolist(),
+        'products': products.tolist(),
+        'price_path': price_path.tolist(),
+        'expected_sales': sales.tolist(),
+        'remaining_stock': remaining.tolist(),
+        'expected_revenue': revenue.tolist(),
+        'total_revenue': float(revenue.sum()),
+        'sell_through_percent': float((total_stock - remaining.sum()) / total_stock * 100) if total_stock > 0 else 0
+    }
+
+def get_stock_on_hand(df, codes, products, params):
+    """
+    Остаток каждого продукта на начало горизонта.
+    
+    Берется из параметра stock ({продукт: остаток}) или из последнего
+    значения колонки stock_column по каждому продукту.
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        codes (numpy.ndarray): Коды продуктов строк
+        products (pandas.Index): Продукты
+        params (dict): Параметры анализа
+    
+    Returns:
+        numpy.ndarray: Остатки по продуктам
+    """
+    stock_col = params.get('stock_column')
+    date_col = params.get('date_column', 'date')
+    
+    if params.get('stock'):
+        lookup = {str(product): value for product, value in params['stock'].items()}
+        return np.array([float(lookup.get(str(product), 0)) for product in products.tolist()])
+    
+    if not stock_col or stock_col not in df.columns:
+        raise ValueError("Для оптимизации уценки нужны остатки (stock или stock_column)")
+    
+    # Последнее значение остатка: по дате, если она есть, иначе по порядку строк
+    frame = pd.DataFrame({'code': codes, 'stock': df[stock_col].to_numpy(dtype=float)})
+    if date_col in df.columns:
+        frame['date'] = pd.to_datetime(df[date_col], errors='coerce').to_numpy()
+        frame = frame.sort_values('date', kind='stable')
+    
+    last = frame[frame['code'] >= 0].groupby('code')['stock'].last()
+    
+    return np.nan_to_num(last.reindex(np.arange(len(products))).to_numpy())
+
+def observations_per_period(dates, codes, n_products, period_days):
+    """
+    Среднее число наблюдений продукта за период длиной period_days.
+    
+    Args:
+        dates (pandas.Series): Даты наблюдений
+        codes (numpy.ndarray): Коды продуктов строк
+        n_products (int): Количество продуктов
+        period_days (int): Длина периода в днях
+    
+    Returns:
+        numpy.ndarray: Масштаб продаж одного наблюдения к периоду
+    """
+    days = pd.to_datetime(dates, errors='coerce')
+    mask = days.notna().to_numpy() & (codes >= 0)
+    day_numbers = (days[mask] - days[mask].min()).dt.days.to_numpy()
+    
+    first = np.full(n_products, np.inf)
+    last = np.full(n_products, -np.inf)
+    np.minimum.at(first, codes[mask], day_numbers)
+    np.maximum.at(last, codes[mask], day_numbers)
+    counts = np.bincount(codes[mask], minlength=n_products)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scale = counts / (last - first + 1) * period_days
+    
+    return np.where(np.isfinite(scale) & (counts > 0), scale, 1.0)
+
+def solve_markdown_dp(prices, period_demand, stock, salvage_value, horizon, stock_grid_size=DEFAULT_STOCK_GRID):
+    """
+    Динамическое программирование по остатку и уровню цены для всех продуктов сразу.
+    
+    Состояние - (остаток, текущий уровень цены); допустимы только переходы к
+    тому же или более глубокому уровню уценки. Сетка остатка у каждого продукта
+    своя (от 0 до начального остатка), значения между узлами интерполируются.
+    
+    Args:
+        prices (numpy.ndarray): Цены продукты x уровни (уровни по убыванию цены)
+        period_demand (numpy.ndarray): Спрос за период продукты x уровни
+        stock (numpy.ndarray): Начальные остатки
+        salvage_value (numpy.ndarray): Стоимость единицы нераспроданного остатка
+        horizon (int): Число периодов
+        stock_grid_size (int): Число узлов сетки остатка
+    
+    Returns:
+        tuple: (уровни цены по периодам, продажи по периодам, конечный остаток, выручка)
+    """
+    n_products, n_levels = prices.shape
+    grid = np.linspace(0, 1, stock_grid_size)[None, :] * stock[:, None]
+    step = np.where(stock > 0, stock / (stock_grid_size - 1), 1.0)
+    rows = np.arange(n_products)[:, None]
+    
+    # Продажи и остаток после периода для каждого узла и уровня: продукты x узлы x уровни
+    sales = np.minimum(period_demand[:, None, :], grid[:, :, None])
+    position = (grid[:, :, None] - sales) / step[:, None, None]
+    lower = np.clip(np.floor(position).astype(np.intp), 0, stock_grid_size - 2)
+    weight = position - lower
+    revenue = prices[:, None, :] * sales
+    
+    # Значение в конце горизонта - стоимость остатка по цене salvage
+    value = np.repeat((salvage_value[:, None] * grid)[:, :, None], n_levels, axis=2)
+    policy = np.empty((horizon, n_products, stock_grid_size, n_levels), dtype=np.int16)
+    
+    for t in range(horizon - 1, -1, -1):
+        # Значение выбора уровня l: выручка периода + интерполированное значение следующего остатка
+        next_value = np.empty_like(revenue)
+        for level in range(n_levels):
+            below = np.take_along_axis(value[:, :, level], lower[:, :, level], axis=1)
+            above = np.take_along_axis(value[:, :, level], lower[:, :, level] + 1, axis=1)
+            next_value[:, :, level] = below + weight[:, :, level] * (above - below)
+        choice_value = revenue + next_value
+        
+        # Из уровня l_prev доступны уровни l >= l_prev: максимум по суффиксу
+        best_value = choice_value[:, :, n_levels - 1].copy()
+        best_level = np.full((n_products, stock_grid_size), n_levels - 1, dtype=np.int16)
+        value = np.empty_like(choice_value)
+        value[:, :, n_levels - 1] = best_value
+        policy[t, :, :, n_levels - 1] = best_level
+        for level in range(n_levels - 2, -1, -1):
+            is_better = choice_value[:, :, level] >= best_value
+            best_value = np.where(is_better, choice_value[:, :, level], best_value)
+            best_level = np.where(is_better, level, best_level)
+            value[:, :, level] = best_value
+            policy[t, :, :, level] = best_level
+    
+    # Прямой проход: начинаем с полного остатка на текущем уровне цены
+    current_stock = stock.astype(float).copy()
+    current_level = np.zeros(n_products, dtype=np.intp)
+    level_path = np.empty((n_products, horizon), dtype=np.intp)
+    sales_path = np.empty((n_products, horizon))
+    total_revenue = np.zeros(n_products)
+    
+    for t in range(horizon):
+        node = np.clip(np.rint(current_stock / step).astype(np.intp), 0, stock_grid_size - 1)
+        level = policy[t, rows[:, 0], node, current_level].astype(np.intp)
+        period_sales = np.minimum(period_demand[rows[:, 0], level], current_stock)
+        
+        level_path[:, t] = level
+        sales_path[:, t] = period_sales
+        total_revenue += prices[rows[:, 0], level] * period_sales
+        current_stock -= period_sales
+        current_level = level
+    
+    total_revenue += salvage_value * current_stock
+    
+    return level_path, sales_path, current_stock, total_revenue
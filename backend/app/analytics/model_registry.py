@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import joblib
+import pandas as pd
+
+# Расширение файлов сохраненных моделей
+MODEL_SUFFIX = '.joblib'
+
+def data_fingerprint(df):
+    """
+    Хеш содержимого данных (значений и порядка строк).
+    
+    Args:
+        df (pandas.DataFrame): Данные, на которых обучается модель
+    
+    Returns:
+        str: Шестнадцатеричный хеш
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()
+
+def model_key(content_hash, product, hyperparams):
+    """
+    Ключ модели в реестре: хеш данных, продукт и гиперпараметры обучения.
+    
+    Args:
+        content_hash (str): Хеш данных (см. data_fingerprint)
+        product: Продукт (None - модель без разбивки по продуктам)
+        hyperparams (dict): Гиперпараметры и признаки модели
+    
+    Returns:
+        str: Ключ модели
+    """
+    key_params = {
+        'content_hash': content_hash,
+        'product': None if product is None else str(product),
+        'hyperparams': hyperparams
+    }
+    
+    return hashlib.sha1(json.dumps(key_params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def load_model(directory, key, mmap_mode='r'):
+    """
+    Загрузка модели из реестра с отображением массивов деревьев в память.
+    
+    Время изменения файла обновляется при каждом чтении и служит временем
+    последнего использования для вытеснения (см. evict_models).
+    
+    Args:
+        directory (str): Директория реестра
+        key (str): Ключ модели
+        mmap_mode (str, optional): Режим отображения в память (None - загрузка в память
+            для модели, которая будет изменяться)
+    
+    Returns:
+        object: Сохраненный объект или None, если модели нет в реестре
+    """
+    path = os.path.join(directory, key + MODEL_SUFFIX)
+    
+    try:
+        os.utime(path)
+        return joblib.load(path, mmap_mode=mmap_mode)
+    except (OSError, EOFError, ValueError):
+        # Файла нет, он удален при вытеснении или поврежден - модель обучается заново
+        return None
+
+def save_model(directory, key, obj):
+    """
+    Сохранение модели в реестр без сжатия (иначе отображение в память невозможно).
+    
+    Запись идет во временный файл с последующим переименованием, поэтому
+    параллельные процессы не читают частично записанную модель.
+    
+    Args:
+        directory (str): Директория реестра
+        key (str): Ключ модели
+        obj (object): Модель и связанные с ней данные
+    """
+    os.makedirs(directory, exist_ok=True)
+    
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(handle)
+    try:
+        joblib.dump(obj, temp_path)
+        os.replace(temp_path, os.path.join(directory, key + MODEL_SUFFIX))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def evict_models(directory, max_bytes):
+    """
+    Удаление давно не использованных моделей, пока реестр превышает лимит.
+    
+    Args:
+        directory (str): Директория реестра
+        max_bytes (int): Лимит размера реестра в байтах (0 или None - без лимита)
+    
+    Returns:
+        int: Количество удаленных моделей
+    """
+    if not max_bytes or not os.path.isdir(directory):
+        return 0
+    
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(MODEL_SUFFIX):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    
+    # Сначала удаляются модели с самым давним использованием
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    
+    return removed
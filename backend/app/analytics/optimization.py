@@ -1,14 +1,39 @@
 import numpy as np
 import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
 from scipy.optimize import minimize
 
-def optimize_prices(df, params=None):
+from app.analytics.elasticity import aggregate_elasticity_stats, elasticities_from_stats
+from app.analytics.regression import STAT_COLUMNS, grouped_sufficient_stats, has_variation, ols_from_stats
+
+# Режимы оптимизации: независимо по продуктам, совместно для всего каталога,
+# по постоянной эластичности логарифмической модели или на сетке допустимых цен
+OPTIMIZATION_MODES = ('independent', 'portfolio', 'constant_elasticity', 'discrete')
+
+# Число цен-кандидатов на продукт, порождаемых окончаниями цен
+DEFAULT_LADDER_SIZE = 50
+
+# Число точек на границе Парето выручка - прибыль
+DEFAULT_FRONTIER_POINTS = 21
+
+# Допустимое нарушение ограничений совместной оптимизации (в относительных единицах)
+CONSTRAINT_TOLERANCE = 1e-6
+
+# Параметры моделей спроса продукта (см. fit_linear_demand)
+DEMAND_KEYS = ('a', 'b', 'cost', 'current_price', 'current_quantity', 'min_price', 'max_price', 'valid')
+
+def optimize_prices(df, params=None, previous_result=None, elasticities=None):
     """
     Оптимизация цен для максимизации прибыли.
     
     Args:
         df (pandas.DataFrame): Датафрейм с данными о продажах
         params (dict): Параметры анализа
+        previous_result (dict, optional): Предыдущий результат этого анализа; продукты
+            с неизменными входными строками берут модели спроса и цены из него без подгонки и пересчета
+        elasticities (dict, optional): Рассчитанные ранее эластичности {продукт: эластичность}
+            для режима constant_elasticity; по умолчанию оцениваются по df
     
     Returns:
         dict: Результаты оптимизации цен
@@ -21,6 +46,10 @@ def optimize_prices(df, params=None):
     quantity_col = params.get('quantity_column', 'quantity')
     product_col = params.get('product_column', 'product')
     cost_col = params.get('cost_column')  # Колонка с себестоимостью (опционально)
+    mode = params.get('optimization_mode', 'independent')
+    
+    if mode not in OPTIMIZATION_MODES:
+        raise ValueError(f"Неизвестный режим оптимизации: {mode}")
     
     # Проверка наличия необходимых колонок
     required_cols = [price_col, quantity_col]
@@ -29,109 +58,816 @@ def optimize_prices(df, params=None):
     if missing_cols:
         raise ValueError(f"В данных отсутствуют обязательные колонки: {', '.join(missing_cols)}")
     
-    # Инициализация результатов
-    result = {
-        'optimal_prices': {},
-        'expected_profit_increase': 0,
-        'expected_revenue_change': 0,
-        'price_recommendations': []
-    }
-    
-    # Если есть колонка с продуктами, оптимизируем по каждому продукту
+    # Если есть колонка с продуктами, оптимизируем по каждому продукту,
+    # иначе делаем общую оптимизацию
     if product_col in df.columns:
-        current_profit = 0
-        optimized_profit = 0
-        current_revenue = 0
-        optimized_revenue = 0
+        codes, products = pd.factorize(df[product_col], sort=True)
+    else:
+        codes, products = np.zeros(len(df), dtype=np.intp), pd.Index(['overall'])
+    
+    costs = None
+    if cost_col and cost_col in df.columns:
+        costs = df[cost_col].to_numpy(dtype=float)
+    
+    prices = df[price_col].to_numpy(dtype=float)
+    quantities = df[quantity_col].to_numpy(dtype=float)
+    
+    if mode == 'constant_elasticity':
+        if costs is None:
+            raise ValueError("Для оптимизации по постоянной эластичности нужна колонка себестоимости")
         
-        for product, group in df.groupby(product_col):
-            # Рассчитываем оптимальную цену
-            optimal_price, expected_quantity, current_price_avg, current_quantity_avg = find_optimal_price(
-                group, price_col, quantity_col, cost_col
-            )
-            
-            result['optimal_prices'][product] = optimal_price
-            
-            # Расчет текущей и ожидаемой прибыли
-            current_cost = 0
-            if cost_col and cost_col in group.columns:
-                current_cost = group[cost_col].mean()
-            
-            current_product_profit = (current_price_avg - current_cost) * current_quantity_avg
-            optimized_product_profit = (optimal_price - current_cost) * expected_quantity
-            
-            current_profit += current_product_profit
-            optimized_profit += optimized_product_profit
-            
-            current_revenue += current_price_avg * current_quantity_avg
-            optimized_revenue += optimal_price * expected_quantity
-            
-            # Добавляем рекомендацию
-            change_pct = ((optimal_price - current_price_avg) / current_price_avg) * 100
-            direction = "повышение" if change_pct > 0 else "снижение"
-            
-            recommendation = {
-                'product': product,
-                'current_price': current_price_avg,
-                'optimal_price': optimal_price,
-                'price_change_percent': change_pct,
-                'expected_quantity': expected_quantity,
-                'current_quantity': current_quantity_avg,
-                'quantity_change_percent': ((expected_quantity - current_quantity_avg) / current_quantity_avg) * 100,
-                'recommendation': f"Рекомендуется {direction} цены на {abs(change_pct):.1f}% для максимизации прибыли."
-            }
-            
-            result['price_recommendations'].append(recommendation)
+        if elasticities is None:
+            elasticities = estimate_product_elasticities(df, params)
         
-        # Расчет ожидаемого увеличения прибыли
-        if current_profit > 0:
-            result['expected_profit_increase'] = ((optimized_profit - current_profit) / current_profit) * 100
+        # Названия продуктов сравниваются как строки, как в сохраненной статистике
+        if product_col in df.columns:
+            lookup = {str(product): value for product, value in elasticities.items()}
+            product_elasticities = np.array([lookup.get(str(product), np.nan) for product in products.tolist()])
+        else:
+            product_elasticities = np.array([elasticities.get(None, np.nan)])
         
-        # Расчет ожидаемого изменения выручки
-        if current_revenue > 0:
-            result['expected_revenue_change'] = ((optimized_revenue - current_revenue) / current_revenue) * 100
+        demand = fit_linear_demand(codes, prices, quantities, len(products), costs)
+        optimal_price, expected_quantity = constant_elasticity_prices(demand, product_elasticities)
+        return build_optimization_result(products, demand, optimal_price, expected_quantity)
+    
+    # Хеши исходных строк сравниваются с прошлым запуском до подгонки моделей
+    fingerprints = input_fingerprints(codes, prices, quantities, len(products), costs)
+    reused, optimal_price, expected_quantity, demand = match_previous_state(products, fingerprints, previous_result)
+    
+    # Модели спроса подгоняются только по строкам изменившихся продуктов
+    if not reused.all():
+        fit_codes = np.where((codes >= 0) & ~reused[codes], codes, -1)
+        fitted = fit_linear_demand(fit_codes, prices, quantities, len(products), costs)
+        for key, values in fitted.items():
+            demand[key][~reused] = values[~reused]
+    
+    # Пересчитываются только изменившиеся продукты; прошлые цены - начальное приближение
+    recompute = ~reused
+    if recompute.any():
+        changed = {key: values[recompute] for key, values in demand.items()}
+        optimal_price[recompute], expected_quantity[recompute] = optimal_linear_prices(
+            changed, initial_price=optimal_price[recompute]
+        )
+    
+    # Состояние для следующего запуска хранит цены независимой оптимизации
+    state = {
+        'products': products.tolist(),
+        'fingerprints': fingerprints.tolist(),
+        'prices': optimal_price.tolist(),
+        'quantities': expected_quantity.tolist(),
+        'demand': {key: values.tolist() for key, values in demand.items()}
+    }
+    
+    # Граница Парето строится по независимым моделям спроса
+    frontier = None
+    if params.get('pareto_frontier'):
+        frontier = revenue_profit_frontier(
+            demand, optimal_price, int(params.get('frontier_points', DEFAULT_FRONTIER_POINTS))
+        )
+    
+    if mode == 'portfolio':
+        optimal_price, expected_quantity = optimize_portfolio_prices(products, demand, optimal_price, params)
+    elif mode == 'discrete':
+        optimal_price, expected_quantity = discrete_optimal_prices(products, demand, optimal_price, params)
+    
+    result = build_optimization_result(products, demand, optimal_price, expected_quantity)
+    result['warm_start'] = {
+        'reused_products': int(reused.sum()),
+        'recomputed_products': int(recompute.sum())
+    }
+    result['warm_start_state'] = state
+    
+    if frontier is not None:
+        result['pareto_frontier'] = frontier
+    
+    return result
+
+def evaluate_price_scenarios(df, params=None):
+    """
+    Оценка спроса, выручки и прибыли для набора сценариев цен.
+    
+    Сценарии задаются параметром scenarios:
+        products - продукты (по умолчанию все продукты в порядке сортировки)
+        prices - матрица цен продукты x сценарии
+        price_changes - матрица изменений цен в % к текущей цене (вместо prices)
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        params (dict): Параметры анализа
+    
+    Returns:
+        dict: Матрицы количества, выручки и прибыли продукты x сценарии и итоги по сценариям
+    """
+    if params is None:
+        params = {}
+    
+    # Определение колонок из параметров или по умолчанию
+    price_col = params.get('price_column', 'price')
+    quantity_col = params.get('quantity_column', 'quantity')
+    product_col = params.get('product_column', 'product')
+    cost_col = params.get('cost_column')
+    scenarios = params.get('scenarios') or {}
+    
+    if not isinstance(scenarios, dict):
+        raise ValueError("Сценарии должны быть объектом с полями products, prices или price_changes")
+    
+    # Проверка наличия необходимых колонок
+    required_cols = [price_col, quantity_col]
+    missing_cols = [col for col in required_cols if col not in df.columns]
+    
+    if missing_cols:
+        raise ValueError(f"В данных отсутствуют обязательные колонки: {', '.join(missing_cols)}")
+    
+    if product_col in df.columns:
+        codes, products = pd.factorize(df[product_col], sort=True)
     else:
-        # Если нет колонки с продуктами, делаем общую оптимизацию
-        optimal_price, expected_quantity, current_price_avg, current_quantity_avg = find_optimal_price(
-            df, price_col, quantity_col, cost_col
+        codes, products = np.zeros(len(df), dtype=np.intp), pd.Index(['overall'])
+    
+    costs = None
+    if cost_col and cost_col in df.columns:
+        costs = df[cost_col].to_numpy(dtype=float)
+    
+    demand = fit_linear_demand(codes, df[price_col].to_numpy(dtype=float), df[quantity_col].to_numpy(dtype=float),
+                               len(products), costs)
+    
+    # Продукты сценариев: названия приводятся к строкам, как в JSON параметров
+    scenario_products = scenarios.get('products', products.tolist())
+    if not isinstance(scenario_products, list):
+        raise ValueError("Продукты сценариев должны быть списком")
+    product_index = {str(product): i for i, product in enumerate(products.tolist())}
+    unknown = [product for product in scenario_products if str(product) not in product_index]
+    if unknown:
+        raise ValueError(f"Неизвестный продукт в сценариях: {unknown[0]}")
+    rows = np.array([product_index[str(product)] for product in scenario_products], dtype=np.intp)
+    
+    demand = {key: values[rows] for key, values in demand.items()}
+    
+    # Нечисловые и неровные матрицы из JSON дают TypeError или ValueError numpy
+    try:
+        if 'prices' in scenarios:
+            prices = np.asarray(scenarios['prices'], dtype=float)
+        elif 'price_changes' in scenarios:
+            prices = demand['current_price'][:, None] * (1 + np.asarray(scenarios['price_changes'], dtype=float) / 100)
+        else:
+            raise ValueError("Не заданы цены сценариев (prices или price_changes)")
+    except TypeError:
+        raise ValueError("Цены сценариев должны быть числовой матрицей продукты x сценарии")
+    
+    if prices.ndim != 2 or prices.shape[0] != len(rows):
+        raise ValueError("Матрица цен сценариев должна иметь размер продукты x сценарии")
+    
+    quantity, revenue, profit = evaluate_linear_scenarios(demand, prices)
+    
+    current_revenue = np.nansum(demand['current_price'] * demand['current_quantity'])
+    current_profit = np.nansum((demand['current_price'] - demand['cost']) * demand['current_quantity'])
+    total_revenue = revenue.sum(axis=0)
+    total_profit = profit.sum(axis=0)
+    
+    return {
+        'products': [products.tolist()[i] for i in rows.tolist()],
+        'scenario_count': int(prices.shape[1]),
+        'expected_quantity': quantity.tolist(),
+        'revenue': revenue.tolist(),
+        'profit': profit.tolist(),
+        'total_revenue': total_revenue.tolist(),
+        'total_profit': total_profit.tolist(),
+        'current_revenue': float(current_revenue),
+        'current_profit': float(current_profit),
+        'best_scenario': int(np.argmax(total_profit)) if prices.shape[1] else None
+    }
+
+def evaluate_linear_scenarios(demand, prices):
+    """
+    Расчет количества, выручки и прибыли для матрицы цен одной операцией.
+    
+    Продукты без вариации цены сохраняют текущий объем продаж,
+    отрицательный спрос линейной модели заменяется нулем.
+    
+    Args:
+        demand (dict): Модели спроса (см. fit_linear_demand)
+        prices (numpy.ndarray): Цены формы (продукты, сценарии)
+    
+    Returns:
+        tuple: (количества, выручка, прибыль) формы (продукты, сценарии)
+    """
+    a, b, cost = demand['a'][:, None], demand['b'][:, None], demand['cost'][:, None]
+    
+    quantity = np.where(demand['valid'][:, None], np.maximum(a + b * prices, 0), demand['current_quantity'][:, None])
+    revenue = prices * quantity
+    profit = (prices - cost) * quantity
+    
+    return quantity, revenue, profit
+
+def fit_linear_demand(codes, prices, quantities, n_groups, costs=None):
+    """
+    Подгонка линейной модели спроса quantity = a + b * price для всех продуктов сразу.
+    
+    Args:
+        codes (numpy.ndarray): Целочисленные коды продуктов (отрицательные - пропуск)
+        prices (numpy.ndarray): Цены
+        quantities (numpy.ndarray): Количества
+        n_groups (int): Количество продуктов
+        costs (numpy.ndarray, optional): Себестоимость для каждой строки
+    
+    Returns:
+        dict: Массивы a, b, cost, current_price, current_quantity, min_price, max_price
+            и признак вариации цены valid
+    """
+    # Строки без продукта, цены или количества в модель не входят
+    mask = (codes >= 0) & np.isfinite(prices) & np.isfinite(quantities)
+    stats = grouped_sufficient_stats(codes[mask], prices[mask], quantities[mask], n_groups)
+    
+    n = stats[:, 0]
+    valid = has_variation(stats)
+    b, a = ols_from_stats(stats, valid=valid)
+    
+    # Средняя себестоимость продукта (пропуски не учитываются)
+    cost = np.zeros(n_groups)
+    if costs is not None:
+        has_cost = (codes >= 0) & np.isfinite(costs)
+        cost_count = np.bincount(codes[has_cost], minlength=n_groups)
+        cost_sum = np.bincount(codes[has_cost], weights=costs[has_cost], minlength=n_groups)
+        cost = np.divide(cost_sum, cost_count, out=cost, where=cost_count > 0)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'a': a,
+            'b': b,
+            'cost': cost,
+            'current_price': stats[:, 1] / n,
+            'current_quantity': stats[:, 2] / n,
+            'min_price': stats[:, 5],
+            'max_price': stats[:, 6],
+            'valid': valid
+        }
+
+def estimate_product_elasticities(df, params=None):
+    """
+    Эластичности продуктов по логарифмической модели (как в calculate_elasticity).
+    
+    Args:
+        df (pandas.DataFrame): Датафрейм с данными о продажах
+        params (dict): Параметры анализа
+    
+    Returns:
+        dict: Эластичность по продуктам (None - данные без колонки продуктов)
+    """
+    stats = aggregate_elasticity_stats(df, params)
+    overall = stats[stats['period_type'] == 'all']
+    values = elasticities_from_stats(overall[list(STAT_COLUMNS)].to_numpy(dtype=float))
+    
+    return dict(zip(overall['product'].tolist(), values.tolist()))
+
+def constant_elasticity_prices(demand, elasticities):
+    """
+    Оптимальные цены при постоянной эластичности спроса для всех продуктов.
+    
+    При q = q0 * (p / p0)^e и e < -1 прибыль максимальна при наценке
+    p = cost * e / (1 + e). Для неэластичного спроса (e >= -1) и продуктов без
+    себестоимости аналитического максимума нет, и цена остается текущей.
+    
+    Args:
+        demand (dict): Модели спроса (см. fit_linear_demand), используются текущие
+            цены, количества и себестоимость
+        elasticities (numpy.ndarray): Эластичности продуктов (NaN - не рассчитана)
+    
+    Returns:
+        tuple: (оптимальные цены, ожидаемые количества)
+    """
+    current_price = demand['current_price']
+    current_quantity = demand['current_quantity']
+    cost = demand['cost']
+    
+    has_optimum = (elasticities < -1) & (cost > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        optimal_price = np.where(has_optimum, cost * elasticities / (1 + elasticities), current_price)
+        expected_quantity = np.where(
+            has_optimum, current_quantity * (optimal_price / current_price) ** elasticities, current_quantity
+        )
+    
+    return optimal_price, expected_quantity
+
+def input_fingerprints(codes, prices, quantities, n_groups, costs=None):
+    """
+    Хеши исходных данных каждого продукта: числа строк и их цен, количеств и себестоимости.
+    
+    Хеш строки умножается на нечетный множитель ее позиции внутри продукта,
+    поэтому перестановка строк продукта тоже меняет его хеш. Совпадение хеша
+    означает те же входные строки, и продукт можно не подгонять и не пересчитывать.
+    
+    Args:
+        codes (numpy.ndarray): Целочисленные коды продуктов (отрицательные - пропуск)
+        prices (numpy.ndarray): Цены
+        quantities (numpy.ndarray): Количества
+        n_groups (int): Количество продуктов
+        costs (numpy.ndarray, optional): Себестоимость для каждой строки
+    
+    Returns:
+        numpy.ndarray: Хеши uint64 по продуктам
+    """
+    mask = codes >= 0
+    rows = pd.DataFrame({
+        'price': prices[mask],
+        'quantity': quantities[mask],
+        'cost': costs[mask] if costs is not None else np.nan
+    })
+    row_hashes = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+    
+    # Строки группируются по продукту с сохранением исходного порядка
+    order = np.argsort(codes[mask], kind='stable')
+    group_codes = codes[mask][order]
+    counts = np.bincount(group_codes, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    positions = np.arange(len(group_codes)) - starts[group_codes]
+    weights = pd.util.hash_array(positions.astype(np.uint64)) | np.uint64(1)
+    
+    # Суммы по модулю 2^64 считаются в uint64 без потери точности
+    sums = np.zeros(n_groups, dtype=np.uint64)
+    present = counts > 0
+    if present.any():
+        sums[present] = np.add.reduceat(row_hashes[order] * weights, starts[present])
+    
+    return pd.util.hash_pandas_object(pd.DataFrame({'rows': counts, 'hash': sums}), index=False).to_numpy()
+
+def match_previous_state(products, fingerprints, previous_result=None):
+    """
+    Сопоставление продуктов с состоянием предыдущего запуска оптимизации.
+    
+    Args:
+        products (pandas.Index): Продукты
+        fingerprints (numpy.ndarray): Хеши входных данных (см. input_fingerprints)
+        previous_result (dict, optional): Предыдущий результат оптимизации
+    
+    Returns:
+        tuple: (признак продуктов без изменений, прошлые цены, прошлые количества,
+            модели спроса); для продуктов без прошлого состояния цены, количества
+            и параметры моделей равны NaN
+    """
+    n_products = len(products)
+    reused = np.zeros(n_products, dtype=bool)
+    prices = np.full(n_products, np.nan)
+    quantities = np.full(n_products, np.nan)
+    demand = {key: np.full(n_products, np.nan) for key in DEMAND_KEYS}
+    demand['valid'] = np.zeros(n_products, dtype=bool)
+    
+    # Состояния без моделей спроса (старый формат) не используются
+    state = (previous_result or {}).get('warm_start_state')
+    if not state or 'demand' not in state:
+        return reused, prices, quantities, demand
+    
+    # Названия продуктов сравниваются как строки: ключи JSON всегда строковые
+    index = {str(product): i for i, product in enumerate(state['products'])}
+    positions = np.array([index.get(str(product), -1) for product in products.tolist()], dtype=np.intp)
+    known = positions >= 0
+    
+    previous_fingerprints = np.asarray(state['fingerprints'], dtype=np.uint64)
+    prices[known] = np.asarray(state['prices'], dtype=float)[positions[known]]
+    quantities[known] = np.asarray(state['quantities'], dtype=float)[positions[known]]
+    reused[known] = previous_fingerprints[positions[known]] == fingerprints[known]
+    
+    for key, values in demand.items():
+        stored = np.asarray(state['demand'][key], dtype=values.dtype)
+        values[reused] = stored[positions[reused]]
+    
+    return reused, prices, quantities, demand
+
+def optimal_linear_prices(demand, initial_price=None):
+    """
+    Оптимальные цены линейной модели спроса для всех продуктов.
+    
+    При b < 0 прибыль (p - cost) * (a + b * p) вогнута и максимальна при
+    p = (b * cost - a) / (2 * b). Численная оптимизация нужна только
+    продуктам с неубывающим спросом, у которых такого максимума нет:
+    для них цена ищется в пределах наблюдавшегося диапазона.
+    
+    Args:
+        demand (dict): Модели спроса (см. fit_linear_demand)
+        initial_price (numpy.ndarray, optional): Начальные приближения для численной
+            оптимизации (например, цены прошлого запуска); NaN - текущая цена
+    
+    Returns:
+        tuple: (оптимальные цены, ожидаемые количества)
+    """
+    a, b, cost = demand['a'], demand['b'], demand['cost']
+    valid = demand['valid']
+    
+    if initial_price is None:
+        initial_price = demand['current_price']
+    initial_price = np.where(np.isfinite(initial_price), initial_price, demand['current_price'])
+    
+    has_optimum = valid & (b < 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        optimal_price = np.where(has_optimum, (b * cost - a) / (2 * b), demand['current_price'])
+    
+    for i in np.flatnonzero(valid & ~has_optimum):
+        optimal_price[i] = solve_optimal_price(
+            a[i], b[i], cost[i], initial_price[i], (demand['min_price'][i], demand['max_price'][i])
         )
+    
+    expected_quantity = a + b * optimal_price
+    
+    # Без вариации цены или при отрицательном количестве (нереалистично) оставляем текущую цену
+    keep_current = ~valid | ~(expected_quantity >= 0)
+    optimal_price = np.where(keep_current, demand['current_price'], optimal_price)
+    expected_quantity = np.where(keep_current, demand['current_quantity'], expected_quantity)
+    
+    return optimal_price, expected_quantity
+
+def revenue_profit_frontier(demand, optimal_price, n_points=DEFAULT_FRONTIER_POINTS):
+    """
+    Граница Парето между выручкой и прибылью для каждого продукта и каталога.
+    
+    Для веса w максимизируется w * прибыль + (1 - w) * выручка = (p - w * cost) * q(p),
+    что для линейного спроса с b < 0 дает p = (b * w * cost - a) / (2 * b).
+    Все веса и продукты считаются одной матрицей; так как задача сепарабельна,
+    суммы по продуктам при одном весе дают точки границы всего каталога.
+    Продукты без убывающего спроса остаются на оптимальной цене.
+    
+    Args:
+        demand (dict): Модели спроса (см. fit_linear_demand)
+        optimal_price (numpy.ndarray): Цены независимой оптимизации прибыли
+        n_points (int): Число весов от 0 (только выручка) до 1 (только прибыль)
+    
+    Returns:
+        dict: Веса, итоги каталога и матрицы продукты x веса (цены, выручка, прибыль)
+    """
+    weights = np.linspace(0, 1, max(n_points, 2))
+    a, b, cost = demand['a'][:, None], demand['b'][:, None], demand['cost'][:, None]
+    
+    has_optimum = (demand['valid'] & (demand['b'] < 0))[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prices = np.where(has_optimum, (b * weights[None, :] * cost - a) / (2 * b), optimal_price[:, None])
+    
+    # При отрицательном спросе (нереалистично) остается оптимальная цена
+    prices = np.where(a + b * prices >= 0, prices, optimal_price[:, None])
+    _, revenue, profit = evaluate_linear_scenarios(demand, prices)
+    
+    return {
+        'weights': weights.tolist(),
+        'revenue': np.nansum(revenue, axis=0).tolist(),
+        'profit': np.nansum(profit, axis=0).tolist(),
+        'product_prices': prices.tolist(),
+        'product_revenue': revenue.tolist(),
+        'product_profit': profit.tolist()
+    }
+
+def optimize_portfolio_prices(products, demand, independent_price, params=None):
+    """
+    Совместная оптимизация цен всего каталога с ограничениями.
+    
+    Поддерживаемые параметры:
+        max_average_price_change - предельное изменение средней цены корзины, %
+            (цены взвешены текущими объемами продаж)
+        max_price_change - предельное изменение цены каждого продукта, %
+        price_bounds - словарь {продукт: [мин. цена, макс. цена]}, границы могут быть None
+        price_ordering - список пар [продукт, продукт], цена первого не ниже цены второго
+    
+    Продукты без убывающей линейной модели спроса остаются на цене
+    независимой оптимизации и участвуют в ограничениях как константы.
+    
+    Args:
+        products (pandas.Index): Продукты
+        demand (dict): Модели спроса (см. fit_linear_demand)
+        independent_price (numpy.ndarray): Цены независимой оптимизации
+        params (dict): Параметры анализа
+    
+    Returns:
+        tuple: (оптимальные цены, ожидаемые количества)
+    """
+    if params is None:
+        params = {}
+    
+    a, b, cost = demand['a'], demand['b'], demand['cost']
+    current_price = demand['current_price']
+    current_quantity = demand['current_quantity']
+    n_products = len(products)
+    # Продукты в параметрах из JSON - строки, поэтому сравнение идет по строковому виду
+    product_index = {str(product): i for i, product in enumerate(products.tolist())}
+    
+    def index_of(product):
+        if str(product) not in product_index:
+            raise ValueError(f"Неизвестный продукт в ограничениях: {product}")
+        return product_index[str(product)]
+    
+    # Границы цен: положительность, коридор изменения и заданные вручную
+    lower = np.zeros(n_products)
+    upper = np.full(n_products, np.inf)
+    
+    max_price_change = params.get('max_price_change')
+    if max_price_change is not None:
+        lower = np.maximum(lower, current_price * (1 - max_price_change / 100))
+        upper = np.minimum(upper, current_price * (1 + max_price_change / 100))
+    
+    for product, bounds in (params.get('price_bounds') or {}).items():
+        i = index_of(product)
+        min_price, max_price = bounds
+        if min_price is not None:
+            lower[i] = max(lower[i], min_price)
+        if max_price is not None:
+            upper[i] = min(upper[i], max_price)
+    
+    conflicting = np.flatnonzero(lower > upper)
+    if len(conflicting):
+        raise ValueError(f"Несовместимые границы цены для продукта: {products[conflicting[0]]}")
+    
+    # Прибыль (p - cost) * (a + b * p) вогнута только при b < 0
+    is_variable = demand['valid'] & (b < 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Цена, при которой ожидаемое количество обращается в ноль
+        zero_demand_price = np.where(is_variable, -a / b, np.inf)
+    upper = np.where(is_variable, np.maximum(lower, np.minimum(upper, zero_demand_price)), upper)
+    
+    fixed_price = np.clip(independent_price, lower, upper)
+    lower = np.where(is_variable, lower, fixed_price)
+    upper = np.where(is_variable, upper, fixed_price)
+    
+    # Переменные - относительные цены p / current_price, что выравнивает масштаб задачи
+    scale = np.where(current_price > 0, current_price, 1.0)
+    hessian = np.where(is_variable, -2 * b * scale * scale, 1.0)
+    linear = np.where(is_variable, (a - b * cost) * scale, fixed_price / scale)
+    
+    rows, rhs = [], []
+    
+    max_average_change = params.get('max_average_price_change')
+    if max_average_change is not None:
+        # Индекс цены корзины: sum(q0 * p) / sum(q0 * p0)
+        basket_weights = np.nan_to_num(current_quantity * scale) / np.nansum(current_quantity * current_price)
+        basket = sparse.csr_matrix(basket_weights[None, :])
+        rows += [basket, -basket]
+        rhs += [1 + max_average_change / 100, -(1 - max_average_change / 100)]
+    
+    ordering = params.get('price_ordering') or []
+    if ordering:
+        higher = np.array([index_of(pair[0]) for pair in ordering])
+        lower_products = np.array([index_of(pair[1]) for pair in ordering])
+        count = len(ordering)
         
-        result['optimal_prices']['overall'] = optimal_price
+        # p_lower - p_higher <= 0
+        ordering_rows = sparse.csr_matrix((
+            np.concatenate([scale[lower_products], -scale[higher]]),
+            (np.tile(np.arange(count), 2), np.concatenate([lower_products, higher]))
+        ), shape=(count, n_products))
+        rows.append(ordering_rows)
+        rhs.append(np.zeros(count))
+    
+    relative_price = solve_separable_qp(
+        hessian, linear, lower / scale, upper / scale,
+        sparse.vstack(rows).tocsr() if rows else None, np.hstack(rhs) if rhs else None
+    )
+    
+    optimal_price = relative_price * scale
+    
+    # Продукты без модели спроса сохраняют текущий объем
+    expected_quantity = np.where(demand['valid'], np.maximum(a + b * optimal_price, 0), current_quantity)
+    
+    return optimal_price, expected_quantity
+
+def discrete_optimal_prices(products, demand, continuous_price, params=None):
+    """
+    Выбор лучшей цены из допустимых ценовых точек для всех продуктов.
+    
+    Поддерживаемые параметры:
+        price_ladder - список допустимых цен или словарь {продукт: [цены]}
+        price_endings - допустимые окончания цен (например, [0.99, 0.49]), если
+            лестница не задана; кандидаты строятся вокруг непрерывного оптимума
+        price_step - шаг целой части цены для окончаний (по умолчанию 1)
+        ladder_size - число кандидатов на продукт для окончаний
+        max_price_change - предельное изменение цены каждого продукта, %
+    
+    Все кандидаты оцениваются одной матрицей продукты x цены по линейным
+    моделям спроса.
+    
+    Args:
+        products (pandas.Index): Продукты
+        demand (dict): Модели спроса (см. fit_linear_demand)
+        continuous_price (numpy.ndarray): Цены непрерывной оптимизации
+        params (dict): Параметры анализа
+    
+    Returns:
+        tuple: (оптимальные цены, ожидаемые количества)
+    """
+    if params is None:
+        params = {}
+    
+    current_price = demand['current_price']
+    candidates = build_price_candidates(products, continuous_price, params)
+    
+    # Допустимые точки: положительная цена в коридоре изменения
+    with np.errstate(invalid='ignore'):
+        feasible = np.isfinite(candidates) & (candidates > 0)
         
-        # Расчет текущей и ожидаемой прибыли
-        current_cost = 0
-        if cost_col and cost_col in df.columns:
-            current_cost = df[cost_col].mean()
+        max_price_change = params.get('max_price_change')
+        if max_price_change is not None:
+            feasible &= np.abs(candidates / current_price[:, None] - 1) <= max_price_change / 100 + 1e-12
         
-        current_profit = (current_price_avg - current_cost) * current_quantity_avg
-        optimized_profit = (optimal_price - current_cost) * expected_quantity
+        # Без убывающего спроса прибыль растет с ценой, поэтому цена ограничена наблюдавшимся диапазоном
+        has_optimum = demand['b'] < 0
+        feasible &= has_optimum[:, None] | (
+            (candidates >= demand['min_price'][:, None]) & (candidates <= demand['max_price'][:, None])
+        )
+    
+    quantity, _, profit = evaluate_linear_scenarios(demand, np.where(feasible, candidates, 0))
+    best = np.argmax(np.where(feasible, profit, -np.inf), axis=1)
+    rows = np.arange(len(candidates))
+    
+    # Продукты без модели спроса или без допустимых точек сохраняют текущую цену
+    has_choice = demand['valid'] & feasible.any(axis=1)
+    optimal_price = np.where(has_choice, candidates[rows, best], current_price)
+    expected_quantity = np.where(has_choice, quantity[rows, best], demand['current_quantity'])
+    
+    return optimal_price, expected_quantity
+
+def build_price_candidates(products, continuous_price, params):
+    """
+    Матрица цен-кандидатов продукты x точки (NaN - точка отсутствует).
+    
+    Args:
+        products (pandas.Index): Продукты
+        continuous_price (numpy.ndarray): Цены непрерывной оптимизации
+        params (dict): Параметры анализа (см. discrete_optimal_prices)
+    
+    Returns:
+        numpy.ndarray: Цены-кандидаты
+    """
+    ladder = params.get('price_ladder')
+    
+    if isinstance(ladder, dict):
+        # Индивидуальные лестницы дополняются NaN до общей длины
+        lookup = {str(product): prices for product, prices in ladder.items()}
+        product_ladders = [lookup.get(str(product), []) for product in products.tolist()]
+        width = max([len(prices) for prices in product_ladders] + [1])
+        candidates = np.full((len(products), width), np.nan)
+        for i, prices in enumerate(product_ladders):
+            candidates[i, :len(prices)] = prices
+        return candidates
+    
+    if ladder is not None:
+        return np.broadcast_to(np.asarray(ladder, dtype=float), (len(products), len(ladder)))
+    
+    endings = params.get('price_endings')
+    if not endings:
+        raise ValueError("Для дискретной оптимизации нужна лестница цен (price_ladder) или окончания цен (price_endings)")
+    
+    endings = np.asarray(endings, dtype=float)
+    step = float(params.get('price_step', 1))
+    steps = max(1, int(params.get('ladder_size', DEFAULT_LADDER_SIZE)) // len(endings))
+    
+    # Целые части цены вокруг непрерывного оптимума, к каждой добавляются все окончания
+    base = np.floor(np.nan_to_num(continuous_price) / step)[:, None] + np.arange(steps)[None, :] - steps // 2
+    candidates = base[:, :, None] * step + endings[None, None, :]
+    
+    return candidates.reshape(len(products), -1)
+
+def solve_separable_qp(hessian, linear, lower, upper, constraints=None, rhs=None, max_iter=20000, polish_iter=10):
+    """
+    Решение выпуклой задачи min sum(hessian * x^2 / 2 - linear * x)
+    при lower <= x <= upper и constraints @ x <= rhs.
+    
+    Целевая функция сепарабельна, поэтому двойственная задача гладкая и
+    решается L-BFGS-B по множителям ограничений: при заданных множителях
+    оптимальный x находится поэлементно, а каждая итерация сводится к двум
+    умножениям на разреженную матрицу ограничений.
+    
+    Args:
+        hessian (numpy.ndarray): Положительные диагональные элементы гессиана
+        linear (numpy.ndarray): Линейная часть целевой функции
+        lower (numpy.ndarray): Нижние границы
+        upper (numpy.ndarray): Верхние границы
+        constraints (scipy.sparse.csr_matrix, optional): Матрица линейных ограничений
+        rhs (numpy.ndarray, optional): Правая часть ограничений
+        max_iter (int): Максимальное число итераций L-BFGS-B
+        polish_iter (int): Максимальное число уточняющих ньютоновских шагов
+    
+    Returns:
+        numpy.ndarray: Решение x
+    """
+    if constraints is None or constraints.shape[0] == 0:
+        return np.clip(linear / hessian, lower, upper)
+    
+    # Нормировка строк и целевой функции улучшает обусловленность двойственной задачи
+    norms = np.sqrt(np.asarray(constraints.multiply(constraints).sum(axis=1)).ravel())
+    norms = np.where(norms > 0, norms, 1.0)
+    constraints = sparse.diags(1 / norms) @ constraints
+    rhs = rhs / norms
+    
+    objective_scale = hessian.sum()
+    hessian = hessian / objective_scale
+    linear = linear / objective_scale
+    
+    # Решение без ограничений-связей; целевая функция отсчитывается от него,
+    # чтобы малые изменения двойственной функции не терялись в погрешности
+    unconstrained = linear / hessian
+    base = np.clip(unconstrained, lower, upper)
+    
+    def primal(multipliers):
+        return np.clip((linear - constraints.T @ multipliers) / hessian, lower, upper)
+    
+    def negative_dual(multipliers):
+        x = primal(multipliers)
+        residual = constraints @ x - rhs
+        value = np.sum(hessian / 2 * (x - base) * (x + base - 2 * unconstrained)) + multipliers @ residual
+        return -value, -residual
+    
+    result = minimize(
+        negative_dual, np.zeros(constraints.shape[0]), jac=True, method='L-BFGS-B',
+        bounds=[(0, None)] * constraints.shape[0],
+        options={'maxiter': max_iter, 'maxfun': 2 * max_iter, 'ftol': 0, 'gtol': 1e-10, 'maxcor': 30}
+    )
+    multipliers = result.x
+    x = primal(multipliers)
+    violation = np.max(constraints @ x - rhs)
+    
+    # Уточнение ньютоновскими шагами: на найденном активном множестве
+    # (незажатые переменные, ограничения с положительным множителем или нарушенные)
+    # двойственная задача квадратична и решается одной разреженной системой
+    for _ in range(polish_iter):
+        if violation <= CONSTRAINT_TOLERANCE * 1e-3:
+            break
         
-        if current_profit > 0:
-            result['expected_profit_increase'] = ((optimized_profit - current_profit) / current_profit) * 100
+        free = (x > lower) & (x < upper)
+        active = (multipliers > 0) | (constraints @ x - rhs > 0)
+        active_rows = constraints[active]
+        free_rows = active_rows[:, free]
         
-        # Расчет ожидаемого изменения выручки
-        current_revenue = current_price_avg * current_quantity_avg
-        optimized_revenue = optimal_price * expected_quantity
+        system = free_rows @ sparse.diags(1 / hessian[free]) @ free_rows.T
+        system = system + sparse.identity(system.shape[0]) * 1e-12
+        target = free_rows @ (linear[free] / hessian[free]) - (rhs[active] - active_rows[:, ~free] @ x[~free])
         
-        if current_revenue > 0:
-            result['expected_revenue_change'] = ((optimized_revenue - current_revenue) / current_revenue) * 100
+        candidate = np.zeros_like(multipliers)
+        candidate[active] = np.maximum(spsolve(system.tocsc(), target), 0)
+        candidate_x = primal(candidate)
+        candidate_violation = np.max(constraints @ candidate_x - rhs)
         
-        # Добавляем рекомендацию
-        change_pct = ((optimal_price - current_price_avg) / current_price_avg) * 100
+        if candidate_violation >= violation:
+            break
+        multipliers, x, violation = candidate, candidate_x, candidate_violation
+    
+    if violation > CONSTRAINT_TOLERANCE:
+        raise ValueError("Ограничения оптимизации цен несовместимы")
+    
+    return x
+
+def build_optimization_result(products, demand, optimal_price, expected_quantity):
+    """
+    Формирование результатов оптимизации по массивам цен и количеств.
+    
+    Args:
+        products (pandas.Index): Продукты
+        demand (dict): Модели спроса (см. fit_linear_demand)
+        optimal_price (numpy.ndarray): Рекомендуемые цены
+        expected_quantity (numpy.ndarray): Ожидаемые количества при рекомендуемых ценах
+    
+    Returns:
+        dict: Результаты оптимизации цен
+    """
+    current_price = demand['current_price']
+    current_quantity = demand['current_quantity']
+    cost = demand['cost']
+    
+    # Инициализация результатов
+    result = {
+        'optimal_prices': dict(zip(products.tolist(), optimal_price.tolist())),
+        'expected_profit_increase': 0,
+        'expected_revenue_change': 0,
+        'price_recommendations': []
+    }
+    
+    # Расчет текущей и ожидаемой прибыли и выручки
+    current_profit = np.sum((current_price - cost) * current_quantity)
+    optimized_profit = np.sum((optimal_price - cost) * expected_quantity)
+    current_revenue = np.sum(current_price * current_quantity)
+    optimized_revenue = np.sum(optimal_price * expected_quantity)
+    
+    # Расчет ожидаемого увеличения прибыли
+    if current_profit > 0:
+        result['expected_profit_increase'] = float((optimized_profit - current_profit) / current_profit * 100)
+    
+    # Расчет ожидаемого изменения выручки
+    if current_revenue > 0:
+        result['expected_revenue_change'] = float((optimized_revenue - current_revenue) / current_revenue * 100)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_change = (optimal_price - current_price) / current_price * 100
+        quantity_change = (expected_quantity - current_quantity) / current_quantity * 100
+    
+    # Добавляем рекомендации
+    columns = zip(
+        products.tolist(), current_price.tolist(), optimal_price.tolist(), price_change.tolist(),
+        expected_quantity.tolist(), current_quantity.tolist(), quantity_change.tolist()
+    )
+    for product, price, optimal, change_pct, quantity, current, quantity_change_pct in columns:
         direction = "повышение" if change_pct > 0 else "снижение"
         
-        recommendation = {
-            'product': 'overall',
-            'current_price': current_price_avg,
-            'optimal_price': optimal_price,
+        result['price_recommendations'].append({
+            'product': product,
+            'current_price': price,
+            'optimal_price': optimal,
             'price_change_percent': change_pct,
-            'expected_quantity': expected_quantity,
-            'current_quantity': current_quantity_avg,
-            'quantity_change_percent': ((expected_quantity - current_quantity_avg) / current_quantity_avg) * 100,
+            'expected_quantity': quantity,
+            'current_quantity': current,
+            'quantity_change_percent': quantity_change_pct,
             'recommendation': f"Рекомендуется {direction} цены на {abs(change_pct):.1f}% для максимизации прибыли."
-        }
-        
-        result['price_recommendations'].append(recommendation)
+        })
     
     return result
 
@@ -148,29 +884,36 @@ def find_optimal_price(df, price_col, quantity_col, cost_col=None):
     Returns:
         tuple: (оптимальная цена, ожидаемое количество, средняя текущая цена, среднее текущее количество)
     """
-    # Расчет средних значений
-    current_price_avg = df[price_col].mean()
-    current_quantity_avg = df[quantity_col].mean()
-    
-    # Если недостаточно вариаций цены, возвращаем текущую
-    if df[price_col].nunique() <= 1:
-        return current_price_avg, current_quantity_avg, current_price_avg, current_quantity_avg
-    
-    # Определение себестоимости
-    cost = 0
+    # Все строки относятся к одному продукту
+    costs = None
     if cost_col and cost_col in df.columns:
-        cost = df[cost_col].mean()
+        costs = df[cost_col].to_numpy(dtype=float)
     
-    # Создание модели зависимости количества от цены
-    # Для простоты используем линейную регрессию для оценки эластичности
-    X = df[price_col].values
-    y = df[quantity_col].values
+    demand = fit_linear_demand(
+        np.zeros(len(df), dtype=np.intp), df[price_col].to_numpy(dtype=float),
+        df[quantity_col].to_numpy(dtype=float), 1, costs
+    )
+    optimal_price, expected_quantity = optimal_linear_prices(demand)
     
-    # Подгонка линейной модели вида: quantity = a + b * price
-    # Это упрощение; в реальности можно использовать более сложные модели
-    A = np.vstack([X, np.ones(len(X))]).T
-    b, a = np.linalg.lstsq(A, y, rcond=None)[0]
+    return (
+        float(optimal_price[0]), float(expected_quantity[0]),
+        float(demand['current_price'][0]), float(demand['current_quantity'][0])
+    )
+
+def solve_optimal_price(a, b, cost, initial_price, bounds=(None, None)):
+    """
+    Численный поиск цены для модели спроса без аналитического максимума прибыли.
     
+    Args:
+        a (float): Свободный член модели quantity = a + b * price
+        b (float): Коэффициент при цене
+        cost (float): Себестоимость
+        initial_price (float): Начальное приближение (текущая цена)
+        bounds (tuple): Допустимый диапазон цены (min, max)
+    
+    Returns:
+        float: Найденная цена
+    """
     # Функция для оценки количества при заданной цене
     def predict_quantity(price):
         return a + b * price
@@ -185,20 +928,7 @@ def find_optimal_price(df, price_col, quantity_col, cost_col=None):
     # Ограничения для оптимизации (цена должна быть положительной)
     constraints = ({'type': 'ineq', 'fun': lambda x: x[0]})
     
-    # Начальное приближение (текущая цена)
-    x0 = [current_price_avg]
-    
     # Оптимизация
-    result = minimize(profit_function, x0, constraints=constraints, method='SLSQP')
-    
-    # Извлечение оптимальной цены
-    optimal_price = result.x[0]
-    
-    # Расчет ожидаемого количества при оптимальной цене
-    expected_quantity = predict_quantity(optimal_price)
-    
-    # Проверка на отрицательное количество (нереалистичное)
-    if expected_quantity < 0:
-        return current_price_avg, current_quantity_avg, current_price_avg, current_quantity_avg
+    result = minimize(profit_function, [initial_price], bounds=[bounds], constraints=constraints, method='SLSQP')
     
-    return optimal_price, expected_quantity, current_price_avg, current_quantity_avg
\ No newline at end of file
+    return result.x[0]
@@ -0,0 +1,231 @@
+import numpy as np
+
+# Порядок колонок в массиве достаточных статистик регрессии y = a + b * x.
+# min_x и max_x нужны для проверки вариации регрессора и, как и суммы,
+# допускают слияние статистик из разных частей данных.
+STAT_COLUMNS = ('n', 'sum_x', 'sum_y', 'sum_xy', 'sum_xx', 'min_x', 'max_x')
+
+# Количество аддитивных статистик (в начале STAT_COLUMNS), допускающих накопленные суммы
+ADDITIVE_STATS = 5
+
+# Способ слияния каждой статистики (для pandas groupby().agg)
+STAT_AGGREGATIONS = {
+    'n': 'sum',
+    'sum_x': 'sum',
+    'sum_y': 'sum',
+    'sum_xy': 'sum',
+    'sum_xx': 'sum',
+    'min_x': 'min',
+    'max_x': 'max'
+}
+
+def grouped_sufficient_stats(codes, x, y, n_groups, weights=None):
+    """
+    Расчет достаточных статистик регрессии для всех групп за один проход.
+    
+    Args:
+        codes (numpy.ndarray): Целочисленные коды групп (от 0 до n_groups - 1)
+        x (numpy.ndarray): Значения регрессора
+        y (numpy.ndarray): Значения зависимой переменной
+        n_groups (int): Количество групп
+        weights (numpy.ndarray, optional): Веса строк (например, для бутстрепа)
+    
+    Returns:
+        numpy.ndarray: Массив формы (n_groups, len(STAT_COLUMNS))
+    """
+    codes = np.asarray(codes, dtype=np.intp)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    
+    if weights is None:
+        present = slice(None)
+    else:
+        weights = np.asarray(weights, dtype=float)
+        present = weights > 0
+    
+    stats = np.empty((n_groups, len(STAT_COLUMNS)))
+    stats[:, :ADDITIVE_STATS] = grouped_additive_stats(codes, x, y, n_groups, weights)
+    
+    # Минимум и максимум регрессора по строкам с ненулевым весом (NaN игнорируются)
+    stats[:, 5] = np.inf
+    stats[:, 6] = -np.inf
+    np.fmin.at(stats[:, 5], codes[present], x[present])
+    np.fmax.at(stats[:, 6], codes[present], x[present])
+    
+    return stats
+
+def grouped_additive_stats(codes, x, y, n_groups, weights=None):
+    """
+    Расчет только аддитивных статистик (первые ADDITIVE_STATS колонок) по группам.
+    
+    Args:
+        codes (numpy.ndarray): Целочисленные коды групп (от 0 до n_groups - 1)
+        x (numpy.ndarray): Значения регрессора
+        y (numpy.ndarray): Значения зависимой переменной
+        n_groups (int): Количество групп
+        weights (numpy.ndarray, optional): Веса строк
+    
+    Returns:
+        numpy.ndarray: Массив формы (n_groups, ADDITIVE_STATS)
+    """
+    if weights is None:
+        wx, wy = x, y
+    else:
+        wx, wy = weights * x, weights * y
+    
+    stats = np.empty((n_groups, ADDITIVE_STATS))
+    stats[:, 0] = np.bincount(codes, weights=weights, minlength=n_groups)
+    stats[:, 1] = np.bincount(codes, weights=wx, minlength=n_groups)
+    stats[:, 2] = np.bincount(codes, weights=wy, minlength=n_groups)
+    stats[:, 3] = np.bincount(codes, weights=wx * y, minlength=n_groups)
+    stats[:, 4] = np.bincount(codes, weights=wx * x, minlength=n_groups)
+    
+    return stats
+
+def has_variation(stats):
+    """
+    Проверка, что в группе есть хотя бы два различных значения регрессора.
+    
+    Args:
+        stats (numpy.ndarray): Достаточные статистики (последняя ось - STAT_COLUMNS)
+    
+    Returns:
+        numpy.ndarray: Булев массив по группам
+    """
+    return stats[..., 6] > stats[..., 5]
+
+def has_sum_variation(stats, rtol=1e-10):
+    """
+    Проверка вариации регрессора только по аддитивным статистикам.
+    
+    Используется там, где min_x и max_x недоступны (например, для скользящих окон).
+    
+    Args:
+        stats (numpy.ndarray): Аддитивные статистики (последняя ось - первые ADDITIVE_STATS колонок)
+        rtol (float): Относительный порог для разброса регрессора
+    
+    Returns:
+        numpy.ndarray: Булев массив по группам
+    """
+    n = stats[..., 0]
+    s_xx = n * stats[..., 4] - stats[..., 1] ** 2
+    
+    return s_xx > rtol * n * np.abs(stats[..., 4])
+
+def rolling_window_stats(stats, window, step=1):
+    """
+    Расчет статистик скользящих окон по накопленным суммам.
+    
+    Каждое окно - разность двух накопленных сумм, поэтому стоимость окна
+    не зависит от его длины.
+    
+    Args:
+        stats (numpy.ndarray): Статистики последовательных интервалов (первая ось - время)
+        window (int): Длина окна в интервалах
+        step (int): Шаг между окнами в интервалах
+    
+    Returns:
+        tuple: (индексы последних интервалов окон, аддитивные статистики окон)
+    """
+    sums = stats[..., :ADDITIVE_STATS]
+    cumulative = np.concatenate([np.zeros((1,) + sums.shape[1:]), np.cumsum(sums, axis=0)])
+    ends = np.arange(window - 1, len(stats), step)
+    
+    return ends, cumulative[ends + 1] - cumulative[ends + 1 - window]
+
+def ols_from_stats(stats, valid=None):
+    """
+    Расчет коэффициентов МНК по достаточным статистикам.
+    
+    Для групп без вариации регрессора наклон и свободный член равны 0.
+    Поддерживаются массивы произвольной размерности, статистики - по последней оси.
+    
+    Args:
+        stats (numpy.ndarray): Достаточные статистики (последняя ось - STAT_COLUMNS)
+        valid (numpy.ndarray, optional): Признак вариации регрессора; по умолчанию
+            определяется по min_x и max_x
+    
+    Returns:
+        tuple: (наклон, свободный член)
+    """
+    n = stats[..., 0]
+    sum_x = stats[..., 1]
+    sum_y = stats[..., 2]
+    
+    s_xx = n * stats[..., 4] - sum_x * sum_x
+    s_xy = n * stats[..., 3] - sum_x * sum_y
+    if valid is None:
+        valid = has_variation(stats)
+    valid = valid & (s_xx > 0)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(valid, s_xy / s_xx, 0.0)
+        intercept = np.where(valid, (sum_y - slope * sum_x) / n, 0.0)
+    
+    return slope, intercept
+
+def poisson_irls(codes, x, y, n_groups, valid, max_iter=25, tol=1e-8, weights=None):
+    """
+    Пуассоновская регрессия log E[y] = a + b * x для всех групп одновременно (IRLS).
+    
+    Каждая итерация - взвешенный МНК с весами mu и рабочим откликом
+    eta + (y - mu) / mu, поэтому решается теми же групповыми суммами, что и
+    обычная регрессия. Нулевые значения y допустимы.
+    
+    Args:
+        codes (numpy.ndarray): Целочисленные коды групп (от 0 до n_groups - 1)
+        x (numpy.ndarray): Значения регрессора
+        y (numpy.ndarray): Неотрицательные значения зависимой переменной
+        n_groups (int): Количество групп
+        valid (numpy.ndarray): Признак групп с вариацией регрессора и ненулевой суммой y
+        max_iter (int): Максимальное число итераций
+        tol (float): Порог изменения наклона для остановки
+        weights (numpy.ndarray, optional): Частотные веса строк (например, для бутстрепа)
+    
+    Returns:
+        tuple: (наклон, свободный член, признак сходимости); для невалидных групп наклон равен 0
+    """
+    codes = np.asarray(codes, dtype=np.intp)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    
+    if weights is None:
+        w = np.ones(len(codes))
+    else:
+        # Строки с нулевым весом не влияют на оценку и сразу отбрасываются
+        w = np.asarray(weights, dtype=float)
+        rows = w > 0
+        codes, x, y, w = codes[rows], x[rows], y[rows], w[rows]
+    
+    # Начальное приближение: mu между наблюдением и средним по группе
+    counts = np.bincount(codes, weights=w, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        group_mean = np.bincount(codes, weights=w * y, minlength=n_groups) / counts
+    mu = (y + group_mean[codes]) / 2
+    eta = np.log(np.maximum(mu, 1e-10))
+    
+    slope = np.zeros(n_groups)
+    intercept = np.zeros(n_groups)
+    active = valid.copy()
+    
+    for _ in range(max_iter):
+        # Итерации продолжаются только по строкам еще не сошедшихся групп
+        rows = active[codes]
+        codes, x, y, w, mu, eta = codes[rows], x[rows], y[rows], w[rows], mu[rows], eta[rows]
+        
+        z = eta + (y - mu) / mu
+        stats = grouped_additive_stats(codes, x, z, n_groups, weights=w * mu)
+        new_slope, new_intercept = ols_from_stats(stats, valid=active)
+        
+        done = active & (np.abs(new_slope - slope) <= tol * (1 + np.abs(new_slope)))
+        slope = np.where(active, new_slope, slope)
+        intercept = np.where(active, new_intercept, intercept)
+        active &= ~done
+        if not active.any():
+            break
+        
+        # Ограничение eta защищает exp от переполнения на расходящихся группах
+        eta = np.clip(intercept[codes] + slope[codes] * x, -700, 700)
+        mu = np.maximum(np.exp(eta), 1e-300)
+    
+    return slope, intercept, ~active
@@ -1,4 +1,5 @@
 import os
+from datetime import datetime
 import pandas as pd
 from flask import request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
@@ -7,9 +8,12 @@ from app import db
 from app.api import api
 from app.models import User, DataSource, Analysis, AnalysisResult, Subscription
 from app.api.data.utils import get_plan_limits
-from app.analytics.elasticity import calculate_elasticity
+from app.api.analysis.utils import calculate_incremental_elasticity, get_cached_product_elasticities
+from app.analytics.elasticity import calculate_elasticity, calculate_elasticity_chunked, requires_raw_rows
+from app.analytics.cross_elasticity import calculate_cross_elasticity
 from app.analytics.forecasting import forecast_sales
-from app.analytics.optimization import optimize_prices
+from app.analytics.optimization import optimize_prices, evaluate_price_scenarios
+from app.analytics.markdown import optimize_markdown
 
 @api.route('/analysis', methods=['GET'])
 @jwt_required()
@@ -230,6 +234,59 @@ def get_analysis_results(analysis_id):
         'results': [result.to_dict() for result in results]
     }), 200
 
+@api.route('/analysis/scenarios', methods=['POST'])
+@jwt_required()
+def evaluate_scenarios():
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    
+    if not user:
+        return jsonify({'message': 'Пользователь не найден'}), 404
+    
+    data = request.get_json()
+    if not data or not isinstance(data, dict):
+        return jsonify({'message': 'Отсутствуют данные'}), 400
+    
+    # Проверка обязательных полей
+    required_fields = ['data_source_id', 'scenarios']
+    for field in required_fields:
+        if field not in data:
+            return jsonify({'message': f'Поле {field} обязательно'}), 400
+    
+    if not isinstance(data['scenarios'], dict):
+        return jsonify({'message': 'Поле scenarios должно быть объектом'}), 400
+    if not isinstance(data.get('parameters', {}), dict):
+        return jsonify({'message': 'Поле parameters должно быть объектом'}), 400
+    
+    # Проверяем существование источника данных
+    data_source = DataSource.query.filter_by(id=data['data_source_id'], company_id=user.company_id).first()
+    if not data_source:
+        return jsonify({'message': 'Источник данных не найден'}), 404
+    
+    if data_source.source_type != 'file' or not data_source.file_path:
+        return jsonify({'message': 'Неподдерживаемый тип источника данных'}), 400
+    
+    # Сценарии оцениваются сразу, без создания анализа
+    params = dict(data.get('parameters', {}))
+    params['scenarios'] = data['scenarios']
+    
+    try:
+        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], data_source.file_path)
+        
+        if file_path.endswith('.csv'):
+            df = pd.read_csv(file_path)
+        else:  # Excel
+            df = pd.read_excel(file_path)
+        
+        result_data = evaluate_price_scenarios(df, params)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    return jsonify({
+        'results': result_data,
+        'summary': generate_summary(result_data, 'scenarios')
+    }), 200
+
 # Вспомогательная функция для запуска анализа
 def run_analysis(analysis_id):
     # В реальной системе это будет асинхронная задача
@@ -250,30 +307,69 @@ def run_analysis(analysis_id):
         # Загружаем данные
         if data_source.source_type == 'file' and data_source.file_path:
             file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], data_source.file_path)
-            
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            else:  # Excel
-                df = pd.read_excel(file_path)
         else:
             raise ValueError('Неподдерживаемый тип источника данных')
         
+        # Эластичность по CSV считается по частям файла без загрузки его целиком
+        # и по умолчанию пересчитывается по сохраненной статистике с первой необработанной строки.
+        # Интервалам и скользящим окнам нужны все строки, поэтому они считаются полным расчетом
+        is_streaming = (
+            analysis.analysis_type == 'elasticity'
+            and file_path.endswith('.csv')
+            and not requires_raw_rows(analysis.params)
+        )
+        is_incremental = is_streaming and analysis.params.get('incremental', True)
+        chunk_size = current_app.config['ANALYSIS_CHUNK_ROWS']
+        
+        if is_streaming:
+            df = None
+        elif file_path.endswith('.csv'):
+            df = pd.read_csv(file_path)
+        else:  # Excel
+            df = pd.read_excel(file_path)
+        
         # Запускаем соответствующий анализ
         result_data = {}
         
-        if analysis.analysis_type == 'elasticity':
+        if is_incremental:
+            result_data = calculate_incremental_elasticity(data_source, file_path, analysis.params, chunk_size)
+        elif is_streaming:
+            chunks = pd.read_csv(file_path, chunksize=chunk_size)
+            result_data = calculate_elasticity_chunked(chunks, analysis.params)
+        elif analysis.analysis_type == 'elasticity':
             result_data = calculate_elasticity(df, analysis.params)
+        elif analysis.analysis_type == 'cross_elasticity':
+            result_data = calculate_cross_elasticity(df, analysis.params)
         elif analysis.analysis_type == 'forecast':
-            result_data = forecast_sales(df, analysis.params)
+            # Модели продуктов с неизменными данными загружаются из реестра вместо обучения
+            result_data = forecast_sales(
+                df, analysis.params, current_app.config.get('FORECAST_MODEL_DIR'),
+                current_app.config.get('FORECAST_MODEL_CACHE_MB', 0) * 1024 * 1024
+            )
         elif analysis.analysis_type == 'optimization':
-            result_data = optimize_prices(df, analysis.params)
+            # Повторный запуск начинается с результатов предыдущего и пересчитывает только изменившиеся продукты
+            previous_result = None
+            if analysis.params.get('warm_start', True):
+                latest_result = AnalysisResult.query.filter_by(analysis_id=analysis.id).order_by(AnalysisResult.created_at.desc()).first()
+                previous_result = latest_result.results if latest_result else None
+            
+            # Оптимизация по постоянной эластичности берет эластичности из сохраненной статистики источника
+            elasticities = None
+            if analysis.params.get('optimization_mode') == 'constant_elasticity' and file_path.endswith('.csv'):
+                elasticities = get_cached_product_elasticities(data_source, file_path, analysis.params, chunk_size)
+            
+            result_data = optimize_prices(df, analysis.params, previous_result, elasticities)
+        elif analysis.analysis_type == 'scenarios':
+            result_data = evaluate_price_scenarios(df, analysis.params)
+        elif analysis.analysis_type == 'markdown':
+            result_data = optimize_markdown(df, analysis.params)
         else:
             raise ValueError(f'Неподдерживаемый тип анализа: {analysis.analysis_type}')
         
         # Создаем результат анализа
         result = AnalysisResult(
             analysis_id=analysis.id,
-            result_data=result_data,
+            results=result_data,
             summary=generate_summary(result_data, analysis.analysis_type)
         )
         
@@ -284,7 +380,7 @@ def run_analysis(analysis_id):
         analysis.last_run = datetime.utcnow()
         
         db.session.commit()
-        
+    
     except Exception as e:
         # В случае ошибки
         analysis.status = 'failed'
@@ -303,16 +399,33 @@ def generate_summary(result_data, analysis_type):
         summary = "Анализ ценовой эластичности показал следующие результаты:\n\n"
         
         if 'elasticity_by_product' in result_data:
+            intervals = result_data.get('elasticity_intervals', {}).get('by_product', {})
+            
             summary += "Эластичность по товарам:\n"
             for product, elasticity in result_data['elasticity_by_product'].items():
                 elastic_type = "эластичный" if abs(elasticity) > 1 else "неэластичный"
-                summary += f"- {product}: {elasticity:.2f} ({elastic_type})\n"
+                summary += f"- {product}: {elasticity:.2f} ({elastic_type})"
+                
+                # Доверительный интервал (если рассчитывался)
+                if product in intervals:
+                    summary += f", интервал [{intervals[product]['lower']:.2f}; {intervals[product]['upper']:.2f}]"
+                
+                summary += "\n"
         
         if 'average_elasticity' in result_data:
             summary += f"\nСредняя эластичность: {result_data['average_elasticity']:.2f}"
         
         return summary
     
+    elif analysis_type == 'cross_elasticity':
+        # Простое резюме для перекрестной эластичности
+        summary = "Анализ перекрестной эластичности показал следующие результаты:\n\n"
+        summary += f"Оценено пар товаров: {result_data.get('pairs_count', 0)}\n"
+        summary += f"Товары-заменители: {result_data.get('substitute_pairs', 0)}\n"
+        summary += f"Дополняющие товары: {result_data.get('complement_pairs', 0)}"
+        
+        return summary
+    
     elif analysis_type == 'forecast':
         # Простое резюме для прогноза
         summary = "Прогноз продаж показал следующие результаты:\n\n"
@@ -323,6 +436,11 @@ def generate_summary(result_data, analysis_type):
         if 'forecast_summary' in result_data:
             summary += result_data['forecast_summary']
         
+        backtest = result_data.get('backtest')
+        if backtest and backtest['overall_mape'] is not None:
+            summary += (f"\nБэктест ({backtest['folds']} срезов, горизонт {backtest['horizon']} дн.): "
+                        f"MAPE {backtest['overall_mape']:.2f}%")
+        
         return summary
     
     elif analysis_type == 'optimization':
@@ -337,6 +455,38 @@ def generate_summary(result_data, analysis_type):
         if 'expected_profit_increase' in result_data:
             summary += f"\nОжидаемое увеличение прибыли: {result_data['expected_profit_increase']:.2f}%"
         
+        warm_start = result_data.get('warm_start')
+        if warm_start and warm_start['reused_products']:
+            summary += (f"\nПересчитано товаров: {warm_start['recomputed_products']}, "
+                        f"без изменений с прошлого запуска: {warm_start['reused_products']}")
+        
+        frontier = result_data.get('pareto_frontier')
+        if frontier:
+            summary += (f"\nГраница выручка - прибыль ({len(frontier['weights'])} точек): "
+                        f"выручка {frontier['revenue'][-1]:.2f}-{frontier['revenue'][0]:.2f} руб., "
+                        f"прибыль {frontier['profit'][0]:.2f}-{frontier['profit'][-1]:.2f} руб.")
+        
+        return summary
+    
+    elif analysis_type == 'scenarios':
+        # Простое резюме для сценариев цен
+        summary = "Оценка сценариев цен:\n\n"
+        summary += f"Сценариев: {result_data.get('scenario_count', 0)}, товаров: {len(result_data.get('products', []))}\n"
+        
+        best = result_data.get('best_scenario')
+        if best is not None:
+            summary += f"Лучший сценарий по прибыли: №{best + 1}\n"
+            summary += f"Прибыль: {result_data['total_profit'][best]:.2f} руб. (текущая {result_data['current_profit']:.2f} руб.)\n"
+            summary += f"Выручка: {result_data['total_revenue'][best]:.2f} руб. (текущая {result_data['current_revenue']:.2f} руб.)"
+        
+        return summary
+    
+    elif analysis_type == 'markdown':
+        # Простое резюме для уценки
+        summary = f"План уценки (периодов: {result_data.get('horizon', 0)}):\n\n"
+        summary += f"Ожидаемая выручка: {result_data.get('total_revenue', 0):.2f} руб.\n"
+        summary += f"Доля распроданного остатка: {result_data.get('sell_through_percent', 0):.1f}%"
+        
         return summary
     
     return "Результаты анализа доступны в детальном отчете."
\ No newline at end of file
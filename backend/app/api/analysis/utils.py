@@ -0,0 +1,98 @@
+import os
+
+import pandas as pd
+
+from app.analytics.elasticity import (
+    STATS_KEY, aggregate_elasticity_stats_chunked, merge_elasticity_stats, elasticity_from_stats, elasticities_from_stats
+)
+from app.analytics.regression import STAT_COLUMNS
+from app.api.data.utils import (
+    elasticity_stats_key, load_elasticity_stats, save_elasticity_stats, reset_elasticity_stats
+)
+
+def calculate_incremental_elasticity(data_source, file_path, params=None, chunk_size=500000):
+    """Пересчитать эластичность CSV-источника, обработав только новые строки"""
+    stats = update_elasticity_stats(data_source, file_path, params, chunk_size)
+    
+    # Анализ по времени, как и при полном расчете, только при нескольких датах во всем файле
+    dates = data_source.stats_state[elasticity_stats_key(params)]['dates']
+    return elasticity_from_stats(stats, include_periods=len(dates) > 1)
+
+def get_cached_product_elasticities(data_source, file_path, params=None, chunk_size=500000):
+    """Эластичности продуктов по сохраненной статистике источника (с учетом новых строк)"""
+    stats = update_elasticity_stats(data_source, file_path, params, chunk_size)
+    overall = stats[stats['period_type'] == 'all']
+    elasticities = elasticities_from_stats(overall[list(STAT_COLUMNS)].to_numpy(dtype=float))
+    
+    return dict(zip(overall['product'].tolist(), elasticities.tolist()))
+
+def update_elasticity_stats(data_source, file_path, params=None, chunk_size=500000):
+    """Дополнить сохраненную статистику эластичности строками, добавленными в файл"""
+    key = elasticity_stats_key(params)
+    state = data_source.stats_state
+    position = state.get(key, {'bytes': 0, 'dates': []})
+    
+    # Читаем по частям только строки, добавленные после прошлого расчета, начиная с
+    # байта, на котором он закончился: строки с переносами внутри кавычек занимают
+    # несколько физических строк файла, поэтому пропуск по числу строк неверен
+    columns = pd.read_csv(file_path, nrows=0).columns
+    with open(file_path, 'rb') as handle:
+        offset = position['bytes'] if isinstance(position, dict) else None
+        if not is_merged_prefix(handle, offset):
+            reset_elasticity_stats(data_source)
+            state, offset, position = {}, 0, {'dates': []}
+        
+        handle.seek(offset)
+        if offset:
+            chunks = pd.read_csv(handle, header=None, names=columns, chunksize=chunk_size)
+        else:
+            chunks = pd.read_csv(handle, chunksize=chunk_size)
+        
+        new_stats, _, new_dates = aggregate_elasticity_stats_chunked(chunks, params)
+        end_offset = handle.tell()
+    
+    new_stats['product'] = new_stats['product'].map(lambda product: None if pd.isna(product) else str(product))
+    
+    stored = load_elasticity_stats(data_source, key)
+    merged = merge_elasticity_stats(stored.drop(columns='id'), new_stats)
+    
+    save_elasticity_stats(data_source, key, stored, merged, new_stats)
+    # Для выбора анализа по времени достаточно помнить две различные даты
+    dates = sorted(set(position['dates']) | {str(date) for date in new_dates})[:2]
+    state[key] = {'bytes': end_offset, 'dates': dates}
+    data_source.stats_state = state
+    
+    # Продукты хранятся строками; в результате они должны совпадать с полным расчетом
+    merged['product'] = normalize_product_labels(merged['product'])
+    
+    return merged.sort_values(STATS_KEY, kind='stable', ignore_index=True)
+
+def is_merged_prefix(handle, offset):
+    """Проверить, что первые offset байт файла можно считать уже учтенными в статистике"""
+    # Состояние старого формата (число строк) не указывает позицию в файле
+    if offset is None:
+        return False
+    
+    size = os.fstat(handle.fileno()).st_size
+    if offset > size:
+        # Файл стал короче - сохраненная статистика не соответствует данным
+        return False
+    if 0 < offset < size:
+        # Прошлый расчет закончился на строке без перевода строки, и ее могли дописать
+        handle.seek(offset - 1)
+        return handle.read(1) == b'\n'
+    
+    return True
+
+def normalize_product_labels(products):
+    """Метки продуктов, приведенные к типу, который pandas.read_csv дал бы им при полном расчете"""
+    present = products.notna()
+    try:
+        numeric = pd.to_numeric(products[present])
+    except (ValueError, TypeError):
+        return products
+    
+    labels = products.astype(object).copy()
+    labels[present] = numeric.tolist()
+    
+    return labels
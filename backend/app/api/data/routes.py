@@ -10,7 +10,9 @@ from app import db
 from app.api import api
 from app.models import User, DataSource, Subscription, Analysis
 from app.models.data_source import DataSource
-from app.api.data.utils import get_plan_limits, save_uploaded_file
+from app.api.data.utils import (
+    get_plan_limits, save_uploaded_file, is_appended_file, reset_elasticity_stats
+)
 
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
 
@@ -200,21 +202,28 @@ def update_data_source(source_id):
         file = request.files['file']
         if file and file.filename != '' and allowed_file(file.filename):
             try:
-                # Удаляем старый файл
+                # Сохраняем новый файл
+                filename = secure_filename(file.filename)
+                file_path = save_uploaded_file(file, filename, user.company_id)
+                new_file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file_path)
+                
+                # Удаляем старый файл; сохраненная статистика эластичности
+                # остается верной, только если строки дописаны в конец файла
+                is_appended = False
                 if data_source.file_path:
                     old_file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], data_source.file_path)
                     if os.path.exists(old_file_path):
+                        is_appended = is_appended_file(old_file_path, new_file_path)
                         os.remove(old_file_path)
                 
-                # Сохраняем новый файл
-                filename = secure_filename(file.filename)
-                file_path = save_uploaded_file(file, filename, user.company_id)
+                if not is_appended:
+                    reset_elasticity_stats(data_source)
                 
                 # Чтение файла для обновления количества строк
                 if file.filename.endswith('.csv'):
-                    df = pd.read_csv(file)
+                    df = pd.read_csv(new_file_path)
                 else:  # Excel
-                    df = pd.read_excel(file)
+                    df = pd.read_excel(new_file_path)
                 
                 data_source.file_path = file_path
                 data_source.row_count = len(df)
@@ -1,8 +1,16 @@
 import os
 import uuid
+import json
+import hashlib
+import pandas as pd
 from flask import current_app
 from werkzeug.utils import secure_filename
 
+from app import db
+from app.models import DataSourceStats
+from app.analytics.elasticity import STATS_KEY
+from app.analytics.regression import STAT_COLUMNS
+
 def get_plan_limits(plan_type):
     """Получить лимиты для тарифного плана"""
     return current_app.config['PLAN_LIMITS'].get(plan_type, {})
@@ -25,4 +33,60 @@ def save_uploaded_file(file, filename, company_id):
     file.save(file_path)
     
     # Возвращаем относительный путь для хранения в БД
-    return os.path.join(str(company_id), unique_filename)
\ No newline at end of file
+    return os.path.join(str(company_id), unique_filename)
+
+def is_appended_file(old_path, new_path, chunk_size=1024 * 1024):
+    """Проверить, что новый файл получен дописыванием строк в конец старого"""
+    if os.path.getsize(new_path) < os.path.getsize(old_path):
+        return False
+    
+    with open(old_path, 'rb') as old_file, open(new_path, 'rb') as new_file:
+        while True:
+            old_chunk = old_file.read(chunk_size)
+            if not old_chunk:
+                return True
+            if new_file.read(len(old_chunk)) != old_chunk:
+                return False
+
+def elasticity_stats_key(params):
+    """Ключ сохраненной статистики эластичности для параметров анализа"""
+    params = params or {}
+    key_params = {
+        'price_column': params.get('price_column', 'price'),
+        'quantity_column': params.get('quantity_column', 'quantity'),
+        'product_column': params.get('product_column', 'product'),
+        'date_column': params.get('date_column', 'date'),
+        'include_weekly': bool(params.get('include_weekly'))
+    }
+    return hashlib.sha1(json.dumps(key_params, sort_keys=True).encode('utf-8')).hexdigest()
+
+def load_elasticity_stats(data_source, params_key):
+    """Загрузить сохраненную статистику эластичности источника данных"""
+    columns = STATS_KEY + list(STAT_COLUMNS)
+    rows = db.session.query(
+        DataSourceStats.id, *[getattr(DataSourceStats, column) for column in columns]
+    ).filter_by(data_source_id=data_source.id, params_key=params_key).all()
+    
+    return pd.DataFrame(rows, columns=['id'] + columns).astype({column: float for column in STAT_COLUMNS})
+
+def save_elasticity_stats(data_source, params_key, stored, merged, updated_keys):
+    """Сохранить изменившиеся строки статистики эластичности"""
+    # Пишем только строки, затронутые новыми данными
+    changed = merged.merge(updated_keys[STATS_KEY].drop_duplicates(), on=STATS_KEY)
+    changed = changed.merge(stored[['id'] + STATS_KEY], on=STATS_KEY, how='left')
+    changed = changed.astype(object).where(changed.notna(), None)
+    
+    is_new = changed['id'].isna()
+    updates = changed[~is_new].to_dict('records')
+    inserts = changed[is_new].drop(columns='id').to_dict('records')
+    
+    for record in inserts:
+        record.update(data_source_id=data_source.id, params_key=params_key)
+    
+    db.session.bulk_update_mappings(DataSourceStats, updates)
+    db.session.bulk_insert_mappings(DataSourceStats, inserts)
+
+def reset_elasticity_stats(data_source):
+    """Удалить сохраненную статистику эластичности источника данных"""
+    DataSourceStats.query.filter_by(data_source_id=data_source.id).delete()
+    data_source.stats_state = {}
@@ -1,4 +1,4 @@
 from app.models.user import User, Company
 from app.models.subscription import Subscription, Payment
-from app.models.data_source import DataSource
+from app.models.data_source import DataSource, DataSourceStats
 from app.models.analysis import Analysis, AnalysisResult
\ No newline at end of file
@@ -17,10 +17,12 @@ class DataSource(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_sync = db.Column(db.DateTime)
+    stats_offsets = db.Column(db.Text)  # JSON: ключ параметров -> число строк, учтенных в статистике
     
     # Отношения
     company = db.relationship('Company', backref='data_sources')
     analyses = db.relationship('Analysis', backref='data_source', lazy='dynamic')
+    stats = db.relationship('DataSourceStats', backref='data_source', lazy='dynamic', cascade='all, delete-orphan')
     
     @property
     def mapping(self):
@@ -32,6 +34,16 @@ class DataSource(db.Model):
     def mapping(self, mapping_dict):
         self.column_mapping = json.dumps(mapping_dict)
     
+    @property
+    def stats_state(self):
+        if self.stats_offsets:
+            return json.loads(self.stats_offsets)
+        return {}
+    
+    @stats_state.setter
+    def stats_state(self, state_dict):
+        self.stats_offsets = json.dumps(state_dict)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -46,4 +58,26 @@ class DataSource(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'last_sync': self.last_sync.isoformat() if self.last_sync else None
-        }
\ No newline at end of file
+        }
+
+class DataSourceStats(db.Model):
+    # Достаточные статистики регрессии эластичности для инкрементального пересчета
+    __tablename__ = 'data_source_stats'
+    __table_args__ = (
+        db.Index('ix_data_source_stats_source_key', 'data_source_id', 'params_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    data_source_id = db.Column(db.Integer, db.ForeignKey('data_sources.id'), nullable=False)
+    params_key = db.Column(db.String(40), nullable=False)  # Хеш параметров колонок анализа
+    product = db.Column(db.String(255))  # NULL - данные без разбивки по продуктам
+    period_type = db.Column(db.String(10), nullable=False)  # all, month, week
+    period = db.Column(db.String(32), nullable=False)
+    n = db.Column(db.Float)
+    sum_x = db.Column(db.Float)
+    sum_y = db.Column(db.Float)
+    sum_xy = db.Column(db.Float)
+    sum_xx = db.Column(db.Float)
+    min_x = db.Column(db.Float)
+    max_x = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
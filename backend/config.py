@@ -10,7 +10,16 @@ class Config:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or SECRET_KEY
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
-
+    
+    # Размер части файла (в строках) при потоковой обработке данных анализа
+    ANALYSIS_CHUNK_ROWS = int(os.environ.get('ANALYSIS_CHUNK_ROWS', 500000))
+    
+    # Реестр обученных моделей прогноза и лимит его размера на диске (МБ, 0 - без лимита)
+    FORECAST_MODEL_DIR = os.environ.get('FORECAST_MODEL_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'forecast_models'
+    )
+    FORECAST_MODEL_CACHE_MB = int(os.environ.get('FORECAST_MODEL_CACHE_MB', 2048))
+    
     # Лимиты тарифных планов
     PLAN_LIMITS = {
         'free': {
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Скрипт для сравнения скорости расчета эластичности.
+
+Сравнивает прежний расчет (отдельная LinearRegression для каждого продукта)
+с групповым расчетом по достаточным статистикам и проверяет совпадение результатов.
+Дополнительно измеряет время пуассоновской модели на тех же данных
+с частью дней без продаж.
+"""
+
+import sys
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+
+# Добавляем директорию проекта в путь для импорта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.analytics.elasticity import calculate_elasticity
+
+def generate_sales(n_products, rows_per_product, seed=42, counts=False):
+    """Генерация синтетических данных о продажах с известной эластичностью."""
+    rng = np.random.default_rng(seed)
+    
+    product = np.repeat(np.arange(n_products), rows_per_product)
+    true_elasticity = rng.uniform(-3, -0.2, n_products)[product]
+    base_price = rng.uniform(100, 5000, n_products)[product]
+    
+    price = np.round(base_price * rng.uniform(0.8, 1.2, len(product)), 2)
+    if counts:
+        # Штучные продажи с заметной долей дней без продаж
+        base_demand = rng.uniform(-1, 3, n_products)[product]
+        quantity = rng.poisson(np.exp(base_demand + true_elasticity * np.log(price / base_price))).astype(float)
+    else:
+        quantity = np.exp(5 + true_elasticity * np.log(price / base_price) + rng.normal(0, 0.1, len(product)))
+    
+    return pd.DataFrame({
+        'product': [f"SKU{p:06d}" for p in product],
+        'price': price,
+        'quantity': quantity
+    })
+
+def legacy_elasticity(df):
+    """Прежний расчет: отдельная модель для каждого продукта."""
+    result = {}
+    for product, group in df.groupby('product'):
+        if group['price'].nunique() <= 1:
+            result[product] = 0
+            continue
+        
+        group = group.copy()
+        group['log_price'] = np.log(group['price'])
+        group['log_quantity'] = np.log(group['quantity'])
+        
+        model = LinearRegression()
+        model.fit(group['log_price'].values.reshape(-1, 1), group['log_quantity'].values)
+        result[product] = model.coef_[0]
+    
+    return result
+
+def run_benchmark(n_products, rows_per_product):
+    """Запуск сравнения и вывод результатов."""
+    df = generate_sales(n_products, rows_per_product)
+    print(f"Продуктов: {n_products}, строк: {len(df)}")
+    
+    start = time.perf_counter()
+    legacy = legacy_elasticity(df)
+    legacy_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    vectorized = calculate_elasticity(df)['elasticity_by_product']
+    vectorized_time = time.perf_counter() - start
+    
+    products = list(legacy.keys())
+    max_diff = np.max(np.abs(np.array([legacy[p] for p in products]) - np.array([vectorized[p] for p in products])))
+    
+    print(f"Цикл по продуктам:   {legacy_time:.3f} с")
+    print(f"Групповой расчет:    {vectorized_time:.3f} с")
+    print(f"Ускорение:           {legacy_time / vectorized_time:.1f}x")
+    print(f"Макс. расхождение:   {max_diff:.2e}")
+    
+    if not np.isclose(max_diff, 0, atol=1e-8):
+        raise SystemExit("Результаты расходятся с прежним расчетом")
+    
+    # Пуассоновская модель: нулевые продажи остаются в оценке
+    counts = generate_sales(n_products, rows_per_product, counts=True)
+    positive = counts[counts['quantity'] > 0]
+    
+    start = time.perf_counter()
+    calculate_elasticity(positive)
+    ols_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    calculate_elasticity(counts, {'model': 'poisson'})
+    poisson_time = time.perf_counter() - start
+    
+    print(f"Доля дней без продаж: {np.mean(counts['quantity'] == 0):.1%}")
+    print(f"МНК (без нулей):     {ols_time:.3f} с")
+    print(f"Пуассоновская модель: {poisson_time:.3f} с ({poisson_time / ols_time:.1f}x от МНК)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--rows', type=int, default=30)
+    args = parser.parse_args()
+    
+    run_benchmark(args.products, args.rows)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Скрипт для измерения задержки прогноза продаж по одному продукту.
+
+Сравнивает прежнее построение прогноза (отдельный вызов model.predict для
+каждого периода и сценария цены) с одним пакетным вызовом по матрице
+признаков всех периодов и проверяет совпадение прогнозов. Дополнительно
+измеряет прогноз каталога отдельными моделями, одной глобальной моделью (с
+квантилями прогноза и без) и более дешевыми движками прогнозирования.
+"""
+
+import sys
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+# Добавляем директорию проекта в путь для импорта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.analytics.forecasting import PRICE_SCENARIOS, forecast_sales, train_forecast_model
+
+def generate_sales(n_products, days, seed=42):
+    """Генерация синтетических ежедневных продаж с недельной сезонностью."""
+    rng = np.random.default_rng(seed)
+    
+    dates = pd.date_range('2023-01-01', periods=days, freq='D')
+    product = np.repeat(np.arange(n_products), days)
+    date = np.tile(dates, n_products)
+    
+    base_price = rng.uniform(100, 5000, n_products)[product]
+    base_quantity = rng.uniform(20, 200, n_products)[product]
+    price = np.round(base_price * rng.uniform(0.85, 1.15, len(product)), 2)
+    weekly = 1 + 0.2 * np.sin(2 * np.pi * pd.DatetimeIndex(date).dayofweek / 7)
+    quantity = np.maximum(base_quantity * weekly * (base_price / price) ** 1.5 + rng.normal(0, 5, len(product)), 0)
+    
+    return pd.DataFrame({
+        'product': [f"SKU{p:06d}" for p in product],
+        'date': date,
+        'price': price,
+        'quantity': np.round(quantity)
+    })
+
+def prepare_features(df):
+    """Календарные признаки, как в forecast_sales."""
+    df = df.copy()
+    df['year'] = df['date'].dt.year
+    df['month'] = df['date'].dt.month
+    df['day'] = df['date'].dt.day
+    df['day_of_week'] = df['date'].dt.dayofweek
+    df['week_of_year'] = df['date'].dt.isocalendar().week
+    
+    return df
+
+def legacy_predictions(model, last_date, last_price, forecast_periods):
+    """Прежний расчет: одна строка DataFrame и один вызов predict на период и сценарий."""
+    predictions = np.empty((forecast_periods, len(PRICE_SCENARIOS)))
+    
+    for i in range(1, forecast_periods + 1):
+        date = last_date + pd.Timedelta(days=i)
+        for j, multiplier in enumerate(PRICE_SCENARIOS.values()):
+            features_dict = {
+                'year': date.year,
+                'month': date.month,
+                'day': date.day,
+                'day_of_week': pd.Timestamp(year=date.year, month=date.month, day=date.day).dayofweek,
+                'week_of_year': pd.Timestamp(year=date.year, month=date.month, day=date.day).isocalendar()[1],
+                'price': last_price * multiplier
+            }
+            predictions[i - 1, j] = model.predict(pd.DataFrame([features_dict]))[0]
+    
+    return predictions
+
+def run_benchmark(n_products, days, forecast_periods, n_jobs=1):
+    """Запуск сравнения и вывод результатов."""
+    df = prepare_features(generate_sales(n_products, days))
+    print(f"Продуктов: {n_products}, дней истории: {days}, периодов прогноза: {forecast_periods}")
+    
+    group = df[df['product'] == df['product'].iloc[0]]
+    last_date = group['date'].max()
+    last_price = group['price'].iloc[-1]
+    
+    # Модель обучается тем же способом, что и в train_forecast_model
+    features = ['year', 'month', 'day', 'day_of_week', 'week_of_year', 'price']
+    model = RandomForestRegressor(n_estimators=100, random_state=42).fit(group[features], group['quantity'])
+    
+    start = time.perf_counter()
+    legacy = legacy_predictions(model, last_date, last_price, forecast_periods)
+    legacy_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    forecast, _, _, _, _ = train_forecast_model(group, 'price', 'quantity', forecast_periods)
+    product_time = time.perf_counter() - start
+    
+    # Тот же прогноз пакетным вызовом обученной выше модели
+    start = time.perf_counter()
+    dates = pd.date_range(last_date + pd.Timedelta(days=1), periods=forecast_periods, freq='D')
+    batch = pd.DataFrame({
+        'year': np.repeat(dates.year, len(PRICE_SCENARIOS)),
+        'month': np.repeat(dates.month, len(PRICE_SCENARIOS)),
+        'day': np.repeat(dates.day, len(PRICE_SCENARIOS)),
+        'day_of_week': np.repeat(dates.dayofweek, len(PRICE_SCENARIOS)),
+        'week_of_year': np.repeat(dates.isocalendar().week.to_numpy(), len(PRICE_SCENARIOS)),
+        'price': np.tile(last_price * np.array(list(PRICE_SCENARIOS.values())), forecast_periods)
+    })
+    batched = model.predict(batch).reshape(forecast_periods, len(PRICE_SCENARIOS))
+    batch_time = time.perf_counter() - start
+    
+    max_diff = np.max(np.abs(legacy - batched))
+    print(f"Прогноз по одной строке ({forecast_periods * len(PRICE_SCENARIOS)} вызовов): {legacy_time:.3f} с")
+    print(f"Пакетный прогноз (1 вызов):        {batch_time:.3f} с")
+    print(f"Ускорение прогноза:                {legacy_time / batch_time:.1f}x")
+    print(f"Макс. расхождение прогнозов:       {max_diff:.2e}")
+    print(f"Обучение и прогноз одного продукта: {product_time:.3f} с "
+          f"(первая дата прогноза {forecast[0]['date']})")
+    
+    if max_diff > 1e-9:
+        raise SystemExit("Пакетный прогноз расходится с построчным")
+    
+    start = time.perf_counter()
+    forecast_sales(df, {'forecast_periods': forecast_periods})
+    total_time = time.perf_counter() - start
+    print(f"forecast_sales: {total_time:.3f} с, {total_time / n_products * 1000:.0f} мс на продукт")
+    
+    # Обучение моделей продуктов в пуле процессов
+    if n_jobs != 1:
+        start = time.perf_counter()
+        forecast_sales(df, {'forecast_periods': forecast_periods, 'n_jobs': n_jobs})
+        parallel_time = time.perf_counter() - start
+        print(f"forecast_sales (n_jobs={n_jobs}): {parallel_time:.3f} с, ускорение {total_time / parallel_time:.1f}x")
+    
+    # Одна модель на весь каталог вместо модели на каждый продукт
+    start = time.perf_counter()
+    forecast_sales(df, {'forecast_periods': forecast_periods, 'forecast_mode': 'global'})
+    global_time = time.perf_counter() - start
+    print(f"forecast_sales (глобальная модель): {global_time:.3f} с, "
+          f"{global_time / n_products * 1000:.0f} мс на продукт")
+    
+    # Квантили P10/P50/P90 по прогнозам деревьев глобального леса
+    start = time.perf_counter()
+    forecast_sales(df, {'forecast_periods': forecast_periods, 'forecast_mode': 'global', 'quantiles': True})
+    quantile_time = time.perf_counter() - start
+    print(f"forecast_sales (глобальная модель с квантилями): {quantile_time:.3f} с")
+    
+    # Более дешевые движки и автоматический выбор движка по длине ряда
+    for engine in ('hist_gradient_boosting', 'ridge', 'exponential_smoothing', 'auto'):
+        start = time.perf_counter()
+        result = forecast_sales(df, {'forecast_periods': forecast_periods, 'engine': engine})
+        engine_time = time.perf_counter() - start
+        print(f"forecast_sales (engine={engine}): {engine_time:.3f} с, "
+              f"точность {result['forecast_accuracy']:.2f}%, движки {result['forecast_engines']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=20)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--periods', type=int, default=30)
+    parser.add_argument('--jobs', type=int, default=-1)
+    args = parser.parse_args()
+    
+    run_benchmark(args.products, args.days, args.periods, args.jobs)
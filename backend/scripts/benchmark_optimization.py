@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Скрипт для сравнения скорости оптимизации цен.
+
+Сравнивает прежний расчет (SLSQP для каждого продукта) с векторным
+аналитическим решением для линейной модели спроса и проверяет совпадение цен.
+Дополнительно измеряет время совместной оптимизации каталога с ограничениями
+и выбора цен из лестницы допустимых ценовых точек.
+"""
+
+import sys
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+# Добавляем директорию проекта в путь для импорта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.analytics.optimization import optimize_prices
+
+def generate_sales(n_products, rows_per_product, seed=42):
+    """Генерация синтетических данных о продажах с линейным спросом."""
+    rng = np.random.default_rng(seed)
+    
+    product = np.repeat(np.arange(n_products), rows_per_product)
+    base_price = rng.uniform(100, 5000, n_products)[product]
+    base_quantity = rng.uniform(50, 500, n_products)[product]
+    slope = rng.uniform(1, 3, n_products)[product] * base_quantity / base_price
+    
+    price = np.round(base_price * rng.uniform(0.8, 1.2, len(product)), 2)
+    quantity = base_quantity - slope * (price - base_price) + rng.normal(0, 5, len(product))
+    
+    return pd.DataFrame({
+        'product': [f"SKU{p:06d}" for p in product],
+        'price': price,
+        'quantity': quantity,
+        'cost': np.round(base_price * 0.6, 2)
+    })
+
+def legacy_optimal_price(group):
+    """Прежний расчет: линейная модель и SLSQP для одного продукта."""
+    current_price_avg = group['price'].mean()
+    current_quantity_avg = group['quantity'].mean()
+    
+    if group['price'].nunique() <= 1:
+        return current_price_avg
+    
+    cost = group['cost'].mean()
+    A = np.vstack([group['price'].values, np.ones(len(group))]).T
+    b, a = np.linalg.lstsq(A, group['quantity'].values, rcond=None)[0]
+    
+    def profit_function(price):
+        quantity = a + b * price[0]
+        if quantity < 0:
+            return 0
+        return -1 * (price[0] - cost) * quantity
+    
+    constraints = ({'type': 'ineq', 'fun': lambda x: x[0]})
+    result = minimize(profit_function, [current_price_avg], constraints=constraints, method='SLSQP')
+    
+    if a + b * result.x[0] < 0:
+        return current_price_avg
+    
+    return result.x[0]
+
+def run_benchmark(n_products, rows_per_product):
+    """Запуск сравнения и вывод результатов."""
+    df = generate_sales(n_products, rows_per_product)
+    params = {'cost_column': 'cost'}
+    print(f"Продуктов: {n_products}, строк: {len(df)}")
+    
+    start = time.perf_counter()
+    legacy = {product: legacy_optimal_price(group) for product, group in df.groupby('product')}
+    legacy_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    vectorized = optimize_prices(df, params)['optimal_prices']
+    vectorized_time = time.perf_counter() - start
+    
+    products = list(legacy.keys())
+    legacy_prices = np.array([legacy[p] for p in products])
+    vectorized_prices = np.array([vectorized[p] for p in products])
+    max_diff = np.max(np.abs(legacy_prices - vectorized_prices) / legacy_prices)
+    
+    print(f"SLSQP по продуктам:  {legacy_time:.3f} с")
+    print(f"Векторный расчет:    {vectorized_time:.3f} с")
+    print(f"Ускорение:           {legacy_time / vectorized_time:.1f}x")
+    print(f"Макс. отн. расхождение цен: {max_diff:.2e}")
+    
+    # SLSQP останавливается с допуском по прибыли, поэтому цены совпадают приближенно
+    if max_diff > 1e-3:
+        raise SystemExit("Результаты расходятся с прежним расчетом")
+    
+    # Совместная оптимизация: коридор цен, средняя цена корзины и порядок цен пар продуктов
+    current_price = df.groupby('product')['price'].mean().sort_values()
+    ordered = current_price.index.tolist()
+    portfolio_params = {
+        'cost_column': 'cost',
+        'optimization_mode': 'portfolio',
+        'max_price_change': 15,
+        'max_average_price_change': 3,
+        'price_ordering': [[ordered[i + 1], ordered[i]] for i in range(0, len(ordered) - 1, 2)]
+    }
+    
+    start = time.perf_counter()
+    portfolio = optimize_prices(df, portfolio_params)
+    portfolio_time = time.perf_counter() - start
+    
+    print(f"Совместная оптимизация ({len(portfolio_params['price_ordering'])} ограничений порядка): "
+          f"{portfolio_time:.3f} с, прирост прибыли {portfolio['expected_profit_increase']:.2f}%")
+    
+    # Дискретная оптимизация: 50 цен с окончаниями .99 и .49 на продукт
+    discrete_params = {'cost_column': 'cost', 'optimization_mode': 'discrete', 'price_endings': [0.99, 0.49]}
+    
+    start = time.perf_counter()
+    discrete = optimize_prices(df, discrete_params)
+    discrete_time = time.perf_counter() - start
+    
+    print(f"Лестница цен (50 точек): {discrete_time:.3f} с, прирост прибыли {discrete['expected_profit_increase']:.2f}%")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--rows', type=int, default=30)
+    args = parser.parse_args()
+    
+    run_benchmark(args.products, args.rows)
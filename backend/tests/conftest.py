@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# Добавляем директорию проекта в путь для импорта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Тестовая база в памяти (читается конфигурацией при импорте)
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+@pytest.fixture
+def app():
+    """Приложение с пустой базой данных."""
+    from app import create_app
+    from app.extensions import db
+    
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def client(app, tmp_path):
+    """Клиент API с пользователем компании и файловым источником данных."""
+    from flask_jwt_extended import create_access_token
+    from app.extensions import db
+    from app.models.data_source import DataSource
+    from app.models.user import Company, User
+    
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    company = Company(name='Компания')
+    db.session.add(company)
+    db.session.flush()
+    
+    user = User(email='user@example.com', password_hash='-', company_id=company.id)
+    source = DataSource(name='sales', source_type='file', file_path='sales.csv', company_id=company.id)
+    db.session.add_all([user, source])
+    db.session.commit()
+    pd.DataFrame({
+        'product': [1, 1, 1, 2, 2, 2],
+        'price': [100, 110, 120, 50, 55, 60],
+        'quantity': [30, 27, 22, 80, 71, 66]
+    }).to_csv(tmp_path / 'sales.csv', index=False)
+    
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {create_access_token(identity=user.id)}'
+    client.data_source_id = source.id
+    
+    return client
+
+@pytest.mark.parametrize('payload', [
+    {'scenarios': [[100, 110]]},
+    {'scenarios': {'prices': [[100, 110]]}, 'parameters': ['price']},
+    {'scenarios': {'products': 1, 'prices': [[100, 110]]}},
+    {'scenarios': {'products': [1], 'prices': {'a': 100}}},
+    {'scenarios': {'products': [1, 2], 'price_changes': [[5], [5, 10]]}}
+])
+def test_scenarios_reject_malformed_payload(client, payload):
+    """Сценарии неверной структуры отклоняются с кодом 400, а не падают с 500."""
+    response = client.post('/api/analysis/scenarios', json=dict(payload, data_source_id=client.data_source_id))
+    
+    assert response.status_code == 400
+    assert response.get_json()['message']
+
+def test_scenarios_evaluated(client):
+    """Корректные сценарии оцениваются."""
+    response = client.post('/api/analysis/scenarios', json={
+        'data_source_id': client.data_source_id,
+        'scenarios': {'products': [1, 2], 'price_changes': [[0, 5], [0, -5]]}
+    })
+    
+    assert response.status_code == 200
+    assert response.get_json()['results']['scenario_count'] == 2
@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.analytics.elasticity import calculate_elasticity
+
+def make_sales(n_products=4, days=60, seed=0):
+    """Продажи с постоянной эластичностью, разной у продуктов."""
+    rng = np.random.default_rng(seed)
+    product = np.repeat(np.arange(1, n_products + 1), days)
+    price = np.round(rng.uniform(50, 150, len(product)), 2)
+    elasticity = rng.uniform(-2.5, -0.3, n_products)[product - 1]
+    quantity = np.round(100 * (price / 100) ** elasticity * rng.uniform(0.9, 1.1, len(product)), 3)
+    
+    return pd.DataFrame({
+        'product': product,
+        'date': np.tile(pd.date_range('2024-01-01', periods=days, freq='D'), n_products).astype(str),
+        'price': price,
+        'quantity': quantity
+    })
+
+def assert_same_result(expected, actual):
+    """Совпадение результатов анализа с точностью до порядка суммирования."""
+    assert expected.keys() == actual.keys()
+    for key in expected:
+        if key in ('elasticity_by_product', 'average_elasticity'):
+            assert actual[key] == pytest.approx(expected[key], rel=1e-9)
+        elif key in ('elasticity_by_month', 'elasticity_by_week'):
+            assert expected[key].keys() == actual[key].keys()
+            for period in expected[key]:
+                assert actual[key][period]['elasticities'] == pytest.approx(expected[key][period]['elasticities'])
+        elif key != 'elasticity_grid':
+            assert actual[key] == expected[key]
+
+@pytest.fixture
+def data_source(app, tmp_path):
+    """Файловый источник данных в базе."""
+    from app.extensions import db
+    from app.models.data_source import DataSource
+    
+    source = DataSource(name='sales', source_type='file', file_path=str(tmp_path / 'sales.csv'))
+    db.session.add(source)
+    db.session.commit()
+    
+    return source
+
+def write_sales(data_source, df):
+    """Запись файла источника и числа строк, как при загрузке данных."""
+    df.to_csv(data_source.file_path, index=False)
+    data_source.row_count = len(df)
+
+@pytest.mark.parametrize('dirty', [False, True])
+def test_incremental_after_append_matches_full(data_source, dirty):
+    """Пересчет по накопленной статистике после добавления строк совпадает с полным расчетом."""
+    from app.api.analysis.utils import calculate_incremental_elasticity
+    
+    df = make_sales()
+    if dirty:
+        # Пропущенное количество в добавленной части
+        df.loc[200, 'quantity'] = np.nan
+    
+    write_sales(data_source, df.iloc[:150])
+    calculate_incremental_elasticity(data_source, data_source.file_path, chunk_size=40)
+    write_sales(data_source, df)
+    full_df = pd.read_csv(data_source.file_path)
+    
+    if dirty:
+        with pytest.raises(ValueError):
+            calculate_elasticity(full_df)
+        with pytest.raises(ValueError):
+            calculate_incremental_elasticity(data_source, data_source.file_path, chunk_size=40)
+    else:
+        assert_same_result(
+            calculate_elasticity(full_df),
+            calculate_incremental_elasticity(data_source, data_source.file_path, chunk_size=40)
+        )
+
+def test_incremental_after_append_with_multiline_labels(data_source):
+    """Названия продуктов с переносом строки в кавычках не сдвигают позицию дописанных строк."""
+    from app.api.analysis.utils import calculate_incremental_elasticity
+    
+    df = make_sales()
+    df['product'] = 'товар\n' + df['product'].astype(str)
+    
+    write_sales(data_source, df.iloc[:150])
+    calculate_incremental_elasticity(data_source, data_source.file_path, chunk_size=40)
+    write_sales(data_source, df)
+    
+    assert_same_result(
+        calculate_elasticity(pd.read_csv(data_source.file_path)),
+        calculate_incremental_elasticity(data_source, data_source.file_path, chunk_size=40)
+    )
+
+def test_incremental_after_last_line_extended(data_source):
+    """Дописанная последняя строка без перевода строки пересчитывается, а не пропускается."""
+    from app.api.analysis.utils import calculate_incremental_elasticity
+    
+    df = make_sales()
+    text = df.to_csv(index=False)
+    cut = text.rindex(',') + 2
+    
+    # Файл обрывается на середине количества последней строки, затем дописывается
+    with open(data_source.file_path, 'w') as file:
+        file.write(text[:cut])
+    calculate_incremental_elasticity(data_source, data_source.file_path, chunk_size=40)
+    write_sales(data_source, df)
+    
+    assert_same_result(
+        calculate_elasticity(df),
+        calculate_incremental_elasticity(data_source, data_source.file_path, chunk_size=40)
+    )
+
+@pytest.mark.parametrize('appended_date', ['2024-01-01', '2024-02-01'])
+def test_incremental_periods_follow_all_dates(data_source, appended_date):
+    """Анализ по месяцам появляется, только когда во всем файле больше одной даты."""
+    from app.api.analysis.utils import calculate_incremental_elasticity
+    
+    df = make_sales().assign(date='2024-01-01')
+    df.loc[150:, 'date'] = appended_date
+    
+    write_sales(data_source, df.iloc[:150])
+    calculate_incremental_elasticity(data_source, data_source.file_path, chunk_size=40)
+    write_sales(data_source, df)
+    
+    expected = calculate_elasticity(pd.read_csv(data_source.file_path))
+    actual = calculate_incremental_elasticity(data_source, data_source.file_path, chunk_size=40)
+    
+    assert ('elasticity_by_month' in actual) == (appended_date != '2024-01-01')
+    assert_same_result(expected, actual)
+
+def read_chunks(df, chunk_size=45):
+    """Части датафрейма, как при потоковом чтении CSV."""
+    return (df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size))
+
+@pytest.mark.parametrize('column, value', [
+    (None, None), ('quantity', np.nan), ('price', np.nan), ('quantity', 0), ('price', 0), ('quantity', -1), ('price', -5)
+])
+def test_chunked_matches_full(column, value):
+    """Потоковый расчет по частям дает тот же результат или ту же ошибку, что и расчет по всем строкам."""
+    from app.analytics.elasticity import calculate_elasticity_chunked
+    
+    df = make_sales()
+    if column is not None:
+        df.loc[100, column] = value
+    
+    try:
+        expected = calculate_elasticity(df)
+    except ValueError as error:
+        with pytest.raises(ValueError, match=str(error)):
+            calculate_elasticity_chunked(read_chunks(df))
+    else:
+        assert_same_result(expected, calculate_elasticity_chunked(read_chunks(df)))
+
+def test_matches_polyfit_per_group():
+    """Эластичности по продуктам и месяцам совпадают с np.polyfit в логарифмах по каждой группе."""
+    df = make_sales(days=75)
+    result = calculate_elasticity(df)
+    
+    month = pd.to_datetime(df['date']).dt.to_period('M').astype(str)
+    assert sorted(result['elasticity_by_month']) == sorted(month.unique())
+    for product, rows in df.groupby('product'):
+        slope = np.polyfit(np.log(rows['price']), np.log(rows['quantity']), 1)[0]
+        assert result['elasticity_by_product'][product] == pytest.approx(slope, rel=1e-9)
+    
+    for (period, product), rows in df.groupby([month, 'product']):
+        slope = np.polyfit(np.log(rows['price']), np.log(rows['quantity']), 1)[0]
+        assert result['elasticity_by_month'][period]['elasticities'][product] == pytest.approx(slope, rel=1e-9)
@@ -0,0 +1,73 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.analytics.forecasting import forecast_sales
+
+def make_sales(days, seed=0):
+    """Ежедневные продажи одного продукта с недельной сезонностью."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2023-01-01', periods=days, freq='D')
+    price = np.round(100 * rng.uniform(0.9, 1.1, days), 2)
+    quantity = np.round(50 + 10 * np.sin(2 * np.pi * dates.dayofweek / 7) + 100 / price * 20 + rng.normal(0, 2, days))
+    
+    return pd.DataFrame({'date': dates, 'price': price, 'quantity': quantity})
+
+def prediction_values(result):
+    """Прогнозы всех периодов и сценариев цены одним массивом."""
+    return np.array([list(period['predictions'].values()) for period in result['forecast']])
+
+@pytest.mark.parametrize('engine', ['random_forest', 'hist_gradient_boosting'])
+def test_incremental_update_after_appended_rows(tmp_path, engine):
+    """Прогноз с incremental после добавления строк в данные продукта."""
+    sales = make_sales(120)
+    params = {'forecast_periods': 7, 'engine': engine, 'incremental': True}
+    
+    forecast_sales(sales.iloc[:100], params, model_dir=str(tmp_path))
+    updated = forecast_sales(sales.iloc[:105], params, model_dir=str(tmp_path))
+    
+    assert len(updated['forecast']) == 7
+    assert updated['forecast'][0]['date'] == str((sales['date'].iloc[104] + pd.Timedelta(days=1)).date())
+    
+    fresh = forecast_sales(sales.iloc[:105], dict(params, incremental=False))
+    if engine == 'hist_gradient_boosting':
+        # Бустинг не дообучается, а обучается заново на всех строках
+        assert updated['forecast'] == fresh['forecast']
+    else:
+        # Лес дополняется деревьями для 5 новых строк из 100, прежние деревья не меняются
+        saved = [joblib.load(path) for path in tmp_path.glob('*.joblib')]
+        forests = [item[0] for item in saved if isinstance(item, tuple)]
+        original, grown = sorted(forests, key=lambda forest: forest.n_estimators)
+        assert original.n_estimators == 100
+        assert grown.n_estimators == len(grown.estimators_) == 105
+        for before, after in zip(original.estimators_, grown.estimators_):
+            assert np.array_equal(before.tree_.threshold, after.tree_.threshold)
+            assert np.array_equal(before.tree_.value, after.tree_.value)
+        
+        # Дообученный лес прогнозирует близко к лесу, обученному заново на всех строках
+        # (расхождение того же порядка, что у лесов с разными случайными выборками)
+        assert prediction_values(updated) == pytest.approx(prediction_values(fresh), rel=0.1)
+        assert prediction_values(updated).mean() == pytest.approx(prediction_values(fresh).mean(), rel=0.02)
+    
+    # Обновленная модель сохраняется в реестре и загружается при тех же данных
+    assert forecast_sales(sales.iloc[:105], params, model_dir=str(tmp_path))['forecast'] == updated['forecast']
+
+@pytest.mark.parametrize('engine', ['random_forest', 'auto'])
+def test_parallel_matches_sequential(monkeypatch, engine):
+    """Обучение в нескольких процессах дает тот же результат, что и последовательное."""
+    sales = pd.concat(
+        [make_sales(days, seed=seed).assign(product=f'p{seed}') for seed, days in enumerate([20, 60, 90, 120, 150])],
+        ignore_index=True
+    ).sample(frac=1, random_state=0)
+    params = {'forecast_periods': 7, 'engine': engine}
+    
+    sequential = forecast_sales(sales, dict(params, n_jobs=1))
+    
+    # Пул процессов используется и на машине с одним ядром
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    parallel = forecast_sales(sales, dict(params, n_jobs=3))
+    
+    assert parallel == sequential
@@ -0,0 +1,45 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from app.analytics.markdown import solve_markdown_dp
+
+def brute_force_revenue(prices, period_demand, stock, salvage_value, horizon):
+    """Лучшая выручка продукта перебором всех невозрастающих по цене путей уровней."""
+    best = -np.inf
+    for path in itertools.combinations_with_replacement(range(len(prices)), horizon):
+        remaining, revenue = stock, 0.0
+        for level in path:
+            sold = min(period_demand[level], remaining)
+            revenue += prices[level] * sold
+            remaining -= sold
+        best = max(best, revenue + salvage_value * remaining)
+    
+    return best
+
+@pytest.mark.parametrize('seed', range(3))
+def test_markdown_dp_matches_brute_force(seed):
+    """DP по остатку и уровню цены находит оптимум полного перебора путей уценки."""
+    rng = np.random.default_rng(seed)
+    n_products, n_levels, horizon = 5, 4, 5
+    
+    # Целые спрос и остаток с шагом сетки 1: все достижимые остатки лежат в узлах
+    stock = np.full(n_products, float(rng.integers(10, 30)))
+    prices = np.sort(rng.uniform(20, 100, (n_products, n_levels)), axis=1)[:, ::-1]
+    period_demand = np.sort(rng.integers(1, 12, (n_products, n_levels)), axis=1).astype(float)
+    salvage_value = rng.uniform(0, 15, n_products)
+    
+    level_path, sales_path, current_stock, total_revenue = solve_markdown_dp(
+        prices, period_demand, stock, salvage_value, horizon, stock_grid_size=int(stock[0]) + 1
+    )
+    
+    for i in range(n_products):
+        expected = brute_force_revenue(prices[i], period_demand[i], stock[i], salvage_value[i], horizon)
+        assert total_revenue[i] == pytest.approx(expected, rel=1e-12)
+    
+    # Путь уценки не возвращается к более высокой цене и дает заявленную выручку
+    assert np.all(np.diff(level_path, axis=1) >= 0)
+    path_revenue = (np.take_along_axis(prices, level_path, axis=1) * sales_path).sum(axis=1)
+    assert total_revenue == pytest.approx(path_revenue + salvage_value * current_stock)
+    assert current_stock == pytest.approx(stock - sales_path.sum(axis=1))
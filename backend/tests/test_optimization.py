@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import minimize
+
+from app.analytics.optimization import CONSTRAINT_TOLERANCE, optimal_linear_prices, optimize_portfolio_prices
+
+def make_demand(n_products=6, seed=0):
+    """Линейные модели спроса с убывающим спросом и оптимумом выше текущей цены."""
+    rng = np.random.default_rng(seed)
+    current_price = np.round(rng.uniform(50, 150, n_products), 2)
+    b = -rng.uniform(0.5, 2, n_products)
+    current_quantity = rng.uniform(50, 150, n_products)
+    a = current_quantity - b * current_price
+    
+    return pd.Index([f'p{i}' for i in range(n_products)]), {
+        'a': a,
+        'b': b,
+        'cost': current_price * rng.uniform(0.3, 0.6, n_products),
+        'current_price': current_price,
+        'current_quantity': current_quantity,
+        'min_price': current_price * 0.8,
+        'max_price': current_price * 1.2,
+        'valid': np.ones(n_products, dtype=bool)
+    }
+
+def make_params(demand):
+    """Все виды ограничений, активные при независимых ценах."""
+    return {
+        'max_average_price_change': 5,
+        'max_price_change': 15,
+        'price_bounds': {'p0': [None, demand['current_price'][0] * 1.02], 'p1': [demand['current_price'][1] * 1.1, None]},
+        # Пара с более дешевым первым продуктом, чтобы ограничение было активным
+        'price_ordering': [['p3', 'p2'] if demand['current_price'][3] < demand['current_price'][2] else ['p2', 'p3']]
+    }
+
+def assert_feasible(products, demand, prices, params, tolerance=1e-6):
+    """Проверка коридора, границ, индекса корзины и порядка цен."""
+    current_price = demand['current_price']
+    change = params['max_price_change'] / 100
+    assert np.all(prices >= current_price * (1 - change) * (1 - tolerance))
+    assert np.all(prices <= current_price * (1 + change) * (1 + tolerance))
+    
+    for product, (min_price, max_price) in params['price_bounds'].items():
+        i = products.get_loc(product)
+        if min_price is not None:
+            assert prices[i] >= min_price * (1 - tolerance)
+        if max_price is not None:
+            assert prices[i] <= max_price * (1 + tolerance)
+    
+    basket = np.sum(demand['current_quantity'] * prices) / np.sum(demand['current_quantity'] * current_price)
+    assert abs(basket - 1) <= params['max_average_price_change'] / 100 + tolerance
+    
+    for higher, lower in params['price_ordering']:
+        assert prices[products.get_loc(higher)] >= prices[products.get_loc(lower)] * (1 - tolerance)
+
+def test_portfolio_constraints_satisfied():
+    """Совместная оптимизация соблюдает все ограничения, которые нарушают независимые цены."""
+    products, demand = make_demand()
+    params = make_params(demand)
+    independent, _ = optimal_linear_prices(demand)
+    
+    basket = np.sum(demand['current_quantity'] * independent) / np.sum(demand['current_quantity'] * demand['current_price'])
+    assert basket - 1 > params['max_average_price_change'] / 100
+    
+    prices, quantities = optimize_portfolio_prices(products, demand, independent, params)
+    
+    assert_feasible(products, demand, prices, params, tolerance=CONSTRAINT_TOLERANCE)
+    assert quantities == pytest.approx(np.maximum(demand['a'] + demand['b'] * prices, 0))
+
+def test_portfolio_matches_slsqp():
+    """Решение совпадает с SLSQP на малой задаче с теми же ограничениями."""
+    products, demand = make_demand()
+    params = make_params(demand)
+    independent, _ = optimal_linear_prices(demand)
+    a, b, cost = demand['a'], demand['b'], demand['cost']
+    current_price, current_quantity = demand['current_price'], demand['current_quantity']
+    
+    prices, _ = optimize_portfolio_prices(products, demand, independent, params)
+    
+    change = params['max_price_change'] / 100
+    lower, upper = current_price * (1 - change), current_price * (1 + change)
+    upper[0] = min(upper[0], params['price_bounds']['p0'][1])
+    lower[1] = max(lower[1], params['price_bounds']['p1'][0])
+    
+    # SLSQP решает ту же задачу в относительных ценах с нормированной прибылью
+    weights = current_quantity * current_price / np.sum(current_quantity * current_price)
+    basket_change = params['max_average_price_change'] / 100
+    higher, cheaper = (products.get_loc(product) for product in params['price_ordering'][0])
+    constraints = [
+        {'type': 'ineq', 'fun': lambda x: 1 + basket_change - weights @ x},
+        {'type': 'ineq', 'fun': lambda x: weights @ x - (1 - basket_change)},
+        {'type': 'ineq', 'fun': lambda x: x[higher] * current_price[higher] - x[cheaper] * current_price[cheaper]}
+    ]
+    profit_scale = np.sum(current_price * current_quantity)
+    
+    def negative_profit(x):
+        p = x * current_price
+        return -np.sum((p - cost) * (a + b * p)) / profit_scale
+    
+    reference = minimize(
+        negative_profit, np.ones(len(products)), method='SLSQP',
+        bounds=list(zip(lower / current_price, upper / current_price)), constraints=constraints,
+        options={'ftol': 1e-14, 'maxiter': 500}
+    )
+    
+    assert reference.success
+    assert prices == pytest.approx(reference.x * current_price, rel=1e-5)
+
+@pytest.mark.parametrize('constraint', ['ordering', 'basket', 'bounds'])
+def test_portfolio_infeasible_raises(constraint):
+    """Несовместимые ограничения дают ValueError."""
+    products, demand = make_demand()
+    independent, _ = optimal_linear_prices(demand)
+    current_price = demand['current_price']
+    
+    if constraint == 'ordering':
+        # p0 не может быть дороже p1, если его верхняя граница ниже нижней границы p1
+        params = {
+            'price_bounds': {'p0': [None, current_price[1] * 0.9], 'p1': [current_price[1], None]},
+            'price_ordering': [['p0', 'p1']]
+        }
+    elif constraint == 'basket':
+        # Все цены не ниже +10%, а корзина не дороже +5%
+        params = {
+            'price_bounds': {product: [price * 1.1, None] for product, price in zip(products, current_price)},
+            'max_average_price_change': 5
+        }
+    else:
+        params = {'max_price_change': 5, 'price_bounds': {'p0': [current_price[0] * 1.1, None]}}
+    
+    with pytest.raises(ValueError):
+        optimize_portfolio_prices(products, demand, independent, params)